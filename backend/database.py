@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Boolean, Text, ForeignKey, Enum
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, DateTime, Float, Boolean, Text, LargeBinary, ForeignKey, Enum, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -105,6 +105,47 @@ class PricingHistory(Base):
     
     # Relationships
     flight = relationship("Flight", back_populates="pricing_history")
+    
+    __table_args__ = (
+        Index("ix_pricing_history_flight_class_time", "flight_id", "seat_class", "calculated_at"),
+    )
+
+class PricingHistoryRollup(Base):
+    __tablename__ = "pricing_history_rollups"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    flight_id = Column(Integer, ForeignKey("flights.id"), nullable=False)
+    seat_class = Column(Enum(SeatClass), nullable=False)
+    resolution = Column(String(5), nullable=False)  # "hour" or "day"
+    bucket_start = Column(DateTime, nullable=False)
+    samples = Column(Integer, nullable=False)
+    open_price = Column(Float, nullable=False)
+    high_price = Column(Float, nullable=False)
+    low_price = Column(Float, nullable=False)
+    close_price = Column(Float, nullable=False)
+    avg_price = Column(Float, nullable=False)
+    avg_demand_factor = Column(Float, nullable=False)
+    avg_time_factor = Column(Float, nullable=False)
+    avg_seat_availability_factor = Column(Float, nullable=False)
+    
+    __table_args__ = (
+        UniqueConstraint("flight_id", "seat_class", "resolution", "bucket_start", name="uq_pricing_history_rollup_bucket"),
+    )
+
+class DemandCurve(Base):
+    __tablename__ = "demand_curves"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    departure_airport_id = Column(Integer, ForeignKey("airports.id"), nullable=False)
+    arrival_airport_id = Column(Integer, ForeignKey("airports.id"), nullable=False)
+    days_until_departure = Column(Integer, nullable=False)  # First day of the bucket
+    demand_factor = Column(Float, nullable=False)
+    bookings = Column(Integer, nullable=False)
+    fitted_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("departure_airport_id", "arrival_airport_id", "days_until_departure", name="uq_demand_curve_bucket"),
+    )
 
 class Booking(Base):
     __tablename__ = "bookings"
@@ -137,6 +178,54 @@ class SeatInventory(Base):
     booked_seats = Column(Integer, default=0)
     last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class FareBucket(Base):
+    __tablename__ = "fare_buckets"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    flight_id = Column(Integer, ForeignKey("flights.id"), nullable=False)
+    seat_class = Column(Enum(SeatClass), nullable=False)
+    code = Column(String(2), nullable=False)
+    position = Column(Integer, nullable=False)  # 0 is the cheapest bucket, sold first
+    seats = Column(Integer, nullable=False)  # Seats sold in this bucket before the next one opens
+    fare_multiplier = Column(Float, nullable=False)
+    
+    __table_args__ = (
+        UniqueConstraint("flight_id", "seat_class", "code", name="uq_fare_bucket_code"),
+    )
+
+class SeatMap(Base):
+    __tablename__ = "seat_maps"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    flight_id = Column(Integer, ForeignKey("flights.id"), nullable=False)
+    seat_class = Column(Enum(SeatClass), nullable=False)
+    total_seats = Column(Integer, nullable=False)
+    occupied = Column(LargeBinary, nullable=False)  # One bit per seat in seat order, set when assigned
+    version = Column(BigInteger, nullable=False)  # Random token replaced on every write, for compare-and-set
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("flight_id", "seat_class", name="uq_seat_map_cabin"),
+    )
+
+class BookingSequence(Base):
+    __tablename__ = "booking_sequences"
+    
+    name = Column(String(30), primary_key=True)
+    next_value = Column(BigInteger, nullable=False)  # First value of the next block handed out
+
+class InstanceSecret(Base):
+    __tablename__ = "instance_secrets"
+    
+    name = Column(String(30), primary_key=True)
+    value = Column(String(64), nullable=False)  # Random hex key material, written once and shared by every process
+
+class PriceTokenClaim(Base):
+    __tablename__ = "price_token_claims"
+    
+    digest = Column(String(32), primary_key=True)  # Hex digest of a price token already used for a booking
+    expires_at = Column(BigInteger, nullable=False, index=True)  # Unix time the token expires; purged after
+
 class Coupon(Base):
     __tablename__ = "coupons"
     
@@ -10,6 +10,11 @@ from database import engine, Base
 from routers import flights, bookings, pricing, admin, coupons, payments
 from services.pricing_engine import PricingEngine
 from services.booking_service import BookingService
+from services.pricing_history_buffer import pricing_history_buffer
+from services.fare_snapshot import fare_snapshot
+from services.pricing_metrics import ServerTimingMiddleware
+from services.pricing_clock import PricingClockMiddleware
+from services.idempotency import IdempotencyMiddleware
 
 load_dotenv()
 
@@ -17,9 +22,14 @@ load_dotenv()
 async def lifespan(app: FastAPI):
     # Startup
     Base.metadata.create_all(bind=engine)
+    pricing_history_buffer.start()
+    fare_snapshot.start()
+    pricing.revenue_simulator.start()
     yield
     # Shutdown
-    pass
+    pricing.revenue_simulator.stop()
+    fare_snapshot.stop()
+    pricing_history_buffer.drain()
 
 app = FastAPI(
     title="Flight Booking Simulator API",
@@ -28,6 +38,10 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Retried booking and payment POSTs with the same Idempotency-Key get the stored response;
+# added before CORS so its 409/422 responses and replays still carry the CORS headers
+app.add_middleware(IdempotencyMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -37,6 +51,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Server-Timing header with pricing stage durations
+app.add_middleware(ServerTimingMiddleware)
+
+# Every price in a request is computed at the same pricing-clock instant
+app.add_middleware(PricingClockMiddleware)
+
 # Include routers
 app.include_router(flights.router, prefix="/api/flights", tags=["flights"])
 app.include_router(bookings.router, prefix="/api/bookings", tags=["bookings"])
@@ -1,7 +1,8 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
 from typing import Optional, List
 from enum import Enum
+from config import PRICING_SIMULATION_MAX_RUNS, PRICING_SIMULATION_MAX_HORIZON_DAYS
 
 # Enums
 class FlightStatus(str, Enum):
@@ -24,6 +25,10 @@ class SeatClass(str, Enum):
     BUSINESS = "business"
     FIRST = "first"
 
+class SeatPreference(str, Enum):
+    WINDOW = "window"
+    AISLE = "aisle"
+
 # Base models
 class AirportBase(BaseModel):
     code: str
@@ -103,7 +108,20 @@ class BookingBase(BaseModel):
     seat_number: Optional[str] = None
 
 class BookingCreate(BookingBase):
-    pass
+    price_token: Optional[str] = None
+    seat_preference: Optional[SeatPreference] = None
+
+class GroupPassenger(BaseModel):
+    passenger_name: str
+    passenger_email: str
+    passenger_phone: str
+    seat_number: Optional[str] = None
+
+class GroupBookingCreate(BaseModel):
+    flight_id: int
+    seat_class: SeatClass
+    passengers: List[GroupPassenger]
+    price_token: Optional[str] = None
 
 class BookingUpdate(BaseModel):
     status: Optional[BookingStatus] = None
@@ -136,6 +154,32 @@ class PricingResponse(BaseModel):
     time_factor: float
     seat_availability_factor: float
     total_price: float
+    priced_at: Optional[datetime] = None
+    age_seconds: Optional[float] = None
+    passengers: int = 1
+    seat_prices: Optional[List[float]] = None
+    fare_basis: Optional[str] = None
+    price_token: Optional[str] = None
+
+class PricingBatchItem(BaseModel):
+    flight_id: int
+    seat_class: SeatClass
+
+class PricingBatchRequest(BaseModel):
+    items: List[PricingBatchItem]
+
+class PricingBatchResponse(BaseModel):
+    prices: List[PricingResponse]
+
+class SimulationRequest(BaseModel):
+    flight_id: int
+    seat_class: SeatClass
+    runs: int = Field(2000, ge=1, le=PRICING_SIMULATION_MAX_RUNS)
+    horizon_days: Optional[int] = Field(None, ge=1, le=PRICING_SIMULATION_MAX_HORIZON_DAYS)
+    expected_requests: Optional[float] = Field(None, ge=0)
+    conversion_rate: float = Field(0.5, ge=0, le=1)
+    price_elasticity: float = Field(1.2, ge=0)
+    seed: Optional[int] = None
 
 class SeatInventoryBase(BaseModel):
     flight_id: int
@@ -154,8 +198,22 @@ class SeatInventory(SeatInventoryBase):
     class Config:
         from_attributes = True
 
+# Upper bound on fare buckets per cabin
+MAX_FARE_BUCKETS = 26
+
+class FareBucketDefinition(BaseModel):
+    code: str = Field(..., min_length=1, max_length=2, pattern="^[A-Za-z0-9]+$")  # Matches the fare_buckets.code column
+    seats: int = Field(..., ge=0)
+    fare_multiplier: float = Field(..., gt=0)
+
+class FareBucketUpdate(BaseModel):
+    buckets: List[FareBucketDefinition] = Field(..., max_length=MAX_FARE_BUCKETS)
+
+class FlightSearchResult(Flight):
+    pricing: Optional[PricingResponse] = None
+
 class SearchResponse(BaseModel):
-    flights: List[Flight]
+    flights: List[FlightSearchResult]
     total_count: int
     page: int
     page_size: int
@@ -173,6 +231,13 @@ class BookingConfirmation(BaseModel):
     booking_date: datetime
     status: BookingStatus
 
+class GroupBookingConfirmation(BaseModel):
+    flight_id: int
+    seat_class: SeatClass
+    passengers: int
+    total_price: float
+    bookings: List[BookingConfirmation]
+
 # Coupon Models
 class CouponBase(BaseModel):
     code: str
@@ -2,8 +2,11 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 from datetime import datetime
-from database import get_db, Flight, Airport, Airline, SeatInventory
-from models import FlightCreate, AirportCreate, AirlineCreate, SeatInventoryCreate
+from database import get_db, Flight, Airport, Airline, SeatInventory, FareBucket, SeatClass as DBSeatClass
+from models import FlightCreate, AirportCreate, AirlineCreate, SeatInventoryCreate, FareBucketUpdate, SeatClass
+from services.pricing_engine import notify_inventory_change
+from services.fare_buckets import fare_bucket_store
+from services.idempotency import idempotency_store
 
 router = APIRouter()
 
@@ -54,11 +57,51 @@ async def create_seat_inventory(inventory_data: SeatInventoryCreate, db: Session
         db.add(inventory)
         db.commit()
         db.refresh(inventory)
+        notify_inventory_change(inventory.flight_id, inventory.seat_class)
         return {"message": "Seat inventory created successfully", "inventory_id": inventory.id}
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to create seat inventory: {str(e)}")
 
+@router.put("/flights/{flight_id}/fare-buckets/{seat_class}", response_model=dict)
+async def set_fare_buckets(flight_id: int, seat_class: SeatClass, bucket_data: FareBucketUpdate,
+                           db: Session = Depends(get_db)):
+    """Replace the nested fare buckets of a cabin, cheapest first (admin endpoint)"""
+    buckets = bucket_data.buckets
+    if not buckets:
+        raise HTTPException(status_code=400, detail="At least one fare bucket is required")
+    if len({bucket.code for bucket in buckets}) != len(buckets):
+        raise HTTPException(status_code=400, detail="Fare bucket codes must be unique")
+    if any(later.fare_multiplier < earlier.fare_multiplier for earlier, later in zip(buckets, buckets[1:])):
+        raise HTTPException(status_code=400, detail="Fare buckets must be ordered from cheapest to most expensive")
+    
+    flight = db.query(Flight).filter(Flight.id == flight_id).first()
+    if not flight:
+        raise HTTPException(status_code=404, detail="Flight not found")
+    
+    try:
+        db_seat_class = DBSeatClass(seat_class.value)
+        db.query(FareBucket).filter(
+            FareBucket.flight_id == flight_id,
+            FareBucket.seat_class == db_seat_class
+        ).delete(synchronize_session=False)
+        for position, bucket in enumerate(buckets):
+            db.add(FareBucket(
+                flight_id=flight_id,
+                seat_class=db_seat_class,
+                code=bucket.code,
+                position=position,
+                seats=bucket.seats,
+                fare_multiplier=bucket.fare_multiplier
+            ))
+        db.commit()
+        fare_bucket_store.invalidate(flight_id)
+        notify_inventory_change(flight_id, seat_class)
+        return {"message": "Fare buckets updated successfully", "buckets": len(buckets)}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to update fare buckets: {str(e)}")
+
 @router.get("/dashboard/stats")
 async def get_dashboard_stats(db: Session = Depends(get_db)):
     """Get dashboard statistics (admin endpoint)"""
@@ -74,7 +117,8 @@ async def get_dashboard_stats(db: Session = Depends(get_db)):
         "total_bookings": total_bookings,
         "confirmed_bookings": confirmed_bookings,
         "cancelled_bookings": cancelled_bookings,
-        "booking_success_rate": (confirmed_bookings / total_bookings * 100) if total_bookings > 0 else 0
+        "booking_success_rate": (confirmed_bookings / total_bookings * 100) if total_bookings > 0 else 0,
+        "idempotency": idempotency_store.stats()
     }
 
 @router.get("/flights/{flight_id}/inventory")
@@ -2,14 +2,15 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 from config_sqlite import get_db
-from models import BookingCreate, BookingConfirmation, Booking as BookingModel
+from models import BookingCreate, BookingConfirmation, GroupBookingCreate, GroupBookingConfirmation, Booking as BookingModel
 from services.booking_service import BookingService
 
 router = APIRouter()
 booking_service = BookingService()
 
+# Booking writes may back off and retry with time.sleep, so they run in the threadpool as plain def routes
 @router.post("/", response_model=BookingConfirmation)
-async def create_booking(booking_data: BookingCreate, db: Session = Depends(get_db)):
+def create_booking(booking_data: BookingCreate, db: Session = Depends(get_db)):
     """Create a new flight booking"""
     try:
         confirmation = booking_service.create_booking(booking_data, db)
@@ -19,6 +20,16 @@ async def create_booking(booking_data: BookingCreate, db: Session = Depends(get_
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Booking failed: {str(e)}")
 
+@router.post("/group", response_model=GroupBookingConfirmation)
+def create_group_booking(group_data: GroupBookingCreate, db: Session = Depends(get_db)):
+    """Book up to 9 passengers on one flight in a single all-or-nothing transaction"""
+    try:
+        return booking_service.create_group_booking(group_data, db)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Group booking failed: {str(e)}")
+
 @router.get("/pnr/{pnr}", response_model=BookingConfirmation)
 async def get_booking_by_pnr(pnr: str, db: Session = Depends(get_db)):
     """Get booking details by PNR"""
@@ -28,7 +39,7 @@ async def get_booking_by_pnr(pnr: str, db: Session = Depends(get_db)):
     return confirmation
 
 @router.delete("/pnr/{pnr}")
-async def cancel_booking(pnr: str, db: Session = Depends(get_db)):
+def cancel_booking(pnr: str, db: Session = Depends(get_db)):
     """Cancel a booking by PNR"""
     success = booking_service.cancel_booking(pnr, db)
     if not success:
@@ -2,12 +2,14 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, timedelta
-from config_sqlite import get_db, Flight, Airport, Airline
-from models import FlightSearch, SearchResponse, Flight as FlightModel
-from services.pricing_engine import PricingEngine
+from config_sqlite import get_db, Flight, Airport, Airline, FlightStatus
+from models import FlightSearch, SearchResponse, SeatClass, Flight as FlightModel, FlightSearchResult
+from services.pricing_engine import PricingEngine, coerce_seat_class
+from services.fare_snapshot import fare_snapshot
+from services.seat_maps import seat_map_store
 
 router = APIRouter()
-pricing_engine = PricingEngine()
+pricing_engine = PricingEngine(fare_snapshot=fare_snapshot)
 
 @router.get("/search", response_model=SearchResponse)
 async def search_flights(
@@ -19,10 +21,15 @@ async def search_flights(
     seat_class: Optional[str] = Query(None, description="Seat class filter"),
     page: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(10, ge=1, le=50, description="Page size"),
+    include_prices: bool = Query(False, description="Embed current prices for seat_class (default economy)"),
     db: Session = Depends(get_db)
 ):
     """Search for flights between airports"""
     try:
+        # Validate seat class
+        if seat_class:
+            seat_class = SeatClass(seat_class)
+        
         # Parse dates
         dep_date = datetime.strptime(departure_date, "%Y-%m-%d")
         ret_date = None
@@ -44,7 +51,7 @@ async def search_flights(
             Flight.arrival_airport_id == arr_airport.id,
             Flight.departure_time >= dep_date,
             Flight.departure_time < dep_date + timedelta(days=1),
-            Flight.status.in_(["scheduled", "on_time"])
+            Flight.status.in_([FlightStatus.SCHEDULED, FlightStatus.ON_TIME])
         )
         
         # Apply seat class filter if provided
@@ -59,10 +66,17 @@ async def search_flights(
         offset = (page - 1) * page_size
         flights = query.offset(offset).limit(page_size).all()
         
+        # Price the whole page in one batch when requested
+        quotes = [None] * len(flights)
+        if include_prices and flights:
+            pricing_class = seat_class or SeatClass.ECONOMY
+            quotes = pricing_engine.quote_prices([(flight, pricing_class) for flight in flights], db)
+        
         # Convert to response models
         flight_models = []
-        for flight in flights:
-            flight_model = FlightModel.from_orm(flight)
+        for flight, pricing in zip(flights, quotes):
+            flight_model = FlightSearchResult.from_orm(flight)
+            flight_model.pricing = pricing
             flight_models.append(flight_model)
         
         return SearchResponse(
@@ -86,6 +100,19 @@ async def get_flight(flight_id: int, db: Session = Depends(get_db)):
     
     return FlightModel.from_orm(flight)
 
+@router.get("/{flight_id}/seat-map/{seat_class}")
+async def get_seat_map(flight_id: int, seat_class: str, db: Session = Depends(get_db)):
+    """Seat map of a cabin: occupied seats plus window and aisle flags"""
+    try:
+        seat_class_enum = coerce_seat_class(seat_class)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid seat class")
+    
+    seat_map = seat_map_store.describe(flight_id, seat_class_enum, db)
+    if seat_map is None:
+        raise HTTPException(status_code=404, detail="No seat inventory for this flight and class")
+    return seat_map
+
 @router.get("/")
 async def get_all_flights(
     page: int = Query(1, ge=1, description="Page number"),
@@ -1,12 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
-from config_sqlite import get_db, Flight
-from models import PricingRequest, PricingResponse
-from services.pricing_engine import PricingEngine
+from typing import Optional
+from datetime import datetime
+from config_sqlite import get_db, Flight, Airport
+from models import PricingRequest, PricingResponse, PricingBatchRequest, PricingBatchResponse, SimulationRequest
+from services.pricing_engine import PricingEngine, TREND_RESOLUTIONS, MAX_GROUP_PASSENGERS
+from services.fare_snapshot import fare_snapshot
+from services.pricing_metrics import pricing_metrics
+from services.quote_cache import quote_cache
+from services.pricing_history_buffer import pricing_history_buffer
+from services.fare_calendar import fare_calendar
+from services.revenue_simulator import RevenueSimulator, DemandArrivalModel
+from config import PRICING_CALENDAR_MAX_DAYS
 
 router = APIRouter()
-pricing_engine = PricingEngine()
+pricing_engine = PricingEngine(fare_snapshot=fare_snapshot)
+revenue_simulator = RevenueSimulator(pricing_engine)
+
+# Upper bound on (flight, seat class) pairs priced by one batch request
+MAX_BATCH_ITEMS = 100
 
 @router.post("/calculate", response_model=PricingResponse)
 async def calculate_price(pricing_request: PricingRequest, db: Session = Depends(get_db)):
@@ -15,12 +27,41 @@ async def calculate_price(pricing_request: PricingRequest, db: Session = Depends
     if not flight:
         raise HTTPException(status_code=404, detail="Flight not found")
     
+    if not 1 <= pricing_request.passengers <= MAX_GROUP_PASSENGERS:
+        raise HTTPException(status_code=400, detail=f"passengers must be between 1 and {MAX_GROUP_PASSENGERS}")
+    
     try:
-        pricing = pricing_engine.calculate_dynamic_price(flight, pricing_request.seat_class, db)
+        if pricing_request.passengers > 1:
+            return pricing_engine.group_price(flight, pricing_request.seat_class, pricing_request.passengers, db)
+        pricing = pricing_engine.quote_price(flight, pricing_request.seat_class, db)
         return pricing
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Price calculation failed: {str(e)}")
 
+@router.post("/batch", response_model=PricingBatchResponse)
+async def calculate_batch_prices(batch_request: PricingBatchRequest, db: Session = Depends(get_db)):
+    """Price many (flight, seat class) pairs with shared database reads"""
+    items = batch_request.items
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can price at most {MAX_BATCH_ITEMS} items")
+    if not items:
+        return PricingBatchResponse(prices=[])
+    
+    # Load every requested flight in one query
+    flight_ids = {item.flight_id for item in items}
+    flights = {flight.id: flight for flight in db.query(Flight).filter(Flight.id.in_(flight_ids)).all()}
+    missing = sorted(flight_ids - flights.keys())
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Flights not found: {missing}")
+    
+    try:
+        prices = pricing_engine.quote_prices([(flights[item.flight_id], item.seat_class) for item in items], db)
+        return PricingBatchResponse(prices=prices)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch price calculation failed: {str(e)}")
+
 @router.get("/flight/{flight_id}/class/{seat_class}", response_model=PricingResponse)
 async def get_current_price(
     flight_id: int, 
@@ -40,16 +81,38 @@ async def get_current_price(
         raise HTTPException(status_code=404, detail="Flight not found")
     
     try:
-        pricing = pricing_engine.calculate_dynamic_price(flight, seat_class_enum, db)
+        pricing = pricing_engine.quote_price(flight, seat_class_enum, db)
         return pricing
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Price calculation failed: {str(e)}")
 
+@router.get("/buckets/{flight_id}/{seat_class}")
+async def get_fare_buckets(flight_id: int, seat_class: str, db: Session = Depends(get_db)):
+    """Nested fare buckets of a cabin with the currently open bucket"""
+    from models import SeatClass
+    
+    try:
+        seat_class_enum = SeatClass(seat_class)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid seat class")
+    
+    flight = db.query(Flight).filter(Flight.id == flight_id).first()
+    if not flight:
+        raise HTTPException(status_code=404, detail="Flight not found")
+    
+    try:
+        return pricing_engine.describe_fare_buckets(flight, seat_class_enum, db)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get fare buckets: {str(e)}")
+
 @router.get("/trend/{flight_id}/{seat_class}")
 async def get_price_trend(
     flight_id: int,
     seat_class: str,
     days: int = 7,
+    resolution: str = Query("raw", description="raw, hour or day"),
     db: Session = Depends(get_db)
 ):
     """Get price trend for a flight over time"""
@@ -60,30 +123,112 @@ async def get_price_trend(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid seat class")
     
+    if resolution not in TREND_RESOLUTIONS and resolution != "raw":
+        raise HTTPException(status_code=400, detail="Invalid resolution")
+    
     flight = db.query(Flight).filter(Flight.id == flight_id).first()
     if not flight:
         raise HTTPException(status_code=404, detail="Flight not found")
     
     try:
-        trend = pricing_engine.get_price_trend(flight_id, seat_class_enum, db, days)
-        return {"flight_id": flight_id, "seat_class": seat_class, "trend": trend}
+        trend = pricing_engine.get_price_trend(flight_id, seat_class_enum, db, days, resolution)
+        return {"flight_id": flight_id, "seat_class": seat_class, "resolution": resolution, "trend": trend}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get price trend: {str(e)}")
 
+@router.get("/calendar")
+async def get_fare_calendar(
+    departure_airport: str = Query(..., description="Departure airport code"),
+    arrival_airport: str = Query(..., description="Arrival airport code"),
+    start_date: Optional[str] = Query(None, description="First day (YYYY-MM-DD), defaults to today"),
+    days: int = Query(30, ge=1, le=PRICING_CALENDAR_MAX_DAYS, description="Number of days"),
+    seat_class: str = Query("economy", description="Seat class"),
+    db: Session = Depends(get_db)
+):
+    """Cheapest fare per day for a route over a date window"""
+    from models import SeatClass
+    
+    try:
+        seat_class_enum = SeatClass(seat_class)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid seat class")
+    
+    try:
+        first_day = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else pricing_engine.clock.now().date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid start_date format. Use YYYY-MM-DD")
+    
+    dep_airport = db.query(Airport).filter(Airport.code == departure_airport.upper()).first()
+    arr_airport = db.query(Airport).filter(Airport.code == arrival_airport.upper()).first()
+    if not dep_airport:
+        raise HTTPException(status_code=404, detail=f"Departure airport {departure_airport} not found")
+    if not arr_airport:
+        raise HTTPException(status_code=404, detail=f"Arrival airport {arrival_airport} not found")
+    
+    try:
+        calendar = fare_calendar.get_calendar(dep_airport.id, arr_airport.id, seat_class_enum, first_day, days, db)
+        return {"departure_airport": dep_airport.code, "arrival_airport": arr_airport.code, **calendar}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to build fare calendar: {str(e)}")
+
+@router.post("/simulate")
+async def simulate_revenue(simulation_request: SimulationRequest, db: Session = Depends(get_db)):
+    """Monte Carlo simulation of expected revenue and load factor up to departure"""
+    flight = db.query(Flight).filter(Flight.id == simulation_request.flight_id).first()
+    if not flight:
+        raise HTTPException(status_code=404, detail="Flight not found")
+    
+    demand_model = DemandArrivalModel(
+        expected_requests=simulation_request.expected_requests,
+        conversion_rate=simulation_request.conversion_rate,
+        price_elasticity=simulation_request.price_elasticity
+    )
+    
+    try:
+        # Runs fan out over the shared worker pool without blocking the event loop
+        return await revenue_simulator.simulate_async(
+            flight,
+            simulation_request.seat_class,
+            demand_model,
+            db,
+            runs=simulation_request.runs,
+            horizon_days=simulation_request.horizon_days,
+            seed=simulation_request.seed
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Simulation failed: {str(e)}")
+
+@router.get("/snapshot/stats")
+async def get_snapshot_stats():
+    """Size and freshness of the background-refreshed fare snapshot"""
+    return fare_snapshot.stats()
+
+@router.get("/metrics")
+async def get_pricing_metrics():
+    """Per-stage latency histograms and counters of the pricing path"""
+    metrics = pricing_metrics.snapshot()
+    metrics["quote_cache"] = {"size": len(quote_cache), "hits": quote_cache.hits, "misses": quote_cache.misses}
+    metrics["history_buffer"] = {
+        "pending": pricing_history_buffer.pending(),
+        "written": pricing_history_buffer.written,
+        "dropped": pricing_history_buffer.dropped,
+        "failed": pricing_history_buffer.failed
+    }
+    return metrics
+
 @router.get("/compare/{flight_id}")
 async def compare_prices(flight_id: int, db: Session = Depends(get_db)):
     """Compare prices across all seat classes for a flight"""
-    from models import SeatClass
-    
     flight = db.query(Flight).filter(Flight.id == flight_id).first()
     if not flight:
         raise HTTPException(status_code=404, detail="Flight not found")
     
     try:
-        prices = {}
-        for seat_class in SeatClass:
-            pricing = pricing_engine.calculate_dynamic_price(flight, seat_class, db)
-            prices[seat_class.value] = {
+        quotes = pricing_engine.quote_all_classes(flight, db)
+        prices = {
+            seat_class.value: {
                 "base_price": pricing.base_price,
                 "current_price": pricing.current_price,
                 "total_price": pricing.total_price,
@@ -91,6 +236,8 @@ async def compare_prices(flight_id: int, db: Session = Depends(get_db)):
                 "time_factor": pricing.time_factor,
                 "seat_availability_factor": pricing.seat_availability_factor
             }
+            for seat_class, pricing in quotes.items()
+        }
         
         return {
             "flight_id": flight_id,
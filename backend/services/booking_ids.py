@@ -0,0 +1,156 @@
+import hashlib
+import secrets
+import string
+import threading
+from typing import Optional, Tuple
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from config_sqlite import SessionLocal, BookingSequence, InstanceSecret
+from services.transactions import run_in_transaction
+from config import SECRET_KEY, DEFAULT_SECRET_KEY, BOOKING_SEQUENCE_BLOCK_SIZE
+
+ALPHABET = string.digits + string.ascii_uppercase
+
+PNR_LENGTH = 6
+BOOKING_REFERENCE_LENGTH = 10
+
+def encode_base36(value: int, width: int) -> str:
+    """Fixed-width base-36 encoding using digits and uppercase letters"""
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, 36)
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+class FeistelPermutation:
+    """Keyed bijection on [0, domain): a balanced Feistel network over the next even bit width, with cycle walking"""
+    
+    def __init__(self, key: bytes, domain: int, rounds: int = 4):
+        self.key = hashlib.sha256(key).digest()
+        self.domain = domain
+        self.rounds = rounds
+        bits = max(domain - 1, 1).bit_length()
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+    
+    def _round(self, round_index: int, value: int) -> int:
+        data = bytes([round_index]) + value.to_bytes(8, "big")
+        return int.from_bytes(hashlib.blake2b(data, key=self.key, digest_size=8).digest(), "big") & self.half_mask
+    
+    def _permute_block(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.half_mask
+        for round_index in range(self.rounds):
+            left, right = right, left ^ self._round(round_index, right)
+        return (left << self.half_bits) | right
+    
+    def permute(self, value: int) -> int:
+        """Image of value; distinct inputs always give distinct outputs inside the domain"""
+        if not 0 <= value < self.domain:
+            raise ValueError("Value outside the permutation domain")
+        # The network permutes a power-of-two range, so walk the cycle until we land back inside the domain
+        value = self._permute_block(value)
+        while value >= self.domain:
+            value = self._permute_block(value)
+        return value
+
+def load_instance_secret(name: str, session_factory=SessionLocal) -> str:
+    """Random key material stored once in the database, so every process derives the same keys from it"""
+    db = session_factory()
+    try:
+        value = db.query(InstanceSecret.value).filter(InstanceSecret.name == name).scalar()
+        if value is None:
+            db.add(InstanceSecret(name=name, value=secrets.token_hex(32)))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another process stored it first; use theirs
+                db.rollback()
+            value = db.query(InstanceSecret.value).filter(InstanceSecret.name == name).scalar()
+        return value
+    finally:
+        db.close()
+
+class SequenceBlockAllocator:
+    """Hands out unique sequence values, reserving them from the database one block at a time"""
+    
+    def __init__(self, name: str, block_size: int = BOOKING_SEQUENCE_BLOCK_SIZE, session_factory=SessionLocal):
+        self.name = name
+        self.block_size = block_size
+        self.session_factory = session_factory
+        self._next: Optional[int] = None
+        self._end: Optional[int] = None
+        self._lock = threading.Lock()
+    
+    def _reserve_block(self) -> int:
+        """Claim the next block with one atomic increment, committed on its own session"""
+        # Never part of the booking transaction: a rollback there must not hand the same block out twice
+        db = self.session_factory()
+        try:
+            def claim() -> int:
+                claimed = db.execute(
+                    update(BookingSequence)
+                    .where(BookingSequence.name == self.name)
+                    .values(next_value=BookingSequence.next_value + self.block_size)
+                ).rowcount == 1
+                if not claimed:
+                    try:
+                        with db.begin_nested():
+                            db.add(BookingSequence(name=self.name, next_value=self.block_size))
+                        return 0
+                    except IntegrityError:
+                        # Another process created the sequence first; claim from it instead
+                        return claim()
+                return db.query(BookingSequence.next_value).filter(BookingSequence.name == self.name).scalar() - self.block_size
+            return run_in_transaction(db, claim)
+        finally:
+            db.close()
+    
+    def next(self) -> int:
+        with self._lock:
+            if self._next is None or self._next >= self._end:
+                self._next = self._reserve_block()
+                self._end = self._next + self.block_size
+            value = self._next
+            self._next += 1
+        return value
+
+class BookingIdGenerator:
+    """Collision-free PNRs and booking references: one sequence value per booking, permuted under a secret key"""
+    
+    def __init__(self, allocator: Optional[SequenceBlockAllocator] = None, secret: str = SECRET_KEY,
+                 session_factory=SessionLocal):
+        self.allocator = allocator or SequenceBlockAllocator("booking")
+        # Sequence values are public knowledge (blocks start at 0), so the placeholder key would make every
+        # identifier predictable; without a real secret the key comes from random material kept in the database
+        self._secret = secret if secret and secret != DEFAULT_SECRET_KEY else None
+        self.session_factory = session_factory
+        self._permutations: Optional[Tuple[FeistelPermutation, FeistelPermutation]] = None
+        self._lock = threading.Lock()
+    
+    def permutations(self) -> Tuple[FeistelPermutation, FeistelPermutation]:
+        """PNR and booking reference permutations, keyed on first use"""
+        if self._permutations is None:
+            with self._lock:
+                if self._permutations is None:
+                    secret = self._secret or load_instance_secret("booking_ids", self.session_factory)
+                    # Separate keys, so a PNR says nothing about its booking reference
+                    self._permutations = (
+                        FeistelPermutation(f"pnr:{secret}".encode(), 36 ** PNR_LENGTH),
+                        FeistelPermutation(f"booking-reference:{secret}".encode(), 36 ** BOOKING_REFERENCE_LENGTH)
+                    )
+        return self._permutations
+    
+    def identifiers(self, sequence_value: int) -> Tuple[str, str]:
+        """PNR and booking reference of a sequence value"""
+        pnr_permutation, reference_permutation = self.permutations()
+        return (
+            encode_base36(pnr_permutation.permute(sequence_value), PNR_LENGTH),
+            encode_base36(reference_permutation.permute(sequence_value), BOOKING_REFERENCE_LENGTH)
+        )
+    
+    def next_identifiers(self) -> Tuple[str, str]:
+        """PNR and booking reference for a new booking, without looking at the bookings table"""
+        return self.identifiers(self.allocator.next())
+
+# Shared generator, so every booking service in the process draws from the same reserved block
+booking_id_generator = BookingIdGenerator()
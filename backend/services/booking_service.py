@@ -1,51 +1,71 @@
-import string
-import random
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from config_sqlite import Booking, Flight, SeatInventory, BookingStatus
-from models import BookingCreate, BookingConfirmation
-from services.pricing_engine import PricingEngine
+from config_sqlite import Booking, Flight, SeatInventory, SeatClass, BookingStatus
+from models import BookingCreate, BookingConfirmation, GroupBookingCreate, GroupBookingConfirmation
+from services.pricing_engine import PricingEngine, MAX_GROUP_PASSENGERS, coerce_seat_class, notify_inventory_change
+from services.price_tokens import PriceTokenError, price_token_signer
+from services.transactions import run_in_transaction
+from services.seat_maps import seat_map_store
+from services.booking_ids import booking_id_generator
 
 class BookingService:
     def __init__(self):
         self.pricing_engine = PricingEngine()
+        self.price_tokens = price_token_signer
+        self.seat_maps = seat_map_store
+        self.booking_ids = booking_id_generator
     
-    def generate_pnr(self) -> str:
-        """Generate a unique 6-character PNR"""
-        return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    def generate_identifiers(self) -> Tuple[str, str]:
+        """Generate a unique 6-character PNR and 10-character booking reference"""
+        return self.booking_ids.next_identifiers()
     
-    def generate_booking_reference(self) -> str:
-        """Generate a unique booking reference"""
-        return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+    @staticmethod
+    def is_identifier_conflict(error: IntegrityError) -> bool:
+        """Whether a unique violation is on the PNR or booking reference rather than e.g. a seat"""
+        message = str(error.orig).lower()
+        return "pnr" in message or "booking_reference" in message
     
-    def assign_seat_number(self, flight_id: int, seat_class: str, db: Session) -> Optional[str]:
-        """Assign a seat number based on availability and class"""
-        # This is a simplified seat assignment
-        # In a real system, you'd have a more complex seat map
-        seat_inventory = db.query(SeatInventory).filter(
+    def assign_seat_number(self, flight_id: int, seat_class: str, db: Session, preference: Optional[str] = None,
+                           requested: Optional[str] = None) -> Optional[str]:
+        """Assign a free seat from the cabin's seat map, within the caller's transaction"""
+        seat_numbers = self.seat_maps.allocate(
+            flight_id,
+            coerce_seat_class(seat_class),
+            1,
+            db,
+            preference=preference,
+            seat_numbers=[requested] if requested else None
+        )
+        return seat_numbers[0] if seat_numbers else None
+    
+    def check_fare_basis(self, held_price: Dict, flight_id: int, seat_class: SeatClass, passengers: int,
+                         available_seats: int, total_seats: int, db: Session):
+        """Reject a price hold once its seats would no longer sell from the fare buckets it was quoted in"""
+        fare_basis = self.pricing_engine.fare_basis(flight_id, seat_class, available_seats, total_seats, passengers, db)
+        if fare_basis != held_price["fare_basis"]:
+            raise PriceTokenError("The quoted fare is no longer available, please refresh the price")
+    
+    def check_reserved_fare_basis(self, held_price: Dict, flight_id: int, seat_class: SeatClass, passengers: int,
+                                  db: Session):
+        """check_fare_basis for the seats this transaction just reserved, against the inventory it updated"""
+        available_seats, total_seats = db.query(SeatInventory.available_seats, SeatInventory.total_seats).filter(
             SeatInventory.flight_id == flight_id,
             SeatInventory.seat_class == seat_class
-        ).first()
-        
-        if not seat_inventory or seat_inventory.available_seats <= 0:
-            return None
-        
-        # Generate seat number based on class
-        if seat_class == "economy":
-            seat_number = f"{random.randint(1, 30)}{random.choice(['A', 'B', 'C', 'D', 'E', 'F'])}"
-        elif seat_class == "premium_economy":
-            seat_number = f"{random.randint(1, 20)}{random.choice(['A', 'B', 'C', 'D'])}"
-        elif seat_class == "business":
-            seat_number = f"{random.randint(1, 10)}{random.choice(['A', 'B', 'C', 'D'])}"
-        else:  # first
-            seat_number = f"{random.randint(1, 5)}{random.choice(['A', 'B'])}"
-        
-        return seat_number
+        ).one()
+        self.check_fare_basis(held_price, flight_id, seat_class, passengers, available_seats + passengers, total_seats, db)
     
     def create_booking(self, booking_data: BookingCreate, db: Session) -> BookingConfirmation:
         """Create a new booking with concurrency control"""
+        seat_class = coerce_seat_class(booking_data.seat_class)
+        
+        # A quoted price hold is verified locally and charged as quoted
+        held_price = None
+        if booking_data.price_token:
+            held_price = self.price_tokens.verify(booking_data.price_token, booking_data.flight_id, seat_class)
+        
         # Check if flight exists and is available
         flight = db.query(Flight).filter(Flight.id == booking_data.flight_id).first()
         if not flight:
@@ -54,83 +74,203 @@ class BookingService:
         if flight.status.value in ["cancelled", "departed", "arrived"]:
             raise ValueError("Flight is not available for booking")
         
-        # Check seat availability
+        # Cheap early rejection of sold-out cabins; the conditional decrement below is what guarantees it
         seat_inventory = db.query(SeatInventory).filter(
             SeatInventory.flight_id == booking_data.flight_id,
-            SeatInventory.seat_class == booking_data.seat_class
+            SeatInventory.seat_class == seat_class
         ).first()
         
         if not seat_inventory or seat_inventory.available_seats <= 0:
             raise ValueError("No seats available for the selected class")
         
-        # Calculate current price
-        pricing = self.pricing_engine.calculate_dynamic_price(flight, booking_data.seat_class, db)
-        
-        # Generate unique identifiers
-        pnr = self.generate_pnr()
-        booking_reference = self.generate_booking_reference()
-        
-        # Ensure PNR is unique
-        while db.query(Booking).filter(Booking.pnr == pnr).first():
-            pnr = self.generate_pnr()
-        
-        # Ensure booking reference is unique
-        while db.query(Booking).filter(Booking.booking_reference == booking_reference).first():
-            booking_reference = self.generate_booking_reference()
-        
-        # Assign seat number
-        seat_number = self.assign_seat_number(booking_data.flight_id, booking_data.seat_class.value, db)
-        
-        # Create booking
-        booking = Booking(
-            pnr=pnr,
-            flight_id=booking_data.flight_id,
-            passenger_name=booking_data.passenger_name,
-            passenger_email=booking_data.passenger_email,
-            passenger_phone=booking_data.passenger_phone,
-            seat_class=booking_data.seat_class,
-            seat_number=seat_number,
-            price_paid=pricing.total_price,
-            status=BookingStatus.CONFIRMED,
-            booking_reference=booking_reference
-        )
+        if held_price is not None:
+            # A hold is only good while its fare bucket is open
+            self.check_fare_basis(held_price, booking_data.flight_id, seat_class, 1, seat_inventory.available_seats,
+                                  seat_inventory.total_seats, db)
+            price_paid = held_price["total_price"]
+        else:
+            # Without a hold the seat is priced on the sell path, which always records history
+            price_paid = self.pricing_engine.sell_price(flight, seat_class, db).total_price
         
-        try:
-            db.add(booking)
-            db.flush()  # Flush to get the booking ID
+        # Unique by construction; the unique indexes remain the only check. Drawn before the transaction,
+        # since claiming a new block writes on its own session
+        pnr, booking_reference = self.generate_identifiers()
+        
+        def reserve_and_book() -> Booking:
+            # A hold books once: its claim commits with the booking and rolls back with it
+            if held_price is not None:
+                self.price_tokens.claim(booking_data.price_token, held_price["expires_at"], db)
             
-            # Update seat inventory atomically
-            self.pricing_engine.update_seat_inventory(
-                booking_data.flight_id, 
-                booking_data.seat_class, 
-                1, 
-                db
+            # Assign seat number, honouring a requested seat or window/aisle preference
+            seat_number = self.assign_seat_number(
+                booking_data.flight_id,
+                seat_class.value,
+                db,
+                preference=booking_data.seat_preference.value if booking_data.seat_preference else None,
+                requested=booking_data.seat_number
             )
             
-            # Update flight available seats
-            flight.available_seats -= 1
-            flight.updated_at = datetime.utcnow()
+            # Conditional decrement: a sold-out cabin rolls the whole booking back
+            if not self.pricing_engine.reserve_seats(booking_data.flight_id, seat_class, 1, db):
+                raise ValueError("No seats available for the selected class")
             
-            db.commit()
+            # Concurrent bookings may have moved the bucket since the check above; the seat taken must match the hold
+            if held_price is not None:
+                self.check_reserved_fare_basis(held_price, booking_data.flight_id, seat_class, 1, db)
             
-            # Return booking confirmation
-            return BookingConfirmation(
-                pnr=booking.pnr,
-                booking_reference=booking.booking_reference,
-                passenger_name=booking.passenger_name,
-                passenger_email=booking.passenger_email,
-                passenger_phone=booking.passenger_phone,
-                flight_details=flight,
-                seat_class=booking.seat_class,
-                seat_number=booking.seat_number,
-                price_paid=booking.price_paid,
-                booking_date=booking.created_at,
-                status=booking.status
+            # Create booking
+            booking = Booking(
+                pnr=pnr,
+                flight_id=booking_data.flight_id,
+                passenger_name=booking_data.passenger_name,
+                passenger_email=booking_data.passenger_email,
+                passenger_phone=booking_data.passenger_phone,
+                seat_class=seat_class,
+                seat_number=seat_number,
+                price_paid=price_paid,
+                status=BookingStatus.CONFIRMED,
+                booking_reference=booking_reference
             )
+            db.add(booking)
+            db.flush()  # Flush to get the booking ID
+            return booking
+        
+        for attempt in range(2):
+            try:
+                # Seat decrement and booking commit together, retried on lock conflicts
+                booking = run_in_transaction(db, reserve_and_book)
+                break
+            except IntegrityError as e:
+                if attempt or not self.is_identifier_conflict(e):
+                    raise ValueError("Booking failed due to concurrency conflict. Please try again.")
+                # A random PNR issued before sequence identifiers can match a new one; the next value will not
+                pnr, booking_reference = self.generate_identifiers()
+        notify_inventory_change(booking_data.flight_id, seat_class)
+        
+        # Return booking confirmation
+        return BookingConfirmation(
+            pnr=booking.pnr,
+            booking_reference=booking.booking_reference,
+            passenger_name=booking.passenger_name,
+            passenger_email=booking.passenger_email,
+            passenger_phone=booking.passenger_phone,
+            flight_details=flight,
+            seat_class=booking.seat_class,
+            seat_number=booking.seat_number,
+            price_paid=booking.price_paid,
+            booking_date=booking.created_at,
+            status=booking.status
+        )
+    
+    def create_group_booking(self, group_data: GroupBookingCreate, db: Session) -> GroupBookingConfirmation:
+        """Book a party in one all-or-nothing transaction: one price, adjacent seats, one decrement, one insert"""
+        seat_class = coerce_seat_class(group_data.seat_class)
+        party_size = len(group_data.passengers)
+        if not 1 <= party_size <= MAX_GROUP_PASSENGERS:
+            raise ValueError(f"A group booking needs between 1 and {MAX_GROUP_PASSENGERS} passengers")
+        
+        # A group hold covers the whole party; it carries the total, which is split across the seats
+        held_price = None
+        if group_data.price_token:
+            held_price = self.price_tokens.verify(group_data.price_token, group_data.flight_id, seat_class, party_size)
+        
+        flight = db.query(Flight).filter(Flight.id == group_data.flight_id).first()
+        if not flight:
+            raise ValueError("Flight not found")
+        
+        if flight.status.value in ["cancelled", "departed", "arrived"]:
+            raise ValueError("Flight is not available for booking")
+        
+        seat_inventory = db.query(SeatInventory).filter(
+            SeatInventory.flight_id == group_data.flight_id,
+            SeatInventory.seat_class == seat_class
+        ).first()
+        if not seat_inventory or seat_inventory.available_seats < party_size:
+            raise ValueError(f"Not enough seats available in {seat_class.value} for {party_size} passengers")
+        
+        if held_price is not None:
+            # Bound to the buckets the whole party sells from
+            self.check_fare_basis(held_price, group_data.flight_id, seat_class, party_size,
+                                  seat_inventory.available_seats, seat_inventory.total_seats, db)
+            # Each passenger pays the price quoted for their seat, in ladder order
+            seat_prices = held_price["seat_prices"]
+        else:
+            # One pass over the fare ladder prices every seat (and rejects parties larger than availability)
+            seat_prices = self.pricing_engine.sell_group_price(flight, seat_class, party_size, db).seat_prices
+        
+        requested = [passenger.seat_number for passenger in group_data.passengers if passenger.seat_number]
+        identifiers = [self.generate_identifiers() for _ in group_data.passengers]
+        
+        def reserve_and_book_group() -> List[Booking]:
+            if held_price is not None:
+                self.price_tokens.claim(group_data.price_token, held_price["expires_at"], db)
+            
+            # Requested seats first, then the rest of the party side by side where possible
+            seat_numbers = {}
+            if requested:
+                assigned = self.seat_maps.allocate(group_data.flight_id, seat_class, len(requested), db, seat_numbers=requested)
+                seat_numbers.update(zip(requested, assigned))
+            unassigned = party_size - len(requested)
+            free_seats = iter(self.seat_maps.allocate(group_data.flight_id, seat_class, unassigned, db) if unassigned else [])
             
-        except IntegrityError:
-            db.rollback()
-            raise ValueError("Booking failed due to concurrency conflict. Please try again.")
+            # Conditional decrement for the whole party: all seats or none
+            if not self.pricing_engine.reserve_seats(group_data.flight_id, seat_class, party_size, db):
+                raise ValueError(f"Not enough seats available in {seat_class.value} for {party_size} passengers")
+            if held_price is not None:
+                self.check_reserved_fare_basis(held_price, group_data.flight_id, seat_class, party_size, db)
+            
+            bookings = []
+            for passenger, price_paid, (pnr, booking_reference) in zip(group_data.passengers, seat_prices, identifiers):
+                bookings.append(Booking(
+                    pnr=pnr,
+                    flight_id=group_data.flight_id,
+                    passenger_name=passenger.passenger_name,
+                    passenger_email=passenger.passenger_email,
+                    passenger_phone=passenger.passenger_phone,
+                    seat_class=seat_class,
+                    seat_number=seat_numbers[passenger.seat_number] if passenger.seat_number else next(free_seats),
+                    price_paid=price_paid,
+                    status=BookingStatus.CONFIRMED,
+                    booking_reference=booking_reference
+                ))
+            
+            # Flushed together, as one multi-row INSERT
+            db.add_all(bookings)
+            db.flush()
+            return bookings
+        
+        for attempt in range(2):
+            try:
+                bookings = run_in_transaction(db, reserve_and_book_group)
+                break
+            except IntegrityError as e:
+                if attempt or not self.is_identifier_conflict(e):
+                    raise ValueError("Booking failed due to concurrency conflict. Please try again.")
+                identifiers = [self.generate_identifiers() for _ in group_data.passengers]
+        notify_inventory_change(group_data.flight_id, seat_class)
+        
+        return GroupBookingConfirmation(
+            flight_id=group_data.flight_id,
+            seat_class=seat_class.value,
+            passengers=party_size,
+            total_price=round(sum(booking.price_paid for booking in bookings), 2),
+            bookings=[
+                BookingConfirmation(
+                    pnr=booking.pnr,
+                    booking_reference=booking.booking_reference,
+                    passenger_name=booking.passenger_name,
+                    passenger_email=booking.passenger_email,
+                    passenger_phone=booking.passenger_phone,
+                    flight_details=flight,
+                    seat_class=booking.seat_class,
+                    seat_number=booking.seat_number,
+                    price_paid=booking.price_paid,
+                    booking_date=booking.created_at,
+                    status=booking.status
+                )
+                for booking in bookings
+            ]
+        )
     
     def get_booking_by_pnr(self, pnr: str, db: Session) -> Optional[BookingConfirmation]:
         """Get booking details by PNR"""
@@ -161,28 +301,27 @@ class BookingService:
         if booking.status in [BookingStatus.CANCELLED, BookingStatus.COMPLETED]:
             return False
         
-        # Update booking status
-        booking.status = BookingStatus.CANCELLED
-        booking.updated_at = datetime.utcnow()
-        
-        # Release seat back to inventory
-        seat_inventory = db.query(SeatInventory).filter(
-            SeatInventory.flight_id == booking.flight_id,
-            SeatInventory.seat_class == booking.seat_class
-        ).first()
-        
-        if seat_inventory:
-            seat_inventory.available_seats += 1
-            seat_inventory.booked_seats -= 1
-            seat_inventory.last_updated = datetime.utcnow()
-        
-        # Update flight available seats
-        flight = db.query(Flight).filter(Flight.id == booking.flight_id).first()
-        if flight:
-            flight.available_seats += 1
-            flight.updated_at = datetime.utcnow()
+        def cancel_and_release() -> bool:
+            # Conditional status change, so concurrent cancels release the seat only once
+            cancelled = db.execute(
+                update(Booking)
+                .where(
+                    Booking.id == booking.id,
+                    Booking.status.notin_([BookingStatus.CANCELLED, BookingStatus.COMPLETED])
+                )
+                .values(status=BookingStatus.CANCELLED, updated_at=datetime.utcnow())
+            ).rowcount == 1
+            
+            # Release seat back to inventory and the seat map
+            if cancelled:
+                self.pricing_engine.release_seats(booking.flight_id, booking.seat_class, 1, db)
+                if booking.seat_number:
+                    self.seat_maps.release(booking.flight_id, booking.seat_class, [booking.seat_number], db)
+            return cancelled
         
-        db.commit()
+        if not run_in_transaction(db, cancel_and_release):
+            return False
+        notify_inventory_change(booking.flight_id, booking.seat_class)
         return True
     
     def get_booking_history(self, passenger_email: str, db: Session) -> list:
@@ -0,0 +1,115 @@
+import pandas as pd
+from datetime import datetime
+from typing import Dict
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from config_sqlite import SessionLocal, Booking, BookingStatus, DemandCurve, Flight
+from services.demand_curves import DemandCurveStore, demand_curve_store
+from config import (
+    PRICING_DEMAND_CURVE_PRIOR,
+    PRICING_DEMAND_CURVE_MIN_FACTOR,
+    PRICING_DEMAND_CURVE_MAX_FACTOR,
+    PRICING_DEMAND_CURVE_CHUNK_SIZE,
+)
+
+ROUTE_COLUMNS = ["departure_airport_id", "arrival_airport_id"]
+
+def count_bookings_by_pace(db: Session, store: DemandCurveStore, chunk_size: int = PRICING_DEMAND_CURVE_CHUNK_SIZE) -> pd.Series:
+    """Bookings per route and days-to-departure bucket, read from the bookings table in chunks"""
+    query = select(
+        Flight.departure_airport_id,
+        Flight.arrival_airport_id,
+        Flight.departure_time,
+        Booking.created_at
+    ).join(Flight, Flight.id == Booking.flight_id).where(Booking.status != BookingStatus.CANCELLED)
+    
+    # Only per-chunk group counts are kept, never the raw rows
+    partial_counts = []
+    chunks = pd.read_sql(query, db.connection(), chunksize=chunk_size, parse_dates=["departure_time", "created_at"])
+    for chunk in chunks:
+        days = (chunk["departure_time"] - chunk["created_at"]).dt.days.to_numpy()
+        chunk["bucket"] = store.bucket_index(days)
+        partial_counts.append(chunk.groupby(ROUTE_COLUMNS + ["bucket"]).size())
+    
+    if not partial_counts:
+        return pd.Series(dtype="int64")
+    return pd.concat(partial_counts).groupby(level=[0, 1, 2]).sum()
+
+def count_flights_by_route(db: Session) -> pd.Series:
+    """Flights scheduled on each route, the denominator of booking pace"""
+    query = select(
+        Flight.departure_airport_id,
+        Flight.arrival_airport_id,
+        func.count(Flight.id).label("flights")
+    ).group_by(Flight.departure_airport_id, Flight.arrival_airport_id)
+    return pd.read_sql(query, db.connection()).set_index(ROUTE_COLUMNS)["flights"]
+
+def fit_demand_curves(
+    db: Session,
+    store: DemandCurveStore = demand_curve_store,
+    prior: float = PRICING_DEMAND_CURVE_PRIOR,
+    min_factor: float = PRICING_DEMAND_CURVE_MIN_FACTOR,
+    max_factor: float = PRICING_DEMAND_CURVE_MAX_FACTOR,
+    chunk_size: int = PRICING_DEMAND_CURVE_CHUNK_SIZE
+) -> pd.DataFrame:
+    """Demand factor per route and bucket: route booking pace relative to the network pace at the same point"""
+    counts = count_bookings_by_pace(db, store, chunk_size)
+    if counts.empty:
+        return pd.DataFrame(columns=ROUTE_COLUMNS + ["bucket", "bookings", "demand_factor"])
+    
+    # Every bucket of a fitted route gets a row, so a bucket nobody booked in is shrunk below 1 rather than
+    # left at the neutral default
+    routes = counts.index.droplevel("bucket").unique()
+    full_index = pd.MultiIndex.from_tuples(
+        [(*route, bucket) for route in routes for bucket in range(len(store.bucket_starts))],
+        names=ROUTE_COLUMNS + ["bucket"]
+    )
+    counts = counts.reindex(full_index, fill_value=0)
+    
+    flights = count_flights_by_route(db)
+    pace = counts.rename("bookings").reset_index()
+    pace["flights"] = pace.set_index(ROUTE_COLUMNS).index.map(flights).to_numpy()
+    
+    # Network bookings per flight in each bucket; bucket widths cancel out in the ratio
+    network_rate = pace.groupby("bucket")["bookings"].sum() / flights.sum()
+    expected = pace["bucket"].map(network_rate) * pace["flights"]
+    
+    # Shrink thin routes towards the network pace: factor = (observed + prior) / (expected + prior)
+    pace["demand_factor"] = ((pace["bookings"] + prior) / (expected + prior)).clip(min_factor, max_factor)
+    return pace[ROUTE_COLUMNS + ["bucket", "bookings", "demand_factor"]]
+
+def store_demand_curves(db: Session, curves: pd.DataFrame, store: DemandCurveStore = demand_curve_store) -> int:
+    """Replace the stored curves with a fresh fit in one transaction"""
+    fitted_at = datetime.utcnow()
+    db.query(DemandCurve).delete(synchronize_session=False)
+    db.add_all([
+        DemandCurve(
+            departure_airport_id=int(row.departure_airport_id),
+            arrival_airport_id=int(row.arrival_airport_id),
+            days_until_departure=int(store.bucket_starts[row.bucket]),
+            demand_factor=round(float(row.demand_factor), 4),
+            bookings=int(row.bookings),
+            fitted_at=fitted_at
+        )
+        for row in curves.itertuples(index=False)
+    ])
+    db.commit()
+    return len(curves)
+
+def refit_demand_curves(db: Session, store: DemandCurveStore = demand_curve_store) -> Dict:
+    """Fit, store and reload the demand curves"""
+    curves = fit_demand_curves(db, store)
+    rows = store_demand_curves(db, curves, store)
+    store.load(db)
+    return {
+        "routes": int(curves.groupby(ROUTE_COLUMNS).ngroups) if rows else 0,
+        "curve_points": rows,
+        "bookings": int(curves["bookings"].sum()) if rows else 0
+    }
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        print(refit_demand_curves(db))
+    finally:
+        db.close()
@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session
+from config_sqlite import SessionLocal, DemandCurve, Flight
+from services.pricing_clock import days_until
+from config import PRICING_DEMAND_CURVE_BUCKETS, PRICING_DEMAND_CURVE_RELOAD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+class DemandCurveStore:
+    """Fitted demand factor per route and days to departure, expanded to per-day arrays for O(1) lookups"""
+    
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        buckets: Sequence[int] = PRICING_DEMAND_CURVE_BUCKETS,
+        reload_interval: float = PRICING_DEMAND_CURVE_RELOAD_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.reload_interval = reload_interval
+        
+        # Bucket edges in days; days past the last edge share the last bucket
+        self.bucket_starts = np.asarray(buckets[:-1])
+        self.horizon_days = buckets[-1]
+        self.bucket_by_day = np.searchsorted(self.bucket_starts, np.arange(self.horizon_days), side="right") - 1
+        
+        self._curves: Dict[Tuple[int, int], np.ndarray] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def bucket_index(self, days_until_departure) -> np.ndarray:
+        """Bucket of each days-to-departure value"""
+        days = np.clip(np.asarray(days_until_departure), 0, self.horizon_days - 1)
+        return self.bucket_by_day[days]
+    
+    def load(self, db: Optional[Session] = None):
+        """Load every fitted curve; the table holds a handful of rows per route"""
+        own_session = db is None
+        db = db or self.session_factory()
+        try:
+            rows = db.query(DemandCurve).all()
+        finally:
+            if own_session:
+                db.close()
+        
+        factors: Dict[Tuple[int, int], np.ndarray] = {}
+        for row in rows:
+            route = (row.departure_airport_id, row.arrival_airport_id)
+            bucket_factors = factors.setdefault(route, np.ones(len(self.bucket_starts)))
+            bucket_factors[self.bucket_index(row.days_until_departure)] = row.demand_factor
+        
+        curves = {route: bucket_factors[self.bucket_by_day] for route, bucket_factors in factors.items()}
+        with self._lock:
+            self._curves = curves
+            self._loaded_at = time.monotonic()
+    
+    def _ensure_loaded(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.reload_interval:
+            return
+        try:
+            self.load()
+        except Exception:
+            # Keep serving the previous curves (or none) until the next reload interval
+            logger.exception("Failed to load demand curves")
+            self._loaded_at = time.monotonic()
+    
+    def curve(self, flight: Flight) -> Optional[np.ndarray]:
+        """Per-day demand factors for the flight's route, or None if the route has no fitted curve"""
+        self._ensure_loaded()
+        return self._curves.get((flight.departure_airport_id, flight.arrival_airport_id))
+    
+    def factor(self, flight: Flight, now: Optional[datetime] = None) -> float:
+        """Fitted demand factor for the flight at its current days to departure"""
+        curve = self.curve(flight)
+        if curve is None:
+            return 1.0
+        now = now or datetime.utcnow()
+        days = min(max((flight.departure_time - now).days, 0), self.horizon_days - 1)
+        return float(curve[days])
+    
+    def factors(self, flights: List[Flight], now: Optional[datetime] = None) -> np.ndarray:
+        """Vectorized factor over a batch of flights"""
+        factors = np.ones(len(flights))
+        curves = [self.curve(flight) for flight in flights]
+        fitted = [i for i, curve in enumerate(curves) if curve is not None]
+        if not fitted:
+            return factors
+        
+        now = now or datetime.utcnow()
+        days = np.clip(days_until((flights[i].departure_time for i in fitted), now), 0, self.horizon_days - 1)
+        factors[fitted] = [curves[i][day] for i, day in zip(fitted, days)]
+        return factors
+
+# Shared store, reloaded periodically so refits reach running servers
+demand_curve_store = DemandCurveStore()
@@ -0,0 +1,152 @@
+import threading
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session
+from config_sqlite import FareBucket, SeatClass
+
+# Default bucket codes, cheapest first
+DEFAULT_BUCKET_CODES = ("Q", "M", "B", "Y")
+
+class FareLadder:
+    """Nested fare buckets for one cabin, precomputed as arrays indexed by seats sold"""
+    
+    __slots__ = ("codes", "seats", "fare_multipliers", "total_seats", "bucket_by_sold", "factor_by_sold")
+    
+    def __init__(self, codes: Sequence[str], seats: Sequence[int], fare_multipliers: Sequence[float], total_seats: int):
+        self.codes = list(codes)
+        self.seats = np.asarray(seats, dtype=np.int32)
+        self.fare_multipliers = np.asarray(fare_multipliers, dtype=np.float64)
+        self.total_seats = total_seats
+        
+        # Bucket selling each seat; seats beyond the defined caps stay in the top bucket, and the
+        # extra slot at index total_seats prices a sold-out cabin at the top fare
+        bucket_by_sold = np.repeat(np.arange(len(self.codes), dtype=np.int32), self.seats)[:total_seats + 1]
+        padding = total_seats + 1 - len(bucket_by_sold)
+        self.bucket_by_sold = np.concatenate([bucket_by_sold, np.full(padding, len(self.codes) - 1, dtype=np.int32)])
+        self.factor_by_sold = self.fare_multipliers[self.bucket_by_sold]
+    
+    @classmethod
+    def from_availability_ladder(cls, ladder: List[Tuple[float, float]], total_seats: int) -> "FareLadder":
+        """Buckets equivalent to a seat availability ladder of (max available ratio, factor) pairs"""
+        if total_seats <= 0:
+            return cls(DEFAULT_BUCKET_CODES[:1], [0], [1.0], 0)
+        
+        ratios = (total_seats - np.arange(total_seats)) / total_seats
+        conditions = [ratios <= threshold for threshold, _ in ladder]
+        factors = np.select(conditions, [factor for _, factor in ladder], default=1.0)
+        
+        # Factors only rise as seats sell, so each run of equal factors is one bucket
+        starts = np.flatnonzero(np.r_[True, factors[1:] != factors[:-1]])
+        seats = np.diff(np.r_[starts, total_seats])
+        codes = [DEFAULT_BUCKET_CODES[i] if i < len(DEFAULT_BUCKET_CODES) else f"F{i}" for i in range(len(starts))]
+        return cls(codes, seats, factors[starts], total_seats)
+    
+    def sold(self, available_seats: int) -> int:
+        return min(max(self.total_seats - available_seats, 0), self.total_seats)
+    
+    def open_bucket(self, available_seats: int) -> Optional[int]:
+        """Index of the bucket the next seat sells from, or None when the cabin is sold out"""
+        sold = self.sold(available_seats)
+        if sold >= self.total_seats:
+            return None
+        return int(self.bucket_by_sold[sold])
+    
+    def factor(self, available_seats: int) -> float:
+        """Fare multiplier of the next seat sold"""
+        return float(self.factor_by_sold[self.sold(available_seats)])
+    
+    def factors(self, available_seats: int, count: int) -> np.ndarray:
+        """Fare multipliers of the next count seats sold, in order"""
+        sold = self.sold(available_seats)
+        positions = np.minimum(np.arange(sold, sold + count), self.total_seats)
+        return self.factor_by_sold[positions]
+    
+    def basis(self, available_seats: int, count: int = 1) -> str:
+        """Codes of the buckets the next count seats sell from, e.g. "Q", or "Q+M" for a party spanning two"""
+        sold = self.sold(available_seats)
+        positions = np.minimum(np.arange(sold, sold + count), self.total_seats)
+        codes = []
+        for bucket in self.bucket_by_sold[positions]:
+            if self.codes[bucket] not in codes:
+                codes.append(self.codes[bucket])
+        return "+".join(codes)
+    
+    def describe(self, available_seats: int, base_fare: float) -> List[Dict]:
+        """Per-bucket caps, remaining seats and fares"""
+        sold = self.sold(available_seats)
+        open_bucket = self.open_bucket(available_seats)
+        ends = np.cumsum(self.seats)
+        starts = ends - self.seats
+        return [
+            {
+                "code": code,
+                "fare_multiplier": float(self.fare_multipliers[i]),
+                "fare": round(base_fare * float(self.fare_multipliers[i]), 2),
+                "seats": int(self.seats[i]),
+                "sold": int(np.clip(sold - starts[i], 0, self.seats[i])),
+                "remaining": int(np.clip(ends[i] - sold, 0, self.seats[i])),
+                "open": open_bucket == i
+            }
+            for i, code in enumerate(self.codes)
+        ]
+
+class FareBucketStore:
+    """Custom bucket definitions per (flight, seat class), with their ladders built once and reused"""
+    
+    def __init__(self):
+        self._definitions: Dict[Tuple[int, SeatClass], Optional[Tuple]] = {}
+        self._loaded_flights = set()
+        self._ladders: Dict[Tuple, FareLadder] = {}
+        self._lock = threading.Lock()
+    
+    def load(self, flight_ids: Iterable[int], db: Session):
+        """Load bucket definitions for flights not seen yet in one query"""
+        with self._lock:
+            missing = set(flight_ids) - self._loaded_flights
+        if not missing:
+            return
+        
+        buckets: Dict[Tuple[int, SeatClass], List[FareBucket]] = {}
+        rows = db.query(FareBucket).filter(FareBucket.flight_id.in_(missing)).order_by(FareBucket.position).all()
+        for row in rows:
+            buckets.setdefault((row.flight_id, row.seat_class), []).append(row)
+        
+        with self._lock:
+            # Flights without custom buckets are remembered too, so they are not queried again
+            self._loaded_flights.update(missing)
+            for flight_id in missing:
+                for seat_class in SeatClass:
+                    rows = buckets.get((flight_id, seat_class))
+                    self._definitions[(flight_id, seat_class)] = tuple(
+                        (row.code, row.seats, row.fare_multiplier) for row in rows
+                    ) if rows else None
+    
+    def ladder(self, flight_id: int, seat_class: SeatClass, total_seats: int,
+               availability_ladder: List[Tuple[float, float]], db: Optional[Session] = None) -> FareLadder:
+        """Fare ladder for a cabin: its custom buckets if defined, otherwise one derived from the availability ladder"""
+        if db is not None and flight_id not in self._loaded_flights:
+            self.load([flight_id], db)
+        
+        definition = self._definitions.get((flight_id, seat_class))
+        # Default ladders only depend on cabin size, so every flight of that size shares one
+        key = ("custom", definition, total_seats) if definition else ("default", tuple(availability_ladder), total_seats)
+        ladder = self._ladders.get(key)
+        if ladder is None:
+            if definition:
+                codes, seats, fare_multipliers = zip(*definition)
+                ladder = FareLadder(codes, seats, fare_multipliers, total_seats)
+            else:
+                ladder = FareLadder.from_availability_ladder(availability_ladder, total_seats)
+            with self._lock:
+                self._ladders[key] = ladder
+        return ladder
+    
+    def invalidate(self, flight_id: int):
+        """Forget a flight's bucket definitions so the next lookup reloads them"""
+        with self._lock:
+            self._loaded_flights.discard(flight_id)
+            for seat_class in SeatClass:
+                self._definitions.pop((flight_id, seat_class), None)
+
+# Shared store; admin bucket changes invalidate it directly, bookings never need to
+fare_bucket_store = FareBucketStore()
@@ -0,0 +1,160 @@
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from config_sqlite import SessionLocal, Flight, FlightStatus, SeatInventory, SeatClass
+from services.pricing_engine import PricingEngine, coerce_seat_class, inventory_listeners
+from config import PRICING_CALENDAR_CACHE_SIZE, PRICING_CALENDAR_TTL_SECONDS
+
+class FareCalendar:
+    """Cheapest fare per departure day for a route, cached per route until its inventory changes"""
+    
+    def __init__(
+        self,
+        pricing_engine: Optional[PricingEngine] = None,
+        session_factory=SessionLocal,
+        max_size: int = PRICING_CALENDAR_CACHE_SIZE,
+        ttl: float = PRICING_CALENDAR_TTL_SECONDS
+    ):
+        self.pricing_engine = pricing_engine or PricingEngine()
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self.ttl = ttl
+        
+        self._entries: "OrderedDict[Tuple, Tuple[float, Dict]]" = OrderedDict()
+        self._route_keys: Dict[Tuple[int, int], Set[Tuple]] = {}
+        self._flight_routes: Dict[int, Tuple[int, int]] = {}
+        self._route_versions: Dict[Tuple[int, int], int] = {}
+        self._lock = threading.Lock()
+    
+    def get_calendar(self, departure_airport_id: int, arrival_airport_id: int, seat_class, start_date: date,
+                     days: int, db: Session) -> Dict:
+        """Daily minimum fares for the route, served from cache when the route is unchanged"""
+        seat_class = coerce_seat_class(seat_class)
+        route = (departure_airport_id, arrival_airport_id)
+        key = (route, seat_class.value, start_date, days)
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return dict(entry[1], cached=True)
+            version = self._route_versions.get(route, 0)
+        
+        calendar = self._compute_calendar(departure_airport_id, arrival_airport_id, seat_class, start_date, days, db)
+        
+        # Never outlive the demand bucket the prices were computed in
+        ttl = self.pricing_engine.bucket_ttl(self.ttl)
+        with self._lock:
+            # Inventory on the route changed while we were pricing; serve this result but do not cache it
+            if self._route_versions.get(route, 0) != version:
+                return dict(calendar, cached=False)
+            self._entries[key] = (time.monotonic() + ttl, calendar)
+            self._entries.move_to_end(key)
+            self._route_keys.setdefault(route, set()).add(key)
+            while len(self._entries) > self.max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                self._route_keys.get(evicted[0], set()).discard(evicted)
+        return dict(calendar, cached=False)
+    
+    def _compute_calendar(self, departure_airport_id: int, arrival_airport_id: int, seat_class: SeatClass,
+                          start_date: date, days: int, db: Session) -> Dict:
+        """Price every bookable flight in the window in one pass and reduce to a per-day minimum"""
+        window_start = datetime.combine(start_date, datetime.min.time())
+        window_end = window_start + timedelta(days=days)
+        now = self.pricing_engine.clock.now()
+        
+        # One query for the route window; sold-out flights never set the low fare, but are still returned so a
+        # cancellation on one of them invalidates the calendar
+        window_flights = db.query(Flight, SeatInventory.available_seats).join(
+            SeatInventory, SeatInventory.flight_id == Flight.id
+        ).filter(
+            Flight.departure_airport_id == departure_airport_id,
+            Flight.arrival_airport_id == arrival_airport_id,
+            Flight.departure_time >= max(window_start, now),
+            Flight.departure_time < window_end,
+            Flight.status.in_([FlightStatus.SCHEDULED, FlightStatus.ON_TIME]),
+            SeatInventory.seat_class == seat_class
+        ).all()
+        flights = [flight for flight, available_seats in window_flights if available_seats > 0]
+        
+        # Mapped before pricing, so a booking on one of them while we price already bumps the route version
+        with self._lock:
+            for flight, _ in window_flights:
+                self._flight_routes[flight.id] = (departure_airport_id, arrival_airport_id)
+        
+        calendar_days = [
+            {"date": (start_date + timedelta(days=offset)).isoformat(), "min_price": None, "flight_id": None,
+             "flight_number": None, "flights": 0}
+            for offset in range(days)
+        ]
+        
+        if flights:
+            prices = self.pricing_engine.compute_prices([(flight, seat_class) for flight in flights], db)
+            current_prices = np.array([pricing.current_price for pricing in prices])
+            day_index = np.array([(flight.departure_time.date() - start_date).days for flight in flights])
+            
+            # Sort by day then price; the first row of each day is its cheapest flight
+            order = np.lexsort((current_prices, day_index))
+            days_present, first = np.unique(day_index[order], return_index=True)
+            counts = np.bincount(day_index, minlength=days)
+            
+            for day, position in zip(days_present, order[first]):
+                flight = flights[position]
+                calendar_days[day].update({
+                    "min_price": float(current_prices[position]),
+                    "flight_id": flight.id,
+                    "flight_number": flight.flight_number,
+                    "flights": int(counts[day])
+                })
+        
+        calendar = {
+            "seat_class": seat_class.value,
+            "start_date": start_date.isoformat(),
+            "days": calendar_days,
+            "priced_at": now.isoformat()
+        }
+        return calendar
+    
+    def invalidate_flight(self, flight_id: int, seat_class: Optional[SeatClass] = None):
+        """Drop cached calendars for the route a flight belongs to"""
+        route = self._flight_routes.get(flight_id)
+        if route is None:
+            # A flight no calendar has seen yet (e.g. newly stocked) may still belong in a cached window; a
+            # flight's route never changes, so it is looked up once and remembered for every later booking
+            db = self.session_factory()
+            try:
+                flight = db.query(Flight.departure_airport_id, Flight.arrival_airport_id).filter(
+                    Flight.id == flight_id
+                ).first()
+            finally:
+                db.close()
+            if flight is None:
+                return
+            route = (flight.departure_airport_id, flight.arrival_airport_id)
+        
+        with self._lock:
+            self._flight_routes[flight_id] = route
+            self._route_versions[route] = self._route_versions.get(route, 0) + 1
+            keys = self._route_keys.get(route, set())
+            stale = [key for key in keys if seat_class is None or key[1] == seat_class.value]
+            for key in stale:
+                keys.discard(key)
+                self._entries.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._route_keys.clear()
+            self._flight_routes.clear()
+            self._route_versions.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# Shared calendar cache, invalidated whenever a flight on a cached route changes inventory
+fare_calendar = FareCalendar()
+inventory_listeners.append(fare_calendar.invalidate_flight)
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from config_sqlite import SessionLocal, Flight, FlightStatus, SeatClass
+from models import PricingResponse
+from services.pricing_engine import PricingEngine, inventory_listeners
+from services.pricing_metrics import pricing_metrics
+from config import (
+    PRICING_SNAPSHOT_REFRESH_SECONDS,
+    PRICING_SNAPSHOT_MAX_STALENESS,
+    PRICING_SNAPSHOT_MAX_FLIGHTS,
+)
+
+logger = logging.getLogger(__name__)
+
+class FareSnapshot:
+    """In-memory grid of current prices per (flight, seat class), recomputed in the background"""
+    
+    def __init__(
+        self,
+        pricing_engine: Optional[PricingEngine] = None,
+        session_factory=SessionLocal,
+        refresh_interval: float = PRICING_SNAPSHOT_REFRESH_SECONDS,
+        max_staleness: float = PRICING_SNAPSHOT_MAX_STALENESS,
+        max_flights: int = PRICING_SNAPSHOT_MAX_FLIGHTS
+    ):
+        self.pricing_engine = pricing_engine or PricingEngine()
+        self.session_factory = session_factory
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max_staleness
+        self.max_flights = max_flights
+        
+        self._entries: Dict[Tuple[int, str], PricingResponse] = {}
+        self._tracked: "OrderedDict[int, None]" = OrderedDict()
+        self._dirty: Set[int] = set()
+        self._versions: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.last_refresh: Optional[datetime] = None
+    
+    def get(self, flight_id: int, seat_class) -> Optional[PricingResponse]:
+        """Return the snapshot price with its age, or None if missing, too stale or from an earlier demand bucket"""
+        key = (flight_id, getattr(seat_class, "value", seat_class))
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        
+        # Expires at the earlier of the staleness limit and the end of its demand bucket, like quote_ttl
+        now = self.pricing_engine.clock.now()
+        age = (now - entry.priced_at).total_seconds()
+        if age > self.max_staleness or self.pricing_engine.demand_bucket(entry.priced_at) != self.pricing_engine.demand_bucket(now):
+            return None
+        return entry.model_copy(update={"age_seconds": round(age, 3)})
+    
+    def track(self, flight_ids: Iterable[int]):
+        """Add flights to the set kept fresh by the refresher, evicting the least recently added"""
+        added = False
+        with self._lock:
+            for flight_id in flight_ids:
+                if flight_id in self._tracked:
+                    self._tracked.move_to_end(flight_id)
+                    continue
+                self._tracked[flight_id] = None
+                self._dirty.add(flight_id)
+                added = True
+            while len(self._tracked) > self.max_flights:
+                evicted, _ = self._tracked.popitem(last=False)
+                self._versions.pop(evicted, None)
+                self._drop(evicted)
+        if added:
+            self._wakeup.set()
+    
+    def mark_dirty(self, flight_id: int, seat_class: Optional[SeatClass] = None):
+        """Drop a flight's snapshot prices and have the refresher recompute them right away"""
+        with self._lock:
+            self._drop(flight_id, seat_class)
+            self._versions[flight_id] = self._versions.get(flight_id, 0) + 1
+            if flight_id in self._tracked:
+                self._dirty.add(flight_id)
+        self._wakeup.set()
+    
+    def _drop(self, flight_id: int, seat_class: Optional[SeatClass] = None):
+        seat_classes = [seat_class] if seat_class is not None else list(SeatClass)
+        for cls in seat_classes:
+            self._entries.pop((flight_id, cls.value), None)
+    
+    def refresh(self, flight_ids: Optional[List[int]] = None) -> int:
+        """Recompute every class of the given flights (all tracked flights by default)"""
+        with self._lock:
+            if flight_ids is None:
+                flight_ids = list(self._tracked)
+            self._dirty.difference_update(flight_ids)
+            versions = {flight_id: self._versions.get(flight_id, 0) for flight_id in flight_ids}
+        if not flight_ids:
+            return 0
+        
+        db = self.session_factory()
+        try:
+            now = self.pricing_engine.clock.now()
+            flights = db.query(Flight).filter(
+                Flight.id.in_(flight_ids),
+                Flight.departure_time > now,
+                Flight.status.in_([FlightStatus.SCHEDULED, FlightStatus.ON_TIME, FlightStatus.DELAYED])
+            ).all()
+            
+            pairs = [(flight, seat_class) for flight in flights for seat_class in SeatClass]
+            with pricing_metrics.stage("snapshot_refresh"):
+                prices = self.pricing_engine.compute_prices(pairs, db) if pairs else []
+        finally:
+            db.close()
+        
+        with self._lock:
+            # Flights that departed or were cancelled leave the snapshot
+            live = {flight.id for flight in flights}
+            for flight_id in flight_ids:
+                if flight_id not in live:
+                    self._tracked.pop(flight_id, None)
+                    self._versions.pop(flight_id, None)
+                    self._drop(flight_id)
+            
+            for pricing in prices:
+                if pricing.flight_id not in self._tracked:
+                    continue
+                # Inventory changed while we were computing; the next pass picks it up
+                if self._versions.get(pricing.flight_id, 0) != versions[pricing.flight_id]:
+                    self._dirty.add(pricing.flight_id)
+                    continue
+                self._entries[(pricing.flight_id, pricing.seat_class.value)] = pricing
+        
+        self.last_refresh = datetime.utcnow()
+        return len(prices)
+    
+    def stats(self) -> Dict:
+        """Size and freshness of the snapshot"""
+        return {
+            "tracked_flights": len(self._tracked),
+            "entries": len(self._entries),
+            "pending_refresh": len(self._dirty),
+            "refresh_interval_seconds": self.refresh_interval,
+            "last_refresh": self.last_refresh.isoformat() if self.last_refresh else None
+        }
+    
+    def start(self):
+        """Start the background refresher thread if it is not running"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="fare-snapshot-refresher", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the background refresher"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+    
+    def _run(self):
+        next_full_refresh = 0.0
+        while not self._stopping:
+            try:
+                now = time.monotonic()
+                if now >= next_full_refresh:
+                    self.refresh()
+                    next_full_refresh = now + self.refresh_interval
+                elif self._dirty:
+                    with self._lock:
+                        dirty = list(self._dirty)
+                    self.refresh(dirty)
+            except Exception:
+                logger.exception("Fare snapshot refresh failed")
+            
+            self._wakeup.wait(max(0.0, next_full_refresh - time.monotonic()))
+            self._wakeup.clear()
+
+# Shared snapshot, kept in sync with inventory changes
+fare_snapshot = FareSnapshot()
+inventory_listeners.append(fare_snapshot.mark_dirty)
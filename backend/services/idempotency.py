@@ -0,0 +1,186 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+from config import IDEMPOTENCY_KEY_TTL_SECONDS, IDEMPOTENCY_KEY_MAX_ENTRIES, IDEMPOTENCY_PATHS
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+AUTHORIZATION_HEADER = b"authorization"
+MAX_KEY_LENGTH = 255
+
+# Headers describing this particular response rather than the stored result
+UNREPLAYED_HEADERS = {b"server-timing", b"date"}
+
+class StoredResponse:
+    """Response of a completed request, or a placeholder while the first request is still running"""
+    
+    __slots__ = ("expires_at", "fingerprint", "status", "headers", "body")
+    
+    def __init__(self, expires_at: float, fingerprint: bytes, status: Optional[int] = None,
+                 headers: Optional[List[Tuple[bytes, bytes]]] = None, body: bytes = b""):
+        self.expires_at = expires_at
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers or []
+        self.body = body
+    
+    @property
+    def in_progress(self) -> bool:
+        return self.status is None
+
+class IdempotencyStore:
+    """Bounded key -> response store with TTL eviction; keys and request bodies are kept as short digests"""
+    
+    def __init__(self, ttl: float = IDEMPOTENCY_KEY_TTL_SECONDS, max_entries: int = IDEMPOTENCY_KEY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, StoredResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        # Counters for monitoring
+        self.replays = 0
+        self.conflicts = 0
+    
+    @staticmethod
+    def digest(*parts: bytes) -> bytes:
+        return hashlib.blake2b(b"\0".join(parts), digest_size=16).digest()
+    
+    def _evict(self, now: float):
+        # Entries are kept in insertion order with one TTL, so expired ones are always at the front
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+    
+    def begin(self, key: bytes, fingerprint: bytes) -> Optional[StoredResponse]:
+        """Claim a key for a new request (returns None), or return what is already stored under it"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                # Counted here, under the lock, since concurrent retries land on different threads
+                if entry.fingerprint == fingerprint:
+                    if entry.in_progress:
+                        self.conflicts += 1
+                    else:
+                        self.replays += 1
+                return entry
+            self._entries[key] = StoredResponse(now + self.ttl, fingerprint)
+            self._evict(now)
+            return None
+    
+    def complete(self, key: bytes, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        """Store the response of a claimed key"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.status, entry.headers, entry.body = status, headers, body
+    
+    def release(self, key: bytes):
+        """Forget a claimed key whose request failed, so the client can retry it"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.in_progress:
+                del self._entries[key]
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "replays": self.replays, "conflicts": self.conflicts}
+
+class IdempotencyMiddleware:
+    """Pure ASGI middleware replaying the stored response of POSTs retried with the same Idempotency-Key"""
+    
+    def __init__(self, app, store: Optional[IdempotencyStore] = None, paths: Iterable[str] = IDEMPOTENCY_PATHS):
+        self.app = app
+        self.store = store or idempotency_store
+        self.paths = tuple(paths)
+    
+    async def _error(self, send, status: int, detail: str):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+        
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not 0 < len(idempotency_key) <= MAX_KEY_LENGTH:
+            await self._error(send, 400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+            return
+        
+        # The body is read up front to fingerprint it, then handed to the app unchanged
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        
+        # Keys are scoped to the caller, so two clients picking the same key never see each other's responses
+        client = headers.get(AUTHORIZATION_HEADER) or (scope.get("client") or ("",))[0].encode()
+        key = self.store.digest(scope["path"].encode(), client, idempotency_key)
+        fingerprint = self.store.digest(body)
+        stored = self.store.begin(key, fingerprint)
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                await self._error(send, 422, "Idempotency-Key was already used with a different request")
+            elif stored.in_progress:
+                await self._error(send, 409, "A request with this Idempotency-Key is still in progress")
+            else:
+                await send({
+                    "type": "http.response.start",
+                    "status": stored.status,
+                    "headers": stored.headers + [(b"idempotent-replayed", b"true")]
+                })
+                await send({"type": "http.response.body", "body": stored.body})
+            return
+        
+        body_sent = False
+        
+        async def replay_body():
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        
+        response = {"status": None, "headers": [], "body": []}
+        
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [
+                    (name, value) for name, value in message.get("headers", []) if name.lower() not in UNREPLAYED_HEADERS
+                ]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+        
+        try:
+            await self.app(scope, replay_body, capture)
+        finally:
+            # Server errors are not final, so only responses below 500 are kept for replay
+            if response["status"] is not None and response["status"] < 500:
+                self.store.complete(key, response["status"], response["headers"], b"".join(response["body"]))
+            else:
+                self.store.release(key)
+
+# Shared store; single-process, like the quote cache
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,104 @@
+import base64
+import hashlib
+import hmac
+import logging
+import secrets
+import time
+from typing import Dict, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from config_sqlite import PriceTokenClaim
+from models import PricingResponse
+from config import SECRET_KEY, DEFAULT_SECRET_KEY, PRICING_PRICE_TOKEN_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+class PriceTokenError(ValueError):
+    """Price token is malformed, tampered with, expired or for a different fare"""
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+class PriceTokenSigner:
+    """HMAC-signed, time-limited, single-use holds on a quoted price, bound to the fare bucket it was quoted in"""
+    
+    def __init__(self, secret: str = SECRET_KEY, ttl: int = PRICING_PRICE_TOKEN_TTL_SECONDS):
+        # The placeholder key is public, so anyone could mint holds with it; a random key keeps them this process's own
+        if not secret or secret == DEFAULT_SECRET_KEY:
+            logger.warning("SECRET_KEY is not set; price tokens are signed with a random key and only valid in this process")
+            self._key = hashlib.sha256(secrets.token_bytes(32)).digest()
+        else:
+            self._key = hashlib.sha256(f"price-token:{secret}".encode()).digest()
+        self.ttl = ttl
+    
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self._key, payload, hashlib.sha256).digest()
+    
+    def issue(self, pricing: PricingResponse, now: Optional[float] = None) -> str:
+        """Token holding the quote's per-seat and total price for the flight, class, party size and fare bucket"""
+        expires_at = int((now or time.time()) + self.ttl)
+        seat_class = getattr(pricing.seat_class, "value", pricing.seat_class)
+        # Every seat's own price is signed, so a group is charged exactly what each seat was quoted
+        seat_prices = ",".join(f"{price:.2f}" for price in pricing.seat_prices or [pricing.current_price] * pricing.passengers)
+        # Identical quotes handed out in the same second still get distinct single-use tokens
+        nonce = secrets.token_hex(8)
+        payload = (
+            f"{pricing.flight_id}|{seat_class}|{pricing.passengers}|{pricing.current_price:.2f}|"
+            f"{pricing.total_price:.2f}|{seat_prices}|{pricing.fare_basis or ''}|{expires_at}|{nonce}"
+        ).encode()
+        return f"{_b64encode(payload)}.{_b64encode(self._sign(payload))}"
+    
+    def verify(self, token: str, flight_id: int, seat_class, passengers: int = 1, now: Optional[float] = None) -> Dict:
+        """Return the held prices if the token is authentic, unexpired and matches the booking"""
+        try:
+            encoded_payload, encoded_signature = token.split(".")
+            payload = _b64decode(encoded_payload)
+            signature = _b64decode(encoded_signature)
+        except ValueError:
+            raise PriceTokenError("Malformed price token")
+        
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise PriceTokenError("Invalid price token")
+        
+        try:
+            (token_flight_id, token_seat_class, token_passengers, current_price, total_price, seat_prices,
+             fare_basis, expires_at, _) = payload.decode().split("|")
+            seat_prices = [float(price) for price in seat_prices.split(",")]
+        except ValueError:
+            raise PriceTokenError("Malformed price token")
+        if int(expires_at) < (now or time.time()):
+            raise PriceTokenError("Price hold has expired, please refresh the price")
+        
+        seat_class = getattr(seat_class, "value", seat_class)
+        if (int(token_flight_id), token_seat_class, int(token_passengers)) != (flight_id, seat_class, passengers):
+            raise PriceTokenError("Price token does not match the selected flight, class or party size")
+        
+        return {
+            "current_price": float(current_price),
+            "total_price": float(total_price),
+            "seat_prices": seat_prices,
+            "fare_basis": fare_basis or None,
+            "expires_at": int(expires_at)
+        }
+    
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+    
+    def claim(self, token: str, expires_at: int, db: Session, now: Optional[float] = None):
+        """Mark a verified token as used within the booking's transaction, so a rollback gives the hold back"""
+        # Claims outlive their token only until the next booking purges them
+        db.query(PriceTokenClaim).filter(PriceTokenClaim.expires_at < int(now or time.time())).delete(
+            synchronize_session=False
+        )
+        db.add(PriceTokenClaim(digest=self._digest(token), expires_at=expires_at))
+        try:
+            db.flush()
+        except IntegrityError:
+            raise PriceTokenError("Price token has already been used, please refresh the price")
+
+# Shared signer so every engine issues tokens the booking service accepts
+price_token_signer = PriceTokenSigner()
@@ -0,0 +1,254 @@
+import argparse
+import csv
+import json
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+from config_sqlite import SessionLocal, Booking, BookingStatus, Flight, PricingHistory, SeatInventory
+from services.pricing_engine import PricingEngine, SEAT_CLASS_CODES, coerce_seat_class, ladder_factors
+from config import PRICING_SIMULATION_WORKERS
+
+BACKTEST_CHUNK_SIZE = 5000
+
+RESULT_COLUMNS = ["booking_id", "flight_id", "seat_class", "booked_at", "price_paid", "alternative_price", "difference"]
+
+def apply_pricing_overrides(engine: PricingEngine, overrides: Dict) -> PricingEngine:
+    """Apply an alternative pricing configuration (multipliers, ladders, fluctuation range) to an engine"""
+    if "seat_class_multipliers" in overrides:
+        for seat_class, multiplier in overrides["seat_class_multipliers"].items():
+            engine.seat_class_multipliers[coerce_seat_class(seat_class)] = float(multiplier)
+    if "time_factor_ladder" in overrides:
+        engine.time_factor_ladder = [(float(days), float(factor)) for days, factor in overrides["time_factor_ladder"]]
+    if "seat_availability_ladder" in overrides:
+        engine.seat_availability_ladder = [(float(ratio), float(factor)) for ratio, factor in overrides["seat_availability_ladder"]]
+    if "early_booking_factor" in overrides:
+        engine.early_booking_factor = float(overrides["early_booking_factor"])
+    if "demand_fluctuation_range" in overrides:
+        engine.demand_fluctuation_range = float(overrides["demand_fluctuation_range"])
+    return engine
+
+def _stream_bookings(db, flight_ids: List[int], chunk_size: int) -> Iterator:
+    return db.query(
+        Booking.id,
+        Booking.flight_id,
+        Booking.seat_class,
+        Booking.created_at,
+        Booking.price_paid,
+        Flight.departure_time,
+        Flight.departure_airport_id,
+        Flight.arrival_airport_id,
+        Flight.base_price
+    ).join(Flight, Flight.id == Booking.flight_id).filter(
+        Booking.flight_id.in_(flight_ids),
+        # Cancelled seats were given back, so they neither earn revenue nor fill the cabin
+        Booking.status != BookingStatus.CANCELLED
+    ).order_by(Booking.flight_id, Booking.seat_class, Booking.created_at).yield_per(chunk_size)
+
+def _stream_history(db, flight_ids: List[int], chunk_size: int) -> Iterator:
+    return db.query(
+        PricingHistory.flight_id,
+        PricingHistory.seat_class,
+        PricingHistory.calculated_at,
+        PricingHistory.demand_factor
+    ).filter(
+        PricingHistory.flight_id.in_(flight_ids)
+    ).order_by(PricingHistory.flight_id, PricingHistory.seat_class, PricingHistory.calculated_at).yield_per(chunk_size)
+
+def _replay_partition(partition: int, flight_ids: List[int], overrides: Dict, output_dir: str,
+                      chunk_size: int = BACKTEST_CHUNK_SIZE) -> Dict:
+    """Re-price one partition of flights and stream per-booking results to a CSV part file"""
+    baseline = PricingEngine()
+    alternative = apply_pricing_overrides(PricingEngine(), overrides)
+    
+    # Separate sessions so both result streams can stay open at once
+    booking_db = SessionLocal()
+    history_db = SessionLocal()
+    summary = {"bookings": 0, "revenue_paid": 0.0, "revenue_alternative": 0.0, "by_seat_class": {}}
+    path = os.path.join(output_dir, f"part-{partition:04d}.csv")
+    try:
+        totals = {
+            (row.flight_id, row.seat_class): row.total_seats
+            for row in booking_db.query(SeatInventory).filter(SeatInventory.flight_id.in_(flight_ids)).all()
+        }
+        history = iter(_stream_history(history_db, flight_ids, chunk_size))
+        next_history = next(history, None)
+        group, sold_in_group, last_demand = None, 0, None
+        
+        with open(path, "w", newline="") as output:
+            writer = csv.writer(output)
+            writer.writerow(RESULT_COLUMNS)
+            
+            chunk = []
+            for booking in _stream_bookings(booking_db, flight_ids, chunk_size):
+                key = (booking.flight_id, booking.seat_class)
+                if key != group:
+                    group, sold_in_group, last_demand = key, 0, None
+                
+                # Merge-join: latest history row for this flight/class at or before the booking
+                while next_history is not None and (
+                    (next_history.flight_id, next_history.seat_class.name) < (booking.flight_id, booking.seat_class.name)
+                    or ((next_history.flight_id, next_history.seat_class) == key
+                        and next_history.calculated_at <= booking.created_at)
+                ):
+                    if (next_history.flight_id, next_history.seat_class) == key:
+                        last_demand = next_history.demand_factor
+                    next_history = next(history, None)
+                
+                total_seats = totals.get(key) or 0
+                chunk.append((booking, last_demand, total_seats, total_seats - sold_in_group))
+                sold_in_group += 1
+                
+                if len(chunk) >= chunk_size:
+                    _write_chunk(writer, chunk, baseline, alternative, summary)
+                    chunk = []
+            if chunk:
+                _write_chunk(writer, chunk, baseline, alternative, summary)
+    finally:
+        booking_db.close()
+        history_db.close()
+    
+    summary["path"] = path
+    return summary
+
+def _write_chunk(writer, chunk: List, baseline: PricingEngine, alternative: PricingEngine, summary: Dict):
+    """Vectorized re-pricing of a chunk of bookings under the alternative configuration"""
+    bookings = [booking for booking, _, _, _ in chunk]
+    departures = [booking.departure_time for booking in bookings]
+    weekdays = np.array([departure.weekday() for departure in departures], dtype=np.intp)
+    hours = np.array([departure.hour for departure in departures], dtype=np.intp)
+    # Recorded demand includes the route's fitted curve at the booking's days to departure; only the rest is noise
+    curve_factors = np.array([baseline.demand_curves.factor(booking, booking.created_at) for booking in bookings])
+    base_demand = baseline.demand_table[weekdays, hours] * curve_factors
+    
+    # Market noise as drawn when each booking was made: recovered from recorded history, or the seeded draw
+    recorded = np.array([np.nan if demand is None else demand for _, demand, _, _ in chunk])
+    seeded = baseline.demand_noise(
+        np.array([booking.flight_id for booking in bookings]),
+        np.array([SEAT_CLASS_CODES[booking.seat_class] for booking in bookings]),
+        np.array([baseline.demand_bucket(booking.created_at) for booking in bookings])
+    )
+    noise = np.where(np.isnan(recorded), seeded, recorded / base_demand)
+    
+    # Overrides apply after the draw: a different fluctuation range rescales the drawn deviation
+    alternative_noise = noise
+    if baseline.demand_fluctuation_range and alternative.demand_fluctuation_range != baseline.demand_fluctuation_range:
+        alternative_noise = 1.0 + (noise - 1.0) * (alternative.demand_fluctuation_range / baseline.demand_fluctuation_range)
+    
+    # Each booking is re-priced at the instant it was made
+    booked_at = np.array([booking.created_at for booking in bookings], dtype="datetime64[us]")
+    
+    totals = np.array([total for _, _, total, _ in chunk], dtype=float)
+    available = np.array([available for _, _, _, available in chunk], dtype=float)
+    ratios = np.divide(available, totals, out=np.ones(len(chunk)), where=totals > 0)
+    
+    def availability_factors(engine: PricingEngine) -> np.ndarray:
+        return np.where(totals > 0, ladder_factors(ratios, engine.seat_availability_ladder, 1.0), 1.0)
+    
+    # The paid price is scaled by alternative / baseline for every factor the overrides can change; what they
+    # cannot (fare buckets, price holds, group fares) carries over as paid, so an identity override changes nothing
+    price_paid = np.array([booking.price_paid for booking in bookings], dtype=float)
+    alternative_prices = np.round(
+        price_paid
+        * np.array([
+            alternative.seat_class_multipliers[booking.seat_class] / baseline.seat_class_multipliers[booking.seat_class]
+            for booking in bookings
+        ])
+        * (alternative_noise / noise)
+        * (alternative.calculate_time_factors(bookings, booked_at) / baseline.calculate_time_factors(bookings, booked_at))
+        * (availability_factors(alternative) / availability_factors(baseline)),
+        2
+    )
+    
+    for i, booking in enumerate(bookings):
+        alternative_price = float(alternative_prices[i])
+        writer.writerow([
+            booking.id,
+            booking.flight_id,
+            booking.seat_class.value,
+            booking.created_at.isoformat(),
+            booking.price_paid,
+            alternative_price,
+            round(alternative_price - booking.price_paid, 2)
+        ])
+        
+        by_class = summary["by_seat_class"].setdefault(
+            booking.seat_class.value, {"bookings": 0, "revenue_paid": 0.0, "revenue_alternative": 0.0}
+        )
+        for totals_entry in (summary, by_class):
+            totals_entry["bookings"] += 1
+            totals_entry["revenue_paid"] += booking.price_paid
+            totals_entry["revenue_alternative"] += alternative_price
+
+def run_backtest(overrides: Dict, output_dir: str, workers: int = PRICING_SIMULATION_WORKERS,
+                 partitions: Optional[int] = None, chunk_size: int = BACKTEST_CHUNK_SIZE) -> Dict:
+    """Replay all bookings against an alternative pricing configuration, partitioned by flight"""
+    started = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    
+    db = SessionLocal()
+    try:
+        flight_ids = [row[0] for row in db.query(Booking.flight_id).distinct().order_by(Booking.flight_id).all()]
+    finally:
+        db.close()
+    
+    partition_count = max(1, min(partitions or workers * 4, len(flight_ids)))
+    flight_partitions = [list(map(int, part)) for part in np.array_split(np.array(flight_ids, dtype=int), partition_count)]
+    flight_partitions = [part for part in flight_partitions if part]
+    
+    if workers <= 1 or len(flight_partitions) <= 1:
+        results = [
+            _replay_partition(i, part, overrides, output_dir, chunk_size) for i, part in enumerate(flight_partitions)
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                _replay_partition,
+                range(len(flight_partitions)),
+                flight_partitions,
+                [overrides] * len(flight_partitions),
+                [output_dir] * len(flight_partitions),
+                [chunk_size] * len(flight_partitions)
+            ))
+    
+    summary = {"bookings": 0, "revenue_paid": 0.0, "revenue_alternative": 0.0, "by_seat_class": {}}
+    for result in results:
+        for key in ("bookings", "revenue_paid", "revenue_alternative"):
+            summary[key] += result[key]
+        for seat_class, class_totals in result["by_seat_class"].items():
+            merged = summary["by_seat_class"].setdefault(
+                seat_class, {"bookings": 0, "revenue_paid": 0.0, "revenue_alternative": 0.0}
+            )
+            for key in class_totals:
+                merged[key] += class_totals[key]
+    
+    for totals in [summary] + list(summary["by_seat_class"].values()):
+        totals["revenue_paid"] = round(totals["revenue_paid"], 2)
+        totals["revenue_alternative"] = round(totals["revenue_alternative"], 2)
+        totals["difference"] = round(totals["revenue_alternative"] - totals["revenue_paid"], 2)
+    
+    summary.update({
+        "overrides": overrides,
+        "flights": len(flight_ids),
+        "parts": [result["path"] for result in results],
+        "generated_at": datetime.utcnow().isoformat(),
+        "elapsed_seconds": round(time.perf_counter() - started, 3)
+    })
+    with open(os.path.join(output_dir, "summary.json"), "w") as output:
+        json.dump(summary, output, indent=2)
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay historical bookings against an alternative pricing configuration")
+    parser.add_argument("config", help="JSON file with pricing overrides")
+    parser.add_argument("--output", default="backtest_results", help="Directory for part files and summary.json")
+    parser.add_argument("--workers", type=int, default=PRICING_SIMULATION_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=BACKTEST_CHUNK_SIZE)
+    args = parser.parse_args()
+    
+    with open(args.config) as config_file:
+        pricing_overrides = json.load(config_file)
+    result = run_backtest(pricing_overrides, args.output, workers=args.workers, chunk_size=args.chunk_size)
+    print(json.dumps({key: result[key] for key in ("bookings", "revenue_paid", "revenue_alternative", "difference")}))
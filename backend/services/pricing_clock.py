@@ -0,0 +1,86 @@
+import threading
+import time
+import numpy as np
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+from config import PRICING_CLOCK_START, PRICING_CLOCK_SPEED
+
+def seconds_until(departures: Iterable[datetime], now) -> np.ndarray:
+    """Seconds from now (a datetime or an array of them) to each departure, in one vectorized subtraction"""
+    departure_times = np.array(list(departures), dtype="datetime64[us]")
+    return (departure_times - np.asarray(now, dtype="datetime64[us]")) / np.timedelta64(1, "s")
+
+def days_until(departures: Iterable[datetime], now) -> np.ndarray:
+    """Whole days until each departure, floored like timedelta.days"""
+    return np.floor(seconds_until(departures, now) / 86400).astype(np.int64)
+
+class PricingClock:
+    """Source of "now" for pricing: system time, virtual time running at any speed, or frozen time"""
+    
+    def __init__(self, start: Optional[datetime] = None, speed: float = 1.0):
+        self._lock = threading.Lock()
+        # Per-clock request snapshot, so separate clocks (e.g. a simulation's) never see each other's
+        self._frozen: ContextVar[Optional[datetime]] = ContextVar(f"pricing_clock_{id(self)}", default=None)
+        # A speed other than real time needs virtual time, starting from now when no start is given
+        if start is None and speed != 1.0:
+            start = datetime.utcnow()
+        self.set(start, speed)
+    
+    @property
+    def is_virtual(self) -> bool:
+        return self._start is not None
+    
+    def set(self, start: Optional[datetime] = None, speed: Optional[float] = None):
+        """Jump to a virtual time (None returns to system time), optionally changing the speed"""
+        with self._lock:
+            self._start = start
+            self._anchor = time.monotonic()
+            if speed is not None:
+                self.speed = speed
+    
+    def advance(self, delta: timedelta):
+        """Move virtual time forward, e.g. one simulated day at a time"""
+        with self._lock:
+            self._start = self._current() + delta
+            self._anchor = time.monotonic()
+    
+    def _current(self) -> datetime:
+        if self._start is None:
+            return datetime.utcnow()
+        return self._start + timedelta(seconds=(time.monotonic() - self._anchor) * self.speed)
+    
+    def now(self) -> datetime:
+        """The request's snapshot time if one is active, otherwise the clock's current time"""
+        frozen = self._frozen.get()
+        return frozen if frozen is not None else self._current()
+    
+    @contextmanager
+    def snapshot(self, moment: Optional[datetime] = None):
+        """Freeze now() for the enclosed block so every price in it uses the same instant"""
+        token = self._frozen.set(moment or self._current())
+        try:
+            yield self._frozen.get()
+        finally:
+            self._frozen.reset(token)
+
+class PricingClockMiddleware:
+    """Pure ASGI middleware giving each HTTP request a single pricing instant"""
+    
+    def __init__(self, app, clock: Optional[PricingClock] = None):
+        self.app = app
+        self.clock = clock or pricing_clock
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with self.clock.snapshot():
+            await self.app(scope, receive, send)
+
+# Shared clock; PRICING_CLOCK_START / PRICING_CLOCK_SPEED run a demo server on virtual time
+pricing_clock = PricingClock(
+    start=datetime.fromisoformat(PRICING_CLOCK_START) if PRICING_CLOCK_START else None,
+    speed=PRICING_CLOCK_SPEED
+)
@@ -1,13 +1,80 @@
 import random
 import math
+import numpy as np
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, update
 from sqlalchemy.orm import Session
 from config_sqlite import Flight, PricingHistory, SeatInventory, SeatClass
 from models import PricingRequest, PricingResponse
+from services.pricing_history_buffer import PricingHistoryBuffer, pricing_history_buffer
+from services.quote_cache import QuoteCache, quote_cache as shared_quote_cache
+from services.pricing_rollup import floor_to_resolution, load_rollup_points, merge_trend_points
+from services.fare_buckets import FareBucketStore, FareLadder, fare_bucket_store
+from services.price_tokens import PriceTokenSigner, price_token_signer
+from services.demand_curves import DemandCurveStore, demand_curve_store
+from services.pricing_metrics import PricingMetrics, pricing_metrics
+from services.pricing_clock import PricingClock, days_until, pricing_clock
+from services.transactions import run_in_transaction
+from config import PRICING_DEMAND_SEED, PRICING_DEMAND_BUCKET_SECONDS, PRICING_HISTORY_SAMPLE_RATE
+
+EPOCH = datetime(1970, 1, 1)
+
+# Bucket formats for aggregated price trends (same syntax for SQLite strftime and MySQL DATE_FORMAT)
+TREND_RESOLUTIONS = {
+    "hour": ("%Y-%m-%d %H:00:00", "%Y-%m-%d %H:%M:%S"),
+    "day": ("%Y-%m-%d", "%Y-%m-%d"),
+}
+
+# Largest party priced and booked as a group (matches the flight search passenger limit)
+MAX_GROUP_PASSENGERS = 9
+
+# Stable integer codes for hashing seat classes
+SEAT_CLASS_CODES = {seat_class: code for code, seat_class in enumerate(SeatClass)}
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """SplitMix64 finalizer over an array of unsigned 64-bit integers"""
+    z = values + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def ladder_factors(values: np.ndarray, ladder: List[Tuple[float, float]], default: float) -> np.ndarray:
+    """Vectorized lookup of a step-function ladder of (upper bound, factor) pairs"""
+    conditions = [values <= threshold for threshold, _ in ladder]
+    factors = [factor for _, factor in ladder]
+    return np.select(conditions, factors, default=default)
+
+def coerce_seat_class(seat_class) -> SeatClass:
+    """Map an API seat class (or its string value) onto the database enum"""
+    if isinstance(seat_class, SeatClass):
+        return seat_class
+    return SeatClass(getattr(seat_class, "value", seat_class))
+
+# Callbacks run whenever a flight's seat inventory changes
+inventory_listeners: List[Callable[[int, Optional[SeatClass]], None]] = []
+
+def notify_inventory_change(flight_id: int, seat_class=None):
+    """Invalidate everything derived from a flight's seat inventory"""
+    if seat_class is not None:
+        seat_class = coerce_seat_class(seat_class)
+    shared_quote_cache.invalidate(flight_id, seat_class)
+    for listener in inventory_listeners:
+        listener(flight_id, seat_class)
 
 class PricingEngine:
-    def __init__(self):
+    def __init__(
+        self,
+        history_buffer: Optional[PricingHistoryBuffer] = None,
+        quote_cache: Optional[QuoteCache] = None,
+        demand_seed: Optional[int] = None,
+        fare_snapshot=None,
+        fare_buckets: Optional[FareBucketStore] = None,
+        price_tokens: Optional[PriceTokenSigner] = None,
+        demand_curves: Optional[DemandCurveStore] = None,
+        metrics: Optional[PricingMetrics] = None,
+        clock: Optional[PricingClock] = None
+    ):
         # Base multipliers for different seat classes
         self.seat_class_multipliers = {
             SeatClass.ECONOMY: 1.0,
@@ -19,78 +86,165 @@ class PricingEngine:
         # Demand simulation parameters
         self.demand_fluctuation_range = 0.3  # ±30% demand variation
         self.time_sensitivity = 0.02  # 2% price increase per day closer to departure
+        self.demand_seed = PRICING_DEMAND_SEED if demand_seed is None else demand_seed
+        self.demand_bucket_seconds = PRICING_DEMAND_BUCKET_SECONDS
+        
+        # Time-of-day demand: peak 06-09 and 17-20, off-peak 22-05
+        hourly_demand = [
+            1.2 if 6 <= hour <= 9 or 17 <= hour <= 20 else 0.8 if hour >= 22 or hour <= 5 else 1.0
+            for hour in range(24)
+        ]
+        # Day-of-week demand: Monday and Friday-Sunday are busier than midweek
+        weekday_demand = [1.1, 0.9, 0.9, 0.9, 1.1, 1.1, 1.1]
+        # Precomputed 7x24 lookup indexed by [weekday, hour]
+        self.demand_table = np.outer(weekday_demand, hourly_demand)
+        
+        # Booking pace per route and days to departure, fitted by services.demand_curve_fit
+        self.demand_curves = demand_curves or demand_curve_store
+        
+        # Step-function ladders as (upper bound, factor), checked in order
+        self.time_factor_ladder = [
+            (0, 2.0),   # Last minute booking
+            (1, 1.8),   # Same day booking
+            (7, 1.5),   # Within a week
+            (30, 1.2),  # Within a month
+        ]
+        self.early_booking_factor = 1.0
+        self.seat_availability_ladder = [
+            (0.1, 1.5),   # Less than 10% seats available
+            (0.25, 1.3),  # Less than 25% seats available
+            (0.5, 1.1),   # Less than 50% seats available
+        ]
         
-    def calculate_demand_factor(self, flight: Flight, seat_class: SeatClass) -> float:
+        # Nested fare buckets per cabin; flights without custom buckets follow the availability ladder
+        self.fare_buckets = fare_buckets or fare_bucket_store
+        
+        # Pricing history is written behind the request instead of committed inline
+        self.history_buffer = history_buffer or pricing_history_buffer
+        
+        # Identical quotes are served from a short-lived cache until inventory changes
+        self.quote_cache = quote_cache or shared_quote_cache
+        
+        # Fraction of freshly computed quotes that are sampled into pricing history
+        self.history_sample_rate = PRICING_HISTORY_SAMPLE_RATE
+        
+        # Optional background-refreshed price grid consulted before the cache (see services.fare_snapshot)
+        self.fare_snapshot = fare_snapshot
+        
+        # Quotes carry a signed price hold that booking honours without re-pricing
+        self.price_tokens = price_tokens or price_token_signer
+        
+        # Per-stage timers and counters (inventory fetch, factor compute, history write)
+        self.metrics = metrics or pricing_metrics
+        
+        # Source of "now" for every time-dependent factor; frozen per request, virtual in simulations
+        self.clock = clock or pricing_clock
+        
+    def demand_bucket(self, now: Optional[datetime] = None) -> int:
+        """Index of the time bucket within which demand noise stays fixed"""
+        now = now or self.clock.now()
+        return int((now - EPOCH).total_seconds() // self.demand_bucket_seconds)
+    
+    def seconds_until_next_bucket(self, now: Optional[datetime] = None) -> float:
+        """Seconds until demand noise rolls over to the next bucket"""
+        now = now or self.clock.now()
+        elapsed = (now - EPOCH).total_seconds()
+        return self.demand_bucket_seconds - elapsed % self.demand_bucket_seconds
+    
+    def bucket_ttl(self, ttl: float, now: Optional[datetime] = None) -> float:
+        """Cache lifetime capped at the end of the demand bucket, in real seconds"""
+        # Caches expire on real time, so a faster virtual clock reaches the next bucket sooner
+        bucket_seconds = self.seconds_until_next_bucket(now)
+        if self.clock.speed > 1:
+            bucket_seconds /= self.clock.speed
+        return min(ttl, bucket_seconds)
+    
+    def quote_ttl(self, now: Optional[datetime] = None) -> float:
+        """Cache lifetime for a quote, which never outlives its demand bucket"""
+        return self.bucket_ttl(self.quote_cache.ttl, now)
+    
+    def demand_noise(self, flight_ids: np.ndarray, seat_class_codes: np.ndarray, bucket) -> np.ndarray:
+        """Seeded market fluctuation in [1 - range, 1 + range) per (flight, class, bucket)"""
+        mask = 0xFFFFFFFFFFFFFFFF
+        z = _mix64(np.full(len(flight_ids), self.demand_seed & mask, dtype=np.uint64) ^ np.asarray(flight_ids, dtype=np.uint64))
+        z = _mix64(z ^ np.asarray(seat_class_codes, dtype=np.uint64))
+        z = _mix64(z ^ np.asarray(bucket, dtype=np.int64).astype(np.uint64))
+        
+        # Top 53 bits give a uniform double in [0, 1)
+        uniform = (z >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+        return 1.0 + self.demand_fluctuation_range * (2.0 * uniform - 1.0)
+    
+    def calculate_demand_factor(self, flight: Flight, seat_class: SeatClass, now: Optional[datetime] = None) -> float:
         """Calculate demand factor based on historical data and simulation"""
-        # Simulate demand based on time of day, day of week, and season
-        departure_hour = flight.departure_time.hour
-        departure_weekday = flight.departure_time.weekday()
-        
-        # Time-based demand patterns
-        time_factor = 1.0
-        if 6 <= departure_hour <= 9 or 17 <= departure_hour <= 20:  # Peak hours
-            time_factor = 1.2
-        elif 22 <= departure_hour or departure_hour <= 5:  # Off-peak hours
-            time_factor = 0.8
-            
-        # Day of week factor
-        weekday_factor = 1.0
-        if departure_weekday in [0, 4, 5, 6]:  # Monday, Friday, Saturday, Sunday
-            weekday_factor = 1.1
-        elif departure_weekday in [1, 2, 3]:  # Tuesday, Wednesday, Thursday
-            weekday_factor = 0.9
-            
-        # Random fluctuation to simulate market conditions
-        random_factor = 1.0 + random.uniform(-self.demand_fluctuation_range, self.demand_fluctuation_range)
+        seat_class = coerce_seat_class(seat_class)
+        now = now or self.clock.now()
+        
+        # Simulate demand based on time of day and day of week, scaled by the route's fitted booking pace
+        departure = flight.departure_time
+        base_demand = self.demand_table[departure.weekday(), departure.hour] * self.demand_curves.factor(flight, now)
         
-        return time_factor * weekday_factor * random_factor
+        # Seeded fluctuation to simulate market conditions, stable within a time bucket
+        noise = self.demand_noise(
+            np.array([flight.id]), np.array([SEAT_CLASS_CODES[seat_class]]), self.demand_bucket(now)
+        )[0]
+        
+        return float(base_demand * noise)
     
-    def calculate_time_factor(self, flight: Flight) -> float:
+    def calculate_time_factor(self, flight: Flight, now: Optional[datetime] = None) -> float:
         """Calculate time factor based on days until departure"""
-        now = datetime.utcnow()
+        now = now or self.clock.now()
         days_until_departure = (flight.departure_time - now).days
         
-        if days_until_departure <= 0:
-            return 2.0  # Last minute booking
-        elif days_until_departure <= 1:
-            return 1.8  # Same day booking
-        elif days_until_departure <= 7:
-            return 1.5  # Within a week
-        elif days_until_departure <= 30:
-            return 1.2  # Within a month
-        else:
-            return 1.0  # Early booking
+        for max_days, factor in self.time_factor_ladder:
+            if days_until_departure <= max_days:
+                return factor
+        return self.early_booking_factor
     
     def calculate_seat_availability_factor(self, flight: Flight, seat_class: SeatClass, db: Session) -> float:
         """Calculate price factor based on seat availability"""
+        seat_class = coerce_seat_class(seat_class)
+        
         # Get seat inventory for the specific class
-        seat_inventory = db.query(SeatInventory).filter(
-            SeatInventory.flight_id == flight.id,
-            SeatInventory.seat_class == seat_class
-        ).first()
+        with self.metrics.stage("inventory"):
+            seat_inventory = db.query(SeatInventory).filter(
+                SeatInventory.flight_id == flight.id,
+                SeatInventory.seat_class == seat_class
+            ).first()
         
-        if not seat_inventory:
-            return 1.0
-            
-        availability_ratio = seat_inventory.available_seats / seat_inventory.total_seats
-        
-        if availability_ratio <= 0.1:  # Less than 10% seats available
-            return 1.5
-        elif availability_ratio <= 0.25:  # Less than 25% seats available
-            return 1.3
-        elif availability_ratio <= 0.5:  # Less than 50% seats available
-            return 1.1
-        else:
+        if not seat_inventory or not seat_inventory.total_seats:
             return 1.0
+        
+        # Open fare bucket is a direct lookup by seats sold
+        return self.fare_ladder(flight.id, seat_class, seat_inventory.total_seats, db).factor(seat_inventory.available_seats)
+    
+    def fare_ladder(self, flight_id: int, seat_class: SeatClass, total_seats: int, db: Optional[Session] = None) -> FareLadder:
+        """Precomputed fare bucket ladder for a cabin"""
+        return self.fare_buckets.ladder(flight_id, seat_class, total_seats, self.seat_availability_ladder, db)
+    
+    def fare_basis(self, flight_id: int, seat_class: SeatClass, available_seats: int, total_seats: int,
+                   passengers: int = 1, db: Optional[Session] = None) -> Optional[str]:
+        """Fare bucket codes the next seats of a cabin sell from, which a price hold is bound to"""
+        if not total_seats:
+            return None
+        return self.fare_ladder(flight_id, coerce_seat_class(seat_class), total_seats, db).basis(available_seats, passengers)
     
     def calculate_dynamic_price(self, flight: Flight, seat_class: SeatClass, db: Session) -> PricingResponse:
         """Calculate dynamic price for a flight and seat class"""
+        return self.sell_price(flight, seat_class, db)
+    
+    def sell_price(self, flight: Flight, seat_class: SeatClass, db: Session) -> PricingResponse:
+        """Price a seat that is being sold: always computed fresh and always recorded in history"""
+        seat_class = coerce_seat_class(seat_class)
+        
         # Get base price for the seat class
         base_price = flight.base_price * self.seat_class_multipliers[seat_class]
         
         # Calculate all factors
-        demand_factor = self.calculate_demand_factor(flight, seat_class)
-        time_factor = self.calculate_time_factor(flight)
+        self.metrics.increment("sell_prices")
+        now = self.clock.now()
+        with self.metrics.stage("factors"):
+            demand_factor = self.calculate_demand_factor(flight, seat_class, now)
+            time_factor = self.calculate_time_factor(flight, now)
         seat_availability_factor = self.calculate_seat_availability_factor(flight, seat_class, db)
         
         # Calculate final price
@@ -99,53 +253,334 @@ class PricingEngine:
         # Round to nearest dollar
         current_price = round(current_price, 2)
         
-        # Store pricing history
-        pricing_history = PricingHistory(
+        pricing = PricingResponse(
             flight_id=flight.id,
-            seat_class=seat_class,
-            price=current_price,
+            seat_class=seat_class.value,
+            base_price=base_price,
+            current_price=current_price,
             demand_factor=demand_factor,
             time_factor=time_factor,
-            seat_availability_factor=seat_availability_factor
+            seat_availability_factor=seat_availability_factor,
+            total_price=current_price,
+            priced_at=now
         )
-        db.add(pricing_history)
-        db.commit()
         
-        return PricingResponse(
+        # Store pricing history
+        self.record_history([self._history_row(pricing, pricing.priced_at)])
+        
+        self.quote_cache.put(flight.id, seat_class, pricing, ttl=self.quote_ttl())
+        return pricing
+    
+    def quote_price(self, flight: Flight, seat_class: SeatClass, db: Session) -> PricingResponse:
+        """Side-effect free quote for browsing traffic"""
+        return self.quote_prices([(flight, seat_class)], db)[0]
+    
+    def quote_prices(self, pairs: List[Tuple[Flight, SeatClass]], db: Session) -> List[PricingResponse]:
+        """Quote many (flight, seat class) pairs at once without writing to the request session"""
+        pairs = [(flight, coerce_seat_class(seat_class)) for flight, seat_class in pairs]
+        
+        # Only price the pairs that are not already in the snapshot or cache
+        with self.metrics.stage("quote_lookup"):
+            responses = [self._lookup_quote(flight.id, seat_class) for flight, seat_class in pairs]
+        misses = [i for i, response in enumerate(responses) if response is None]
+        self.metrics.increment("quotes", len(pairs))
+        self.metrics.increment("quote_misses", len(misses))
+        if misses:
+            priced = self.compute_prices([pairs[i] for i in misses], db)
+            ttl = self.quote_ttl()
+            for i, pricing in zip(misses, priced):
+                self.quote_cache.put(pricing.flight_id, pricing.seat_class, pricing, ttl=ttl)
+                responses[i] = pricing
+            self._sample_history(priced)
+            
+            # Flights that keep missing are worth keeping in the snapshot
+            if self.fare_snapshot is not None:
+                self.fare_snapshot.track(pairs[i][0].id for i in misses)
+        
+        # Signed per response (after caching) so every hold starts when it is handed out
+        for response in responses:
+            response.price_token = self.price_tokens.issue(response)
+        return responses
+    
+    def _lookup_quote(self, flight_id: int, seat_class: SeatClass) -> Optional[PricingResponse]:
+        if self.fare_snapshot is not None:
+            quote = self.fare_snapshot.get(flight_id, seat_class)
+            if quote is not None:
+                return quote
+        return self.quote_cache.get(flight_id, seat_class)
+    
+    def quote_all_classes(self, flight: Flight, db: Session) -> Dict[SeatClass, PricingResponse]:
+        """Quote the full seat class ladder for a flight in a single pass"""
+        seat_classes = list(SeatClass)
+        quotes = self.quote_prices([(flight, seat_class) for seat_class in seat_classes], db)
+        return dict(zip(seat_classes, quotes))
+    
+    def _sample_history(self, quotes: List[PricingResponse]):
+        """Record a random sample of fresh quotes so trends still reflect browsing prices"""
+        if self.history_sample_rate <= 0:
+            return
+        
+        calculated_at = quotes[0].priced_at if quotes else self.clock.now()
+        sampled = [quote for quote in quotes if random.random() < self.history_sample_rate]
+        if sampled:
+            self.record_history([self._history_row(quote, calculated_at) for quote in sampled])
+    
+    def _history_row(self, pricing: PricingResponse, calculated_at: datetime) -> Dict:
+        return {
+            "flight_id": pricing.flight_id,
+            "seat_class": coerce_seat_class(pricing.seat_class),
+            "price": pricing.current_price,
+            "demand_factor": pricing.demand_factor,
+            "time_factor": pricing.time_factor,
+            "seat_availability_factor": pricing.seat_availability_factor,
+            "calculated_at": calculated_at
+        }
+    
+    def record_history(self, rows: List[Dict]):
+        """Hand pricing history rows to the write-behind buffer"""
+        with self.metrics.stage("history"):
+            self.history_buffer.submit(rows)
+        self.metrics.increment("history_rows", len(rows))
+    
+    def get_pricing_for_flights(self, flights: List[Flight], seat_class: SeatClass, db: Session) -> List[PricingResponse]:
+        """Get pricing for multiple flights"""
+        return self.quote_prices([(flight, seat_class) for flight in flights], db)
+    
+    def load_seat_inventory(self, flight_ids: Iterable[int], db: Session) -> Dict[Tuple[int, SeatClass], SeatInventory]:
+        """Load seat inventory for many flights in a single query"""
+        flight_ids = list(set(flight_ids))
+        if not flight_ids:
+            return {}
+        
+        rows = db.query(SeatInventory).filter(SeatInventory.flight_id.in_(flight_ids)).all()
+        return {(row.flight_id, row.seat_class): row for row in rows}
+    
+    def calculate_demand_factors(self, pairs: List[Tuple[Flight, SeatClass]], now: Optional[datetime] = None) -> np.ndarray:
+        """Vectorized calculate_demand_factor over a batch of (flight, seat class) pairs"""
+        now = now or self.clock.now()
+        weekdays = np.array([flight.departure_time.weekday() for flight, _ in pairs], dtype=np.intp)
+        hours = np.array([flight.departure_time.hour for flight, _ in pairs], dtype=np.intp)
+        flight_ids = np.array([flight.id for flight, _ in pairs])
+        seat_class_codes = np.array([SEAT_CLASS_CODES[seat_class] for _, seat_class in pairs])
+        
+        noise = self.demand_noise(flight_ids, seat_class_codes, self.demand_bucket(now))
+        curve_factors = self.demand_curves.factors([flight for flight, _ in pairs], now)
+        return self.demand_table[weekdays, hours] * curve_factors * noise
+    
+    def calculate_time_factors(self, flights: List[Flight], now=None) -> np.ndarray:
+        """Vectorized calculate_time_factor over a batch of flights; now may also be an array, one instant per flight"""
+        now = self.clock.now() if now is None else now
+        days_until_departure = days_until((flight.departure_time for flight in flights), now)
+        return ladder_factors(days_until_departure, self.time_factor_ladder, self.early_booking_factor)
+    
+    def calculate_seat_availability_factors(self, pairs: List[Tuple[Flight, SeatClass]],
+                                            inventory: Dict[Tuple[int, SeatClass], SeatInventory]) -> np.ndarray:
+        """Open fare bucket factor per pair over preloaded inventory (bucket definitions loaded via fare_buckets.load)"""
+        factors = np.ones(len(pairs))
+        for i, (flight, seat_class) in enumerate(pairs):
+            seat_inventory = inventory.get((flight.id, seat_class))
+            # Flights without inventory keep a neutral factor
+            if seat_inventory and seat_inventory.total_seats:
+                ladder = self.fare_ladder(flight.id, seat_class, seat_inventory.total_seats)
+                factors[i] = ladder.factor(seat_inventory.available_seats)
+        return factors
+    
+    def compute_prices(self, pairs: List[Tuple[Flight, SeatClass]], db: Session) -> List[PricingResponse]:
+        """Vectorized pricing of (flight, seat class) pairs without cache or history"""
+        flights = [flight for flight, _ in pairs]
+        # One instant for the whole batch, so no price straddles a bucket or day boundary
+        now = self.clock.now()
+        
+        # One inventory query for the whole batch, plus bucket definitions for flights not seen yet
+        with self.metrics.stage("inventory"):
+            inventory = self.load_seat_inventory((flight.id for flight in flights), db)
+            self.fare_buckets.load((flight.id for flight in flights), db)
+        
+        with self.metrics.stage("factors"):
+            base_prices = np.array([
+                flight.base_price * self.seat_class_multipliers[seat_class] for flight, seat_class in pairs
+            ])
+            demand_factors = self.calculate_demand_factors(pairs, now)
+            
+            # Time factors depend only on the flight, so compute them once per distinct flight
+            positions = {}
+            flight_positions = [positions.setdefault(flight.id, len(positions)) for flight in flights]
+            distinct_flights = list({flight.id: flight for flight in flights}.values())
+            time_factors = self.calculate_time_factors(distinct_flights, now)[flight_positions]
+            seat_availability_factors = self.calculate_seat_availability_factors(pairs, inventory)
+            
+            current_prices = np.round(base_prices * demand_factors * time_factors * seat_availability_factors, 2)
+            # Open bucket per pair, which the quote's price hold is bound to
+            seat_inventories = [inventory.get((flight.id, seat_class)) for flight, seat_class in pairs]
+            fare_bases = [
+                self.fare_basis(flight.id, seat_class, row.available_seats, row.total_seats) if row else None
+                for (flight, seat_class), row in zip(pairs, seat_inventories)
+            ]
+        self.metrics.increment("prices_computed", len(pairs))
+        
+        return [
+            PricingResponse(
+                flight_id=flight.id,
+                seat_class=seat_class.value,
+                base_price=float(base_prices[i]),
+                current_price=float(current_prices[i]),
+                demand_factor=float(demand_factors[i]),
+                time_factor=float(time_factors[i]),
+                seat_availability_factor=float(seat_availability_factors[i]),
+                total_price=float(current_prices[i]),
+                priced_at=now,
+                fare_basis=fare_bases[i]
+            )
+            for i, (flight, seat_class) in enumerate(pairs)
+        ]
+    
+    def group_price(self, flight: Flight, seat_class: SeatClass, passengers: int, db: Session) -> PricingResponse:
+        """Price a party of seats, walking the fare bucket ladder as each seat is taken"""
+        seat_class = coerce_seat_class(seat_class)
+        
+        # Single inventory read for the whole party
+        with self.metrics.stage("inventory"):
+            seat_inventory = self.load_seat_inventory([flight.id], db).get((flight.id, seat_class))
+        if seat_inventory and seat_inventory.available_seats < passengers:
+            raise ValueError(f"Only {seat_inventory.available_seats} seats available in {seat_class.value}")
+        
+        now = self.clock.now()
+        with self.metrics.stage("factors"):
+            base_price = flight.base_price * self.seat_class_multipliers[seat_class]
+            demand_factor = float(self.calculate_demand_factors([(flight, seat_class)], now)[0])
+            time_factor = float(self.calculate_time_factors([flight], now)[0])
+            
+            # Seat k is sold with k seats of the party already gone, so later seats can open higher buckets
+            fare_basis = None
+            if seat_inventory and seat_inventory.total_seats:
+                ladder = self.fare_ladder(flight.id, seat_class, seat_inventory.total_seats, db)
+                seat_factors = ladder.factors(seat_inventory.available_seats, passengers)
+                fare_basis = ladder.basis(seat_inventory.available_seats, passengers)
+            else:
+                seat_factors = np.ones(passengers)
+            seat_prices = np.round(base_price * demand_factor * time_factor * seat_factors, 2)
+        
+        pricing = PricingResponse(
             flight_id=flight.id,
-            seat_class=seat_class,
+            seat_class=seat_class.value,
             base_price=base_price,
-            current_price=current_price,
+            current_price=float(seat_prices[0]),
             demand_factor=demand_factor,
             time_factor=time_factor,
-            seat_availability_factor=seat_availability_factor,
-            total_price=current_price
+            seat_availability_factor=float(seat_factors[0]),
+            total_price=round(float(seat_prices.sum()), 2),
+            priced_at=now,
+            passengers=passengers,
+            seat_prices=[float(price) for price in seat_prices],
+            fare_basis=fare_basis
         )
+        pricing.price_token = self.price_tokens.issue(pricing)
+        return pricing
     
-    def get_pricing_for_flights(self, flights: List[Flight], seat_class: SeatClass, db: Session) -> List[PricingResponse]:
-        """Get pricing for multiple flights"""
-        pricing_responses = []
-        for flight in flights:
-            pricing = self.calculate_dynamic_price(flight, seat_class, db)
-            pricing_responses.append(pricing)
-        return pricing_responses
+    def sell_group_price(self, flight: Flight, seat_class: SeatClass, passengers: int, db: Session) -> PricingResponse:
+        """Price a party that is being booked: computed fresh and recorded in history like sell_price"""
+        self.metrics.increment("sell_prices")
+        pricing = self.group_price(flight, seat_class, passengers, db)
+        self.record_history([self._history_row(pricing, pricing.priced_at)])
+        return pricing
+    
+    def describe_fare_buckets(self, flight: Flight, seat_class: SeatClass, db: Session) -> Dict:
+        """Fare buckets of a cabin with their caps, remaining seats and current fares"""
+        seat_class = coerce_seat_class(seat_class)
+        seat_inventory = self.load_seat_inventory([flight.id], db).get((flight.id, seat_class))
+        if not seat_inventory or not seat_inventory.total_seats:
+            raise ValueError("No seat inventory for the selected class")
+        
+        ladder = self.fare_ladder(flight.id, seat_class, seat_inventory.total_seats, db)
+        now = self.clock.now()
+        unit_fare = (
+            flight.base_price * self.seat_class_multipliers[seat_class]
+            * float(self.calculate_demand_factors([(flight, seat_class)], now)[0])
+            * float(self.calculate_time_factors([flight], now)[0])
+        )
+        open_bucket = ladder.open_bucket(seat_inventory.available_seats)
+        return {
+            "flight_id": flight.id,
+            "seat_class": seat_class.value,
+            "total_seats": seat_inventory.total_seats,
+            "available_seats": seat_inventory.available_seats,
+            "open_bucket": ladder.codes[open_bucket] if open_bucket is not None else None,
+            "buckets": ladder.describe(seat_inventory.available_seats, unit_fare)
+        }
+    
+    def reserve_seats(self, flight_id: int, seat_class: SeatClass, seats: int, db: Session) -> bool:
+        """Take seats from a cabin with one conditional UPDATE; False if fewer are left (does not commit)"""
+        seat_class = coerce_seat_class(seat_class)
+        now = datetime.utcnow()
+        
+        # The availability check and the decrement are one statement, so concurrent bookings cannot oversell
+        reserved = db.execute(
+            update(SeatInventory)
+            .where(
+                SeatInventory.flight_id == flight_id,
+                SeatInventory.seat_class == seat_class,
+                SeatInventory.available_seats >= seats
+            )
+            .values(
+                available_seats=SeatInventory.available_seats - seats,
+                booked_seats=SeatInventory.booked_seats + seats,
+                last_updated=now
+            )
+        ).rowcount == 1
+        
+        if reserved:
+            db.execute(
+                update(Flight)
+                .where(Flight.id == flight_id)
+                .values(available_seats=Flight.available_seats - seats, updated_at=now)
+            )
+        return reserved
+    
+    def release_seats(self, flight_id: int, seat_class: SeatClass, seats: int, db: Session) -> bool:
+        """Return booked seats to a cabin with one conditional UPDATE (does not commit)"""
+        seat_class = coerce_seat_class(seat_class)
+        now = datetime.utcnow()
+        
+        released = db.execute(
+            update(SeatInventory)
+            .where(
+                SeatInventory.flight_id == flight_id,
+                SeatInventory.seat_class == seat_class,
+                SeatInventory.booked_seats >= seats
+            )
+            .values(
+                available_seats=SeatInventory.available_seats + seats,
+                booked_seats=SeatInventory.booked_seats - seats,
+                last_updated=now
+            )
+        ).rowcount == 1
+        
+        if released:
+            db.execute(
+                update(Flight)
+                .where(Flight.id == flight_id)
+                .values(available_seats=Flight.available_seats + seats, updated_at=now)
+            )
+        return released
     
     def update_seat_inventory(self, flight_id: int, seat_class: SeatClass, seats_booked: int, db: Session):
         """Update seat inventory after booking"""
-        seat_inventory = db.query(SeatInventory).filter(
-            SeatInventory.flight_id == flight_id,
-            SeatInventory.seat_class == seat_class
-        ).first()
-        
-        if seat_inventory:
-            seat_inventory.available_seats -= seats_booked
-            seat_inventory.booked_seats += seats_booked
-            seat_inventory.last_updated = datetime.utcnow()
-            db.commit()
-    
-    def get_price_trend(self, flight_id: int, seat_class: SeatClass, db: Session, days: int = 7) -> List[Dict]:
+        seat_class = coerce_seat_class(seat_class)
+        if not run_in_transaction(db, lambda: self.reserve_seats(flight_id, seat_class, seats_booked, db)):
+            raise ValueError("No seats available for the selected class")
+        notify_inventory_change(flight_id, seat_class)
+    
+    def get_price_trend(self, flight_id: int, seat_class: SeatClass, db: Session, days: int = 7,
+                        resolution: str = "raw") -> List[Dict]:
         """Get price trend for a flight over time"""
-        since_date = datetime.utcnow() - timedelta(days=days)
+        seat_class = coerce_seat_class(seat_class)
+        since_date = self.clock.now() - timedelta(days=days)
+        
+        # Older history has been compacted into hourly and daily rollups
+        rollup_points = load_rollup_points(flight_id, seat_class, db, since_date)
+        
+        if resolution != "raw":
+            return self._get_aggregated_price_trend(flight_id, seat_class, db, since_date, resolution, rollup_points)
         
         pricing_history = db.query(PricingHistory).filter(
             PricingHistory.flight_id == flight_id,
@@ -154,6 +589,16 @@ class PricingEngine:
         ).order_by(PricingHistory.calculated_at).all()
         
         return [
+            {
+                "date": point["date"].isoformat(),
+                "price": point["price"],
+                "demand_factor": point["demand_factor"],
+                "time_factor": point["time_factor"],
+                "seat_availability_factor": point["seat_availability_factor"],
+                "resolution": point["resolution"]
+            }
+            for point in rollup_points
+        ] + [
             {
                 "date": ph.calculated_at.isoformat(),
                 "price": ph.price,
@@ -163,3 +608,82 @@ class PricingEngine:
             }
             for ph in pricing_history
         ]
+    
+    def _trend_bucket(self, resolution: str, db: Session):
+        """SQL expression truncating calculated_at to the start of its bucket"""
+        bucket_format, _ = TREND_RESOLUTIONS[resolution]
+        if db.get_bind().dialect.name == "sqlite":
+            return func.strftime(bucket_format, PricingHistory.calculated_at)
+        return func.date_format(PricingHistory.calculated_at, bucket_format)
+    
+    def _get_aggregated_price_trend(self, flight_id: int, seat_class: SeatClass, db: Session,
+                                    since_date: datetime, resolution: str, rollup_points: List[Dict]) -> List[Dict]:
+        """OHLC and average price per hour or day, aggregated in SQL and merged with rollups"""
+        if resolution not in TREND_RESOLUTIONS:
+            raise ValueError(f"Unsupported resolution: {resolution}")
+        _, parse_format = TREND_RESOLUTIONS[resolution]
+        
+        bucket = self._trend_bucket(resolution, db).label("bucket")
+        buckets = db.query(
+            bucket,
+            func.count(PricingHistory.id),
+            func.min(PricingHistory.price),
+            func.max(PricingHistory.price),
+            func.avg(PricingHistory.price),
+            func.avg(PricingHistory.demand_factor),
+            func.avg(PricingHistory.time_factor),
+            func.avg(PricingHistory.seat_availability_factor),
+            func.min(PricingHistory.calculated_at),
+            func.max(PricingHistory.calculated_at)
+        ).filter(
+            PricingHistory.flight_id == flight_id,
+            PricingHistory.seat_class == seat_class,
+            PricingHistory.calculated_at >= since_date
+        ).group_by(bucket).order_by(bucket).all()
+        
+        # Open and close are the earliest and latest rows of each bucket by calculated_at, with id only breaking
+        # ties: buffered and backfilled rows are not inserted in time order. One lookup for all of them
+        edge_times = {row[8] for row in buckets} | {row[9] for row in buckets}
+        edge_rows = db.query(PricingHistory.id, PricingHistory.calculated_at, PricingHistory.price).filter(
+            PricingHistory.flight_id == flight_id,
+            PricingHistory.seat_class == seat_class,
+            PricingHistory.calculated_at.in_(edge_times)
+        ).all() if edge_times else []
+        open_prices, close_prices = {}, {}
+        for edge in sorted(edge_rows, key=lambda edge: (edge.calculated_at, edge.id)):
+            edge_bucket = floor_to_resolution(edge.calculated_at, resolution)
+            open_prices.setdefault(edge_bucket, edge.price)
+            close_prices[edge_bucket] = edge.price
+        
+        raw_points = [
+            {
+                "date": bucket_start,
+                "price": row[4],
+                "open": open_prices.get(bucket_start),
+                "high": row[3],
+                "low": row[2],
+                "close": close_prices.get(bucket_start),
+                "samples": row[1],
+                "demand_factor": row[5],
+                "time_factor": row[6],
+                "seat_availability_factor": row[7],
+                "resolution": resolution
+            }
+            for bucket_start, row in ((datetime.strptime(row[0], parse_format), row) for row in buckets)
+        ]
+        
+        # Rollups are older than any raw row, so merging in this order keeps open/close chronological
+        merged = {}
+        for point in rollup_points + raw_points:
+            # Daily rollups cannot be split, so they stay day buckets at hourly resolution
+            point_resolution = "day" if point["resolution"] == "day" else resolution
+            key = floor_to_resolution(point["date"], point_resolution)
+            if key in merged:
+                merge_trend_points(merged[key], point)
+            else:
+                merged[key] = dict(point, date=key, resolution=point_resolution)
+        
+        return [
+            dict(point, date=point["date"].isoformat(), price=round(point["price"], 2))
+            for _, point in sorted(merged.items())
+        ]
@@ -0,0 +1,131 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+from sqlalchemy import insert
+from config_sqlite import SessionLocal, PricingHistory
+from services.pricing_metrics import pricing_metrics
+from config import (
+    PRICING_HISTORY_BUFFER_SIZE,
+    PRICING_HISTORY_BATCH_SIZE,
+    PRICING_HISTORY_FLUSH_SECONDS,
+    PRICING_HISTORY_SUBMIT_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+class PricingHistoryBuffer:
+    """Write-behind queue that persists pricing history rows in bulk"""
+    
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        max_size: int = PRICING_HISTORY_BUFFER_SIZE,
+        batch_size: int = PRICING_HISTORY_BATCH_SIZE,
+        flush_interval: float = PRICING_HISTORY_FLUSH_SECONDS,
+        submit_timeout: float = PRICING_HISTORY_SUBMIT_TIMEOUT
+    ):
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.submit_timeout = submit_timeout
+        
+        self._rows = deque()
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        
+        # Counters for monitoring
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+    
+    def start(self):
+        """Start the background flusher thread if it is not running"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="pricing-history-flusher", daemon=True)
+            self._thread.start()
+    
+    def submit(self, rows: List[Dict]) -> bool:
+        """Queue rows for writing; blocks briefly when full and drops them if no space frees up"""
+        if not rows:
+            return True
+        
+        deadline = time.monotonic() + self.submit_timeout
+        with self._not_full:
+            # Backpressure: wait for the flusher to make room
+            while len(self._rows) + len(rows) > self.max_size:
+                self._wakeup.set()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._not_full.wait(remaining):
+                    if len(self._rows) + len(rows) > self.max_size:
+                        self.dropped += len(rows)
+                        return False
+            
+            self._rows.extend(rows)
+            if len(self._rows) >= self.batch_size:
+                self._wakeup.set()
+        
+        if not self._stopping:
+            self.start()
+        return True
+    
+    def pending(self) -> int:
+        """Number of rows waiting to be written"""
+        with self._lock:
+            return len(self._rows)
+    
+    def flush(self) -> int:
+        """Write every queued row to the database in batches"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._not_full:
+                    batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+                    self._not_full.notify_all()
+                if not batch:
+                    return written
+                
+                db = self.session_factory()
+                try:
+                    with pricing_metrics.stage("history_flush"):
+                        db.execute(insert(PricingHistory), batch)
+                        db.commit()
+                    written += len(batch)
+                    self.written += len(batch)
+                except Exception:
+                    db.rollback()
+                    self.failed += len(batch)
+                    logger.exception("Failed to write %d pricing history rows", len(batch))
+                finally:
+                    db.close()
+    
+    def drain(self, timeout: Optional[float] = None) -> int:
+        """Stop the flusher thread and write out everything still queued"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        return self.flush()
+    
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+# Shared buffer used by every PricingEngine instance
+pricing_history_buffer = PricingHistoryBuffer()
+
+# Scripts and CLI jobs that price flights have no lifespan to drain the buffer, so flush it at exit too
+atexit.register(pricing_history_buffer.drain)
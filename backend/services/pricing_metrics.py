@@ -0,0 +1,146 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence
+from config import PRICING_SERVER_TIMING, PRICING_SERVER_TIMING_PATHS
+
+# Histogram bucket upper bounds in milliseconds
+DEFAULT_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Stage durations of the current request, filled in by PricingMetrics.stage when a request is being timed
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("pricing_request_timings", default=None)
+
+class StageHistogram:
+    """Fixed-bucket latency histogram for one pricing stage"""
+    
+    def __init__(self, buckets_ms: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.buckets_ms = list(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+    
+    def observe(self, duration_ms: float):
+        index = bisect.bisect_left(self.buckets_ms, duration_ms)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ms += duration_ms
+            self.max_ms = max(self.max_ms, duration_ms)
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for upper_ms, count in zip(self.buckets_ms + [self.max_ms], self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return round(min(upper_ms, self.max_ms), 3)
+        return round(self.max_ms, 3)
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = list(self.counts)
+            count, total_ms, max_ms = self.count, self.total_ms, self.max_ms
+        return {
+            "count": count,
+            "total_ms": round(total_ms, 3),
+            "mean_ms": round(total_ms / count, 3) if count else None,
+            "max_ms": round(max_ms, 3),
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": [
+                {"le": upper_ms, "count": bucket_count}
+                for upper_ms, bucket_count in zip(self.buckets_ms + ["+Inf"], counts)
+            ]
+        }
+
+class PricingMetrics:
+    """Per-stage timers and counters for the pricing path"""
+    
+    def __init__(self, buckets_ms: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self._stages: Dict[str, StageHistogram] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def _histogram(self, name: str) -> StageHistogram:
+        histogram = self._stages.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(name, StageHistogram(self.buckets_ms))
+        return histogram
+    
+    def observe(self, name: str, duration_ms: float):
+        """Record a stage duration, and add it to the current request's Server-Timing if one is being timed"""
+        self._histogram(name).observe(duration_ms)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + duration_ms
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block of the pricing path"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - started) * 1000)
+    
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stages = dict(self._stages)
+            counters = dict(self._counters)
+        return {
+            "stages": {name: histogram.snapshot() for name, histogram in sorted(stages.items())},
+            "counters": counters
+        }
+    
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+class ServerTimingMiddleware:
+    """Pure ASGI middleware adding a Server-Timing header with the pricing stage durations of a request"""
+    
+    def __init__(self, app, paths: Iterable[str] = PRICING_SERVER_TIMING_PATHS, enabled: bool = PRICING_SERVER_TIMING):
+        self.app = app
+        self.paths = tuple(paths)
+        self.enabled = enabled
+    
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+        
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                entries: List[str] = [f"{name};dur={duration:.3f}" for name, duration in timings.items()]
+                entries.append(f"total;dur={(time.perf_counter() - started) * 1000:.3f}")
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", ", ".join(entries).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+
+# Shared metrics so every engine and the history buffer report to one endpoint
+pricing_metrics = PricingMetrics()
@@ -0,0 +1,198 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from config_sqlite import SessionLocal, PricingHistory, PricingHistoryRollup, SeatClass
+from config import (
+    PRICING_HISTORY_RAW_RETENTION_DAYS,
+    PRICING_HISTORY_HOURLY_RETENTION_DAYS,
+    PRICING_HISTORY_COMPACTION_BATCH_SIZE,
+)
+
+FACTOR_KEYS = ("price", "demand_factor", "time_factor", "seat_availability_factor")
+
+def floor_to_resolution(moment: datetime, resolution: str) -> datetime:
+    """Truncate a timestamp to the start of its hour or day"""
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if resolution == "day":
+        moment = moment.replace(hour=0)
+    return moment
+
+def merge_trend_points(into: Dict, point: Dict) -> Dict:
+    """Merge a later aggregate into an earlier one covering the same bucket"""
+    total = into["samples"] + point["samples"]
+    for key in FACTOR_KEYS:
+        into[key] = (into[key] * into["samples"] + point[key] * point["samples"]) / total
+    into["high"] = max(into["high"], point["high"])
+    into["low"] = min(into["low"], point["low"])
+    into["close"] = point["close"]
+    into["samples"] = total
+    return into
+
+def rollup_to_point(rollup: PricingHistoryRollup) -> Dict:
+    """Trend point for a stored rollup row"""
+    return {
+        "date": rollup.bucket_start,
+        "price": rollup.avg_price,
+        "open": rollup.open_price,
+        "high": rollup.high_price,
+        "low": rollup.low_price,
+        "close": rollup.close_price,
+        "samples": rollup.samples,
+        "demand_factor": rollup.avg_demand_factor,
+        "time_factor": rollup.avg_time_factor,
+        "seat_availability_factor": rollup.avg_seat_availability_factor,
+        "resolution": rollup.resolution
+    }
+
+def load_rollup_points(flight_id: int, seat_class: SeatClass, db: Session, since_date: datetime) -> List[Dict]:
+    """Rollup trend points for a flight and class, oldest first"""
+    rollups = db.query(PricingHistoryRollup).filter(
+        PricingHistoryRollup.flight_id == flight_id,
+        PricingHistoryRollup.seat_class == seat_class,
+        PricingHistoryRollup.bucket_start >= since_date
+    ).order_by(PricingHistoryRollup.bucket_start).all()
+    return [rollup_to_point(rollup) for rollup in rollups]
+
+def _store_rollups(db: Session, resolution: str, points: Dict[Tuple[int, SeatClass, datetime], Dict]):
+    """Merge aggregated points into the rollup table for the given resolution"""
+    if not points:
+        return
+    
+    flight_ids = {flight_id for flight_id, _, _ in points}
+    bucket_starts = {bucket_start for _, _, bucket_start in points}
+    existing = {
+        (rollup.flight_id, rollup.seat_class, rollup.bucket_start): rollup
+        for rollup in db.query(PricingHistoryRollup).filter(
+            PricingHistoryRollup.resolution == resolution,
+            PricingHistoryRollup.flight_id.in_(flight_ids),
+            PricingHistoryRollup.bucket_start.in_(bucket_starts)
+        ).all()
+    }
+    
+    for (flight_id, seat_class, bucket_start), point in points.items():
+        rollup = existing.get((flight_id, seat_class, bucket_start))
+        if rollup is None:
+            rollup = PricingHistoryRollup(
+                flight_id=flight_id,
+                seat_class=seat_class,
+                resolution=resolution,
+                bucket_start=bucket_start
+            )
+            db.add(rollup)
+        else:
+            # Earlier batches of the same bucket were stored first
+            point = merge_trend_points(rollup_to_point(rollup), point)
+        
+        rollup.samples = point["samples"]
+        rollup.open_price = point["open"]
+        rollup.high_price = point["high"]
+        rollup.low_price = point["low"]
+        rollup.close_price = point["close"]
+        rollup.avg_price = point["price"]
+        rollup.avg_demand_factor = point["demand_factor"]
+        rollup.avg_time_factor = point["time_factor"]
+        rollup.avg_seat_availability_factor = point["seat_availability_factor"]
+
+def _aggregate(points: Iterable[Tuple[Tuple[int, SeatClass, datetime], Dict]]) -> Dict:
+    aggregated = {}
+    for key, point in points:
+        if key in aggregated:
+            merge_trend_points(aggregated[key], point)
+        else:
+            aggregated[key] = dict(point)
+    return aggregated
+
+def compact_raw_history(db: Session, cutoff: datetime, batch_size: int) -> int:
+    """Roll raw pricing history older than the cutoff into hourly rollups and delete it"""
+    compacted = 0
+    while True:
+        rows = db.query(
+            PricingHistory.id,
+            PricingHistory.flight_id,
+            PricingHistory.seat_class,
+            PricingHistory.calculated_at,
+            PricingHistory.price,
+            PricingHistory.demand_factor,
+            PricingHistory.time_factor,
+            PricingHistory.seat_availability_factor
+        ).filter(
+            PricingHistory.calculated_at < cutoff
+        ).order_by(PricingHistory.calculated_at, PricingHistory.id).limit(batch_size).all()
+        if not rows:
+            return compacted
+        
+        # Batches run oldest first (buffered and backfilled rows are not in id order), so each merge's
+        # close really is the later price
+        _store_rollups(db, "hour", _aggregate(
+            (
+                (row.flight_id, row.seat_class, floor_to_resolution(row.calculated_at, "hour")),
+                {
+                    "price": row.price,
+                    "open": row.price,
+                    "high": row.price,
+                    "low": row.price,
+                    "close": row.price,
+                    "samples": 1,
+                    "demand_factor": row.demand_factor,
+                    "time_factor": row.time_factor,
+                    "seat_availability_factor": row.seat_availability_factor
+                }
+            )
+            for row in rows
+        ))
+        db.query(PricingHistory).filter(
+            PricingHistory.id.in_([row.id for row in rows])
+        ).delete(synchronize_session="fetch")
+        db.commit()
+        compacted += len(rows)
+
+def compact_hourly_rollups(db: Session, cutoff: datetime, batch_size: int) -> int:
+    """Roll hourly rollups older than the cutoff into daily rollups and delete them"""
+    compacted = 0
+    while True:
+        rollups = db.query(PricingHistoryRollup).filter(
+            PricingHistoryRollup.resolution == "hour",
+            PricingHistoryRollup.bucket_start < cutoff
+        ).order_by(PricingHistoryRollup.bucket_start, PricingHistoryRollup.id).limit(batch_size).all()
+        if not rollups:
+            return compacted
+        
+        # Oldest first, so merges into an existing daily rollup keep open and close chronological
+        _store_rollups(db, "day", _aggregate(
+            (
+                (rollup.flight_id, rollup.seat_class, floor_to_resolution(rollup.bucket_start, "day")),
+                rollup_to_point(rollup)
+            )
+            for rollup in rollups
+        ))
+        db.query(PricingHistoryRollup).filter(
+            PricingHistoryRollup.id.in_([rollup.id for rollup in rollups])
+        ).delete(synchronize_session="fetch")
+        db.commit()
+        compacted += len(rollups)
+
+def compact_pricing_history(
+    db: Session,
+    raw_retention_days: int = PRICING_HISTORY_RAW_RETENTION_DAYS,
+    hourly_retention_days: int = PRICING_HISTORY_HOURLY_RETENTION_DAYS,
+    batch_size: int = PRICING_HISTORY_COMPACTION_BATCH_SIZE,
+    now: Optional[datetime] = None
+) -> Dict[str, int]:
+    """Apply the retention policy: raw rows become hourly rollups, old hourly rollups become daily ones"""
+    now = now or datetime.utcnow()
+    
+    # Cutoffs sit on bucket boundaries so a bucket never lives in two tiers
+    raw_cutoff = floor_to_resolution(now - timedelta(days=raw_retention_days), "hour")
+    hourly_cutoff = floor_to_resolution(now - timedelta(days=hourly_retention_days), "day")
+    
+    return {
+        "raw_rows_compacted": compact_raw_history(db, raw_cutoff, batch_size),
+        "hourly_rollups_compacted": compact_hourly_rollups(db, hourly_cutoff, batch_size)
+    }
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        print(compact_pricing_history(db))
+    finally:
+        db.close()
@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from models import PricingResponse, SeatClass
+from config import PRICING_QUOTE_CACHE_SIZE, PRICING_QUOTE_TTL_SECONDS
+
+class QuoteCache:
+    """Bounded LRU cache of price quotes per (flight, seat class) with a short TTL"""
+    
+    def __init__(self, max_size: int = PRICING_QUOTE_CACHE_SIZE, ttl: float = PRICING_QUOTE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, PricingResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        # Counters for monitoring
+        self.hits = 0
+        self.misses = 0
+    
+    def _key(self, flight_id: int, seat_class) -> Tuple[int, str]:
+        return (flight_id, getattr(seat_class, "value", seat_class))
+    
+    def get(self, flight_id: int, seat_class) -> Optional[PricingResponse]:
+        """Return a cached quote if it has not expired"""
+        key = self._key(flight_id, seat_class)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            expires_at, quote = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return quote.model_copy()
+    
+    def put(self, flight_id: int, seat_class, quote: PricingResponse, ttl: Optional[float] = None):
+        """Cache a quote, evicting the least recently used entries when full"""
+        if self.max_size <= 0:
+            return
+        
+        key = self._key(flight_id, seat_class)
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, quote.model_copy())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, flight_id: int, seat_class=None):
+        """Drop cached quotes for a flight, or for a single class on that flight"""
+        seat_classes = [seat_class] if seat_class is not None else list(SeatClass)
+        with self._lock:
+            for cls in seat_classes:
+                self._entries.pop(self._key(flight_id, cls), None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# Shared cache so inventory changes in any service invalidate every engine's quotes
+quote_cache = QuoteCache()
@@ -0,0 +1,226 @@
+import asyncio
+import multiprocessing
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from config_sqlite import Flight, SeatClass
+from services.pricing_engine import PricingEngine, coerce_seat_class, ladder_factors
+from config import PRICING_SIMULATION_WORKERS, PRICING_SIMULATION_RUNS_PER_WORKER
+
+# Smallest fare a simulated day can quote
+MIN_PRICE = 0.01
+
+class DemandArrivalModel:
+    """Poisson booking requests that ramp up towards departure, with price-elastic conversion"""
+    
+    def __init__(
+        self,
+        expected_requests: Optional[float] = None,
+        conversion_rate: float = 0.5,
+        price_elasticity: float = 1.2,
+        ramp_days: float = 14.0
+    ):
+        self.expected_requests = expected_requests  # Requests over the whole horizon, default twice capacity
+        self.conversion_rate = conversion_rate  # Share of requests that book at the reference fare
+        self.price_elasticity = price_elasticity
+        self.ramp_days = ramp_days  # Requests grow exponentially with this scale as departure nears
+    
+    def daily_request_rates(self, horizon_days: int, total_seats: int) -> np.ndarray:
+        """Expected requests for each day, indexed by days until departure"""
+        expected_requests = self.expected_requests if self.expected_requests is not None else 2.0 * total_seats
+        days = np.arange(horizon_days + 1)
+        weights = np.exp(-days / self.ramp_days) + 0.1
+        return expected_requests * weights / weights.sum()
+    
+    def to_params(self) -> Dict:
+        return {
+            "conversion_rate": self.conversion_rate,
+            "price_elasticity": self.price_elasticity,
+        }
+
+def _pool_context():
+    """Start workers from a clean server process; forking the threaded app could copy held locks into them"""
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+def _simulate_chunk(params: Dict, runs: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Simulate booking trajectories for a batch of runs; returns revenue and seats sold per run"""
+    rng = np.random.default_rng(seed)
+    total_seats = params["total_seats"]
+    remaining = np.full(runs, params["available_seats"], dtype=np.int64)
+    revenue = np.zeros(runs)
+    reference_price = params["reference_price"]
+    
+    # Walk the booking horizon from the furthest day down to departure day
+    for days_until_departure in range(params["horizon_days"], -1, -1):
+        time_factor = ladder_factors(
+            np.array([days_until_departure]), params["time_factor_ladder"], params["early_booking_factor"]
+        )[0]
+        availability_factors = params["seat_factors"][total_seats - remaining]
+        
+        # Each run is its own market scenario, so demand noise is drawn per run and day
+        noise = 1.0 + rng.uniform(-params["demand_fluctuation_range"], params["demand_fluctuation_range"], size=runs)
+        base_demand = params["base_demand"] * params["demand_curve"][min(days_until_departure, len(params["demand_curve"]) - 1)]
+        # A fare never rounds down to zero, which would make the elasticity term divide by it
+        prices = np.maximum(np.round(reference_price * base_demand * noise * time_factor * availability_factors, 2), MIN_PRICE)
+        
+        conversion = np.clip(
+            params["conversion_rate"] * (reference_price / prices) ** params["price_elasticity"], 0.0, 1.0
+        )
+        bookings = np.minimum(rng.poisson(params["daily_rates"][days_until_departure] * conversion), remaining)
+        
+        revenue += bookings * prices
+        remaining -= bookings
+    
+    return revenue, params["available_seats"] - remaining
+
+class RevenueSimulator:
+    """Monte Carlo simulation of a flight's booking horizon under the PricingEngine factor rules"""
+    
+    def __init__(
+        self,
+        pricing_engine: Optional[PricingEngine] = None,
+        max_workers: int = PRICING_SIMULATION_WORKERS,
+        runs_per_worker: int = PRICING_SIMULATION_RUNS_PER_WORKER
+    ):
+        self.pricing_engine = pricing_engine or PricingEngine()
+        self.max_workers = max_workers
+        self.runs_per_worker = runs_per_worker
+        
+        # Long-lived worker pool, started with the server instead of forked per request
+        self._pool: Optional[ProcessPoolExecutor] = None
+    
+    def start(self):
+        """Create the shared worker pool if it is not running"""
+        if self._pool is None and self.max_workers > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_pool_context())
+    
+    def stop(self):
+        """Shut the shared worker pool down"""
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+    
+    def build_params(self, flight: Flight, seat_class: SeatClass, demand_model: DemandArrivalModel,
+                     db: Session, horizon_days: Optional[int] = None) -> Dict:
+        """Plain-data simulation inputs, so they can be shipped to worker processes"""
+        engine = self.pricing_engine
+        seat_class = coerce_seat_class(seat_class)
+        
+        inventory = engine.load_seat_inventory([flight.id], db).get((flight.id, seat_class))
+        if not inventory or not inventory.total_seats:
+            raise ValueError("No seat inventory for the selected class")
+        
+        if horizon_days is None:
+            horizon_days = max((flight.departure_time - engine.clock.now()).days, 0)
+        
+        departure = flight.departure_time
+        return {
+            "horizon_days": horizon_days,
+            "total_seats": inventory.total_seats,
+            "available_seats": inventory.available_seats,
+            "reference_price": flight.base_price * engine.seat_class_multipliers[seat_class],
+            "base_demand": float(engine.demand_table[departure.weekday(), departure.hour]),
+            "demand_curve": self._demand_curve(flight),
+            "demand_fluctuation_range": engine.demand_fluctuation_range,
+            "time_factor_ladder": engine.time_factor_ladder,
+            "early_booking_factor": engine.early_booking_factor,
+            "seat_factors": engine.fare_ladder(flight.id, seat_class, inventory.total_seats, db).factor_by_sold,
+            "daily_rates": demand_model.daily_request_rates(horizon_days, inventory.total_seats),
+            **demand_model.to_params()
+        }
+    
+    def _demand_curve(self, flight: Flight) -> np.ndarray:
+        """Fitted per-day demand factors for the flight's route (flat when none are fitted)"""
+        curve = self.pricing_engine.demand_curves.curve(flight)
+        return curve if curve is not None else np.ones(1)
+    
+    def _chunks(self, runs: int, seed: Optional[int]) -> Tuple[List[int], List[int]]:
+        """Sizes and independent seeds of the chunks a simulation is split into"""
+        chunk_count = min(self.max_workers, max(1, -(-runs // self.runs_per_worker)))
+        chunk_sizes = [len(chunk) for chunk in np.array_split(np.arange(runs), chunk_count)]
+        seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(chunk_count)]
+        return chunk_sizes, seeds
+    
+    def _combine(self, results: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+        revenue = np.concatenate([chunk_revenue for chunk_revenue, _ in results])
+        seats_sold = np.concatenate([chunk_sold for _, chunk_sold in results])
+        return revenue, seats_sold
+    
+    def run(self, params: Dict, runs: int, seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Run the simulation, fanning chunks of runs out over a process pool when it is large"""
+        chunk_sizes, seeds = self._chunks(runs, seed)
+        
+        if len(chunk_sizes) == 1:
+            results = [_simulate_chunk(params, chunk_sizes[0], seeds[0])]
+        elif self._pool is not None:
+            results = list(self._pool.map(_simulate_chunk, [params] * len(chunk_sizes), chunk_sizes, seeds))
+        else:
+            # Scripts without a started pool get a temporary one
+            with ProcessPoolExecutor(max_workers=len(chunk_sizes), mp_context=_pool_context()) as pool:
+                results = list(pool.map(_simulate_chunk, [params] * len(chunk_sizes), chunk_sizes, seeds))
+        return self._combine(results)
+    
+    async def run_async(self, params: Dict, runs: int, seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """run() without blocking the event loop: chunks go to the shared pool, or to a thread without one"""
+        loop = asyncio.get_running_loop()
+        if self._pool is None:
+            return await loop.run_in_executor(None, self.run, params, runs, seed)
+        
+        chunk_sizes, seeds = self._chunks(runs, seed)
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self._pool, _simulate_chunk, params, chunk_size, chunk_seed)
+            for chunk_size, chunk_seed in zip(chunk_sizes, seeds)
+        ))
+        return self._combine(results)
+    
+    def simulate(self, flight: Flight, seat_class: SeatClass, demand_model: DemandArrivalModel, db: Session,
+                 runs: int = 2000, horizon_days: Optional[int] = None, seed: Optional[int] = None) -> Dict:
+        """Simulate the remaining booking horizon and summarize revenue and load factor"""
+        started = time.perf_counter()
+        params = self.build_params(flight, seat_class, demand_model, db, horizon_days)
+        revenue, seats_sold = self.run(params, runs, seed)
+        return self._report(flight, seat_class, params, runs, revenue, seats_sold, started)
+    
+    async def simulate_async(self, flight: Flight, seat_class: SeatClass, demand_model: DemandArrivalModel,
+                             db: Session, runs: int = 2000, horizon_days: Optional[int] = None,
+                             seed: Optional[int] = None) -> Dict:
+        """simulate() for request handlers: the runs are awaited instead of blocking the event loop"""
+        started = time.perf_counter()
+        params = self.build_params(flight, seat_class, demand_model, db, horizon_days)
+        revenue, seats_sold = await self.run_async(params, runs, seed)
+        return self._report(flight, seat_class, params, runs, revenue, seats_sold, started)
+    
+    def _report(self, flight: Flight, seat_class: SeatClass, params: Dict, runs: int, revenue: np.ndarray,
+                seats_sold: np.ndarray, started: float) -> Dict:
+        """Revenue and load factor distributions of a finished simulation"""
+        booked_before = params["total_seats"] - params["available_seats"]
+        load_factor = (booked_before + seats_sold) / params["total_seats"]
+        histogram, edges = np.histogram(load_factor, bins=10, range=(0.0, 1.0))
+        
+        return {
+            "flight_id": flight.id,
+            "seat_class": coerce_seat_class(seat_class).value,
+            "runs": runs,
+            "horizon_days": params["horizon_days"],
+            "revenue": self._summarize(revenue),
+            "load_factor": self._summarize(load_factor),
+            "load_factor_histogram": [
+                {"from": round(float(edges[i]), 2), "to": round(float(edges[i + 1]), 2), "runs": int(histogram[i])}
+                for i in range(len(histogram))
+            ],
+            "sell_out_probability": float(np.mean(params["available_seats"] - seats_sold == 0)),
+            "elapsed_seconds": round(time.perf_counter() - started, 3)
+        }
+    
+    def _summarize(self, values: np.ndarray) -> Dict[str, float]:
+        p5, p50, p95 = np.percentile(values, [5, 50, 95])
+        return {
+            "mean": round(float(values.mean()), 4),
+            "std": round(float(values.std()), 4),
+            "p5": round(float(p5), 4),
+            "p50": round(float(p50), 4),
+            "p95": round(float(p95), 4)
+        }
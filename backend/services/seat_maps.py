@@ -0,0 +1,303 @@
+import re
+import secrets
+import threading
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from config_sqlite import Booking, BookingStatus, SeatInventory, SeatMap, SeatClass
+from services.transactions import TransactionConflict
+
+# Seat letters of one row per cabin; a space marks the aisle
+CABIN_LAYOUTS = {
+    SeatClass.ECONOMY: "ABC DEF",
+    SeatClass.PREMIUM_ECONOMY: "AB CD",
+    SeatClass.BUSINESS: "AB CD",
+    SeatClass.FIRST: "A B",
+}
+
+SEAT_NUMBER_PATTERN = re.compile(r"^(\d+)([A-Z])$")
+
+def new_version() -> int:
+    return secrets.randbits(62)
+
+class CabinLayout:
+    """Seat numbering of a cabin plus per-seat row, block and window/aisle arrays in bitmap order"""
+    
+    def __init__(self, layout: str, total_seats: int):
+        self.layout = layout
+        self.letters = layout.replace(" ", "")
+        self.width = len(self.letters)
+        self.total_seats = total_seats
+        
+        blocks = layout.split(" ")
+        block_of_column = np.concatenate([np.full(len(block), i) for i, block in enumerate(blocks)])
+        block_ends = np.cumsum([len(block) for block in blocks])
+        aisle_columns = [column for end in block_ends[:-1] for column in (end - 1, end)]
+        
+        seats = np.arange(total_seats)
+        columns = seats % self.width
+        self.row_of_seat = seats // self.width
+        # Seats in the same block of the same row sit side by side with no aisle between them
+        self.block_of_seat = self.row_of_seat * len(blocks) + block_of_column[columns]
+        self.preference_masks = {
+            "window": np.isin(columns, [0, self.width - 1]),
+            "aisle": np.isin(columns, aisle_columns),
+        }
+    
+    def seat_number(self, index: int) -> str:
+        return f"{index // self.width + 1}{self.letters[index % self.width]}"
+    
+    def seat_index(self, seat_number: Optional[str]) -> Optional[int]:
+        """Bitmap index of a seat number, or None if it is not a seat of this cabin"""
+        match = SEAT_NUMBER_PATTERN.match((seat_number or "").strip().upper())
+        if not match or match.group(2) not in self.letters:
+            return None
+        index = (int(match.group(1)) - 1) * self.width + self.letters.index(match.group(2))
+        return index if 0 <= index < self.total_seats else None
+    
+    def find_seats(self, occupied: np.ndarray, count: int, preference: Optional[str] = None) -> List[int]:
+        """Free seats for a party: side by side if possible, then in one row, then the first free seats"""
+        free = ~occupied
+        if count == 1 and preference in self.preference_masks:
+            preferred = np.flatnonzero(free & self.preference_masks[preference])
+            if len(preferred):
+                return [int(preferred[0])]
+        
+        if 1 < count <= self.width and count <= len(free):
+            # Runs of count free seats from each start position, via a cumulative sum
+            free_before = np.concatenate([[0], np.cumsum(free)])
+            run_free = free_before[count:] - free_before[:-count] == count
+            for same_group in (self.block_of_seat, self.row_of_seat):
+                starts = np.flatnonzero(run_free & (same_group[:len(run_free)] == same_group[count - 1:]))
+                if len(starts):
+                    return list(range(int(starts[0]), int(starts[0]) + count))
+        
+        return [int(index) for index in np.flatnonzero(free)[:count]]
+
+class SeatMapState:
+    """Occupancy bitmap of one cabin as last read or written, with the version it was stored under"""
+    
+    __slots__ = ("total_seats", "bitmap", "version")
+    
+    def __init__(self, total_seats: int, bitmap: bytes, version: Optional[int]):
+        self.total_seats = total_seats
+        self.bitmap = bytearray(bitmap)
+        self.version = version
+    
+    @classmethod
+    def from_occupied(cls, occupied: np.ndarray, version: Optional[int]) -> "SeatMapState":
+        return cls(len(occupied), np.packbits(occupied, bitorder="little").tobytes(), version)
+    
+    def occupied(self) -> np.ndarray:
+        """Bitmap unpacked to one bool per seat"""
+        bits = np.unpackbits(np.frombuffer(bytes(self.bitmap), dtype=np.uint8), bitorder="little")
+        return bits[:self.total_seats].astype(bool)
+
+class SeatMapStore:
+    """Per-flight, per-class seat bitmaps, loaded lazily and written with compare-and-set on the version"""
+    
+    def __init__(self, layouts: Dict[SeatClass, str] = CABIN_LAYOUTS):
+        self.layouts = layouts
+        self._states: Dict[Tuple[int, SeatClass], SeatMapState] = {}
+        self._layouts: Dict[Tuple[SeatClass, int], CabinLayout] = {}
+        self._lock = threading.Lock()
+    
+    def layout(self, seat_class: SeatClass, total_seats: int) -> CabinLayout:
+        """Layout for a cabin size, shared by every flight with that cabin"""
+        key = (seat_class, total_seats)
+        layout = self._layouts.get(key)
+        if layout is None:
+            layout = CabinLayout(self.layouts[seat_class], total_seats)
+            with self._lock:
+                self._layouts[key] = layout
+        return layout
+    
+    def _booked_occupancy(self, flight_id: int, seat_class: SeatClass, inventory: SeatInventory,
+                          db: Session) -> np.ndarray:
+        """Occupancy rebuilt from the seats held by live bookings"""
+        layout = self.layout(seat_class, inventory.total_seats)
+        occupied = np.zeros(inventory.total_seats, dtype=bool)
+        seat_numbers = db.query(Booking.seat_number).filter(
+            Booking.flight_id == flight_id,
+            Booking.seat_class == seat_class,
+            Booking.status.in_([BookingStatus.PENDING, BookingStatus.CONFIRMED])
+        ).all()
+        for (seat_number,) in seat_numbers:
+            index = layout.seat_index(seat_number)
+            if index is not None:
+                occupied[index] = True
+        
+        # Seats sold without a usable seat number (or sharing one) are set aside so free seats match availability
+        missing = inventory.total_seats - inventory.available_seats - int(occupied.sum())
+        if missing > 0:
+            occupied[np.flatnonzero(~occupied)[:missing]] = True
+        return occupied
+    
+    def load(self, flight_id: int, seat_class: SeatClass, db: Session, create: bool = True) -> Optional[SeatMapState]:
+        """Read a cabin's seat map, creating it from inventory and existing bookings on first use"""
+        inventory = db.query(SeatInventory).filter(
+            SeatInventory.flight_id == flight_id,
+            SeatInventory.seat_class == seat_class
+        ).first()
+        if not inventory:
+            return None
+        
+        row = db.query(SeatMap).filter(
+            SeatMap.flight_id == flight_id,
+            SeatMap.seat_class == seat_class
+        ).populate_existing().first()
+        if row is None:
+            state = SeatMapState.from_occupied(self._booked_occupancy(flight_id, seat_class, inventory, db), None)
+            if not create:
+                return state
+            row = self._create(flight_id, seat_class, state, db)
+        state = SeatMapState(row.total_seats, row.occupied, row.version)
+        
+        # A resized cabin keeps its assigned seats; the new size is stored with the next write
+        if state.total_seats != inventory.total_seats:
+            occupied = np.zeros(inventory.total_seats, dtype=bool)
+            kept = min(state.total_seats, inventory.total_seats)
+            occupied[:kept] = state.occupied()[:kept]
+            state = SeatMapState.from_occupied(occupied, state.version)
+        
+        with self._lock:
+            self._states[(flight_id, seat_class)] = state
+        return state
+    
+    def _create(self, flight_id: int, seat_class: SeatClass, state: SeatMapState, db: Session) -> SeatMap:
+        row = SeatMap(
+            flight_id=flight_id,
+            seat_class=seat_class,
+            total_seats=state.total_seats,
+            occupied=bytes(state.bitmap),
+            version=new_version()
+        )
+        try:
+            with db.begin_nested():
+                db.add(row)
+        except IntegrityError:
+            # Another booking created it first
+            row = db.query(SeatMap).filter(SeatMap.flight_id == flight_id, SeatMap.seat_class == seat_class).one()
+        return row
+    
+    def _state(self, flight_id: int, seat_class: SeatClass, db: Session, refresh: bool,
+               create: bool = True) -> SeatMapState:
+        state = None if refresh else self._states.get((flight_id, seat_class))
+        if state is None:
+            state = self.load(flight_id, seat_class, db, create)
+        if state is None:
+            raise ValueError("No seat inventory for the selected class")
+        return state
+    
+    def _write(self, flight_id: int, seat_class: SeatClass, state: SeatMapState, occupied: np.ndarray,
+               db: Session) -> bool:
+        """Store a new bitmap if nobody else wrote since state was read (does not commit)"""
+        written = SeatMapState.from_occupied(occupied, new_version())
+        updated = db.execute(
+            update(SeatMap)
+            .where(
+                SeatMap.flight_id == flight_id,
+                SeatMap.seat_class == seat_class,
+                SeatMap.version == state.version
+            )
+            .values(
+                occupied=bytes(written.bitmap),
+                total_seats=written.total_seats,
+                version=written.version,
+                updated_at=datetime.utcnow()
+            )
+        ).rowcount == 1
+        
+        # The token is new, so if this transaction rolls back the cached state simply fails its next compare-and-set
+        if updated:
+            with self._lock:
+                self._states[(flight_id, seat_class)] = written
+        return updated
+    
+    def allocate(self, flight_id: int, seat_class: SeatClass, count: int, db: Session,
+                 preference: Optional[str] = None, seat_numbers: Optional[Sequence[str]] = None) -> List[str]:
+        """Assign count seats (or the requested seat numbers) within the caller's transaction, before inventory is taken"""
+        for refresh in (False, True):
+            state = self._state(flight_id, seat_class, db, refresh)
+            layout = self.layout(seat_class, state.total_seats)
+            occupied = state.occupied()
+            
+            # A cached map may be stale, so only a freshly read one can turn a request down
+            if seat_numbers:
+                indices = [layout.seat_index(seat_number) for seat_number in seat_numbers]
+                taken = [
+                    seat_number for seat_number, index in zip(seat_numbers, indices)
+                    if index is None or occupied[index] or indices.count(index) > 1
+                ]
+                if taken:
+                    if not refresh:
+                        continue
+                    raise ValueError(f"Seat {taken[0]} is not available")
+            else:
+                indices = layout.find_seats(occupied, count, preference)
+                if len(indices) < count:
+                    if not refresh:
+                        continue
+                    raise ValueError("Not enough free seats in the selected class")
+            
+            occupied[indices] = True
+            if self._write(flight_id, seat_class, state, occupied, db):
+                return [layout.seat_number(index) for index in indices]
+        raise TransactionConflict("Seat map changed while allocating")
+    
+    def release(self, flight_id: int, seat_class: SeatClass, seat_numbers: Sequence[str], db: Session):
+        """Free seats within the caller's transaction, after inventory is returned"""
+        for refresh in (False, True):
+            # A cabin without a stored map is rebuilt from bookings and inventory on first use anyway
+            state = self._state(flight_id, seat_class, db, refresh, create=False)
+            if state.version is None:
+                return
+            layout = self.layout(seat_class, state.total_seats)
+            indices = [index for index in map(layout.seat_index, seat_numbers) if index is not None]
+            if not indices:
+                return
+            
+            occupied = state.occupied()
+            occupied[indices] = False
+            if self._write(flight_id, seat_class, state, occupied, db):
+                return
+        raise TransactionConflict("Seat map changed while releasing")
+    
+    def describe(self, flight_id: int, seat_class: SeatClass, db: Session) -> Optional[Dict]:
+        """Current seat map of a cabin with window and aisle flags, read from the database"""
+        state = self.load(flight_id, seat_class, db, create=False)
+        if state is None:
+            return None
+        
+        layout = self.layout(seat_class, state.total_seats)
+        occupied = state.occupied()
+        window = layout.preference_masks["window"]
+        aisle = layout.preference_masks["aisle"]
+        return {
+            "flight_id": flight_id,
+            "seat_class": seat_class.value,
+            "layout": layout.layout,
+            "total_seats": state.total_seats,
+            "free_seats": int((~occupied).sum()),
+            "seats": [
+                {
+                    "seat_number": layout.seat_number(index),
+                    "occupied": bool(occupied[index]),
+                    "window": bool(window[index]),
+                    "aisle": bool(aisle[index])
+                }
+                for index in range(state.total_seats)
+            ]
+        }
+    
+    def invalidate(self, flight_id: int, seat_class: Optional[SeatClass] = None):
+        """Forget cached seat maps so the next allocation reads them again"""
+        with self._lock:
+            for cabin in [seat_class] if seat_class is not None else list(SeatClass):
+                self._states.pop((flight_id, cabin), None)
+
+# Shared store; every write goes through compare-and-set, so a stale cache only costs one extra read
+seat_map_store = SeatMapStore()
@@ -0,0 +1,57 @@
+import logging
+import random
+import time
+from typing import Callable, TypeVar
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from config import INVENTORY_UPDATE_RETRIES, INVENTORY_UPDATE_BACKOFF_SECONDS, INVENTORY_UPDATE_MAX_BACKOFF_SECONDS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Driver errors worth retrying: SQLite busy/locked, MySQL lock wait timeout (1205) and deadlock (1213),
+# PostgreSQL serialization failure (40001) and deadlock (40P01)
+RETRYABLE_ERROR_CODES = {1205, 1213, "1205", "1213", "40001", "40P01"}
+RETRYABLE_ERROR_MESSAGES = ("database is locked", "database table is locked", "database is busy")
+
+class TransactionConflict(Exception):
+    """Raised by work that lost an optimistic compare-and-set, so the whole transaction is retried"""
+
+def backoff_delay(attempt: int, base: float = INVENTORY_UPDATE_BACKOFF_SECONDS,
+                  cap: float = INVENTORY_UPDATE_MAX_BACKOFF_SECONDS) -> float:
+    """Exponential backoff with full jitter, capped so a retry never waits longer than cap"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def is_retryable(error: OperationalError) -> bool:
+    """Whether a driver error is a lock timeout, deadlock or serialization failure rather than e.g. a lost connection"""
+    orig = error.orig
+    codes = {getattr(orig, "pgcode", None), getattr(orig, "sqlstate", None)}
+    args = getattr(orig, "args", ())
+    if args:
+        codes.add(args[0])
+    if codes & RETRYABLE_ERROR_CODES:
+        return True
+    message = str(orig).lower()
+    return any(text in message for text in RETRYABLE_ERROR_MESSAGES)
+
+def run_in_transaction(db: Session, work: Callable[[], T], retries: int = INVENTORY_UPDATE_RETRIES) -> T:
+    """Run work() and commit, retrying the whole transaction on lock timeouts, deadlocks and lost compare-and-sets"""
+    # work builds everything it writes itself, since each retry starts from a rolled back session
+    attempt = 0
+    while True:
+        try:
+            result = work()
+            db.commit()
+            return result
+        except (OperationalError, TransactionConflict) as e:
+            db.rollback()
+            if attempt >= retries or (isinstance(e, OperationalError) and not is_retryable(e)):
+                raise
+            logger.warning("Transaction conflict, retrying (attempt %d of %d)", attempt + 1, retries)
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+        except Exception:
+            # Anything else (sold out, duplicate keys, ...) is for the caller to handle
+            db.rollback()
+            raise
@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_sqlite import Airline, Airport, Base, Flight, FlightStatus, SeatClass, SeatInventory, SessionLocal
+from services.booking_ids import SequenceBlockAllocator, booking_id_generator
+from services.demand_curves import demand_curve_store
+from services.fare_buckets import fare_bucket_store
+from services.pricing_engine import notify_inventory_change
+from services.seat_maps import seat_map_store
+
+# Every session the app opens goes to a scratch database instead of the checked-in flight_booking.db
+scratch = tempfile.mkdtemp(prefix="flight-booking-tests-")
+engine = create_engine(f"sqlite:///{os.path.join(scratch, 'flight_booking.db')}", connect_args={"check_same_thread": False})
+SessionLocal.configure(bind=engine)
+
+# Seats per class of every flight; flight ids 1, 4, 7 and 10 start with only a tenth of them free
+CABINS = [(SeatClass.ECONOMY, 120), (SeatClass.PREMIUM_ECONOMY, 40), (SeatClass.BUSINESS, 30), (SeatClass.FIRST, 10)]
+FLIGHT_COUNT = 12
+
+@pytest.fixture(scope="session", autouse=True)
+def workdir():
+    """The SQLite app serves ./frontend, so tests run from the scratch directory"""
+    previous = os.getcwd()
+    os.chdir(scratch)
+    os.makedirs("frontend", exist_ok=True)
+    yield
+    os.chdir(previous)
+
+@pytest.fixture(autouse=True)
+def seeded(workdir):
+    """Fresh schema with two airports, one airline and FLIGHT_COUNT flights over the next days"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        origin = Airport(code="DEL", name="Delhi", city="Delhi", country="IN", timezone="Asia/Kolkata")
+        destination = Airport(code="BOM", name="Mumbai", city="Mumbai", country="IN", timezone="Asia/Kolkata")
+        airline = Airline(code="AI", name="Air India")
+        db.add_all([origin, destination, airline])
+        db.commit()
+        
+        now = datetime.utcnow()
+        for i in range(FLIGHT_COUNT):
+            departure = (now + timedelta(days=i % 4 + 1)).replace(hour=6 + i, minute=0, second=0, microsecond=0)
+            flight = Flight(
+                flight_number=f"AI{100 + i}", airline_id=airline.id,
+                departure_airport_id=origin.id, arrival_airport_id=destination.id,
+                departure_time=departure, arrival_time=departure + timedelta(hours=2), duration_minutes=120,
+                status=FlightStatus.SCHEDULED, base_price=5000 + 100 * i, total_seats=200, available_seats=200
+            )
+            db.add(flight)
+            db.flush()
+            for seat_class, seats in CABINS:
+                available = seats if i % 3 else max(seats // 10, 1)
+                db.add(SeatInventory(flight_id=flight.id, seat_class=seat_class, total_seats=seats,
+                                     available_seats=available, booked_seats=0))
+        db.commit()
+    finally:
+        db.close()
+    
+    # Shared caches are keyed by flight id, which the new schema reuses
+    for flight_id in range(1, FLIGHT_COUNT + 1):
+        notify_inventory_change(flight_id)
+        seat_map_store.invalidate(flight_id)
+        fare_bucket_store.invalidate(flight_id)
+    # Curves fitted by a previous test belong to the old schema
+    demand_curve_store.load()
+    # A block reserved from the previous database would overlap the new sequence
+    booking_id_generator.allocator = SequenceBlockAllocator("booking")
+    yield
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def client():
+    """Client for the SQLite app; the lifespan (snapshot refresher, history flusher) is not started"""
+    from fastapi.testclient import TestClient
+    import main_sqlite
+    return TestClient(main_sqlite.app)
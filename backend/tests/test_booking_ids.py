@@ -0,0 +1,84 @@
+import pytest
+
+from config import DEFAULT_SECRET_KEY
+from config_sqlite import Booking, BookingSequence, BookingStatus, InstanceSecret, SeatClass
+from models import BookingCreate, GroupBookingCreate, GroupPassenger
+from services.booking_ids import (
+    PNR_LENGTH,
+    BookingIdGenerator,
+    FeistelPermutation,
+    SequenceBlockAllocator,
+    booking_id_generator,
+    encode_base36,
+)
+from services.booking_service import BookingService
+
+def test_feistel_permutation_is_a_bijection():
+    permutation = FeistelPermutation(b"secret", 1000)
+    assert sorted(permutation.permute(value) for value in range(1000)) == list(range(1000))
+    with pytest.raises(ValueError):
+        permutation.permute(1000)
+
+def test_identifiers_are_unique_and_keyed():
+    generator = BookingIdGenerator(allocator=SequenceBlockAllocator("unused"), secret="one")
+    identifiers = [generator.identifiers(value) for value in range(20000)]
+    pnrs = {pnr for pnr, _ in identifiers}
+    references = {reference for _, reference in identifiers}
+    assert len(pnrs) == len(references) == 20000
+    assert all(len(pnr) == PNR_LENGTH and pnr.isalnum() and pnr == pnr.upper() for pnr in pnrs)
+    
+    other = BookingIdGenerator(allocator=SequenceBlockAllocator("unused"), secret="two")
+    assert other.identifiers(0) != generator.identifiers(0)
+
+def test_blocks_are_reserved_from_the_database(db):
+    first = SequenceBlockAllocator("booking", block_size=3)
+    second = SequenceBlockAllocator("booking", block_size=3)
+    values = [first.next(), second.next(), first.next(), first.next(), first.next(), second.next()]
+    assert values == [0, 3, 1, 2, 6, 4]
+    assert db.query(BookingSequence.next_value).filter_by(name="booking").scalar() == 9
+
+def test_bookings_across_a_block_boundary(db, monkeypatch):
+    # Identifiers are drawn before the booking transaction: reserving a block inside it would wait on
+    # the booking's own SQLite write lock until "database is locked"
+    monkeypatch.setattr(booking_id_generator, "allocator", SequenceBlockAllocator("booking", block_size=2))
+    service = BookingService()
+    
+    pnrs = [
+        service.create_booking(BookingCreate(
+            flight_id=2, passenger_name="A", passenger_email="a@example.com", passenger_phone="1", seat_class="economy"
+        ), db).pnr
+        for _ in range(5)
+    ]
+    group = service.create_group_booking(GroupBookingCreate(
+        flight_id=2, seat_class="economy",
+        passengers=[GroupPassenger(passenger_name=f"P{i}", passenger_email="g@example.com", passenger_phone="1") for i in range(3)]
+    ), db)
+    pnrs += [confirmation.pnr for confirmation in group.bookings]
+    
+    assert len(set(pnrs)) == 8
+    assert db.query(Booking).count() == 8
+    assert db.query(BookingSequence.next_value).filter_by(name="booking").scalar() == 8
+
+def test_placeholder_secret_keys_identifiers_from_the_database(db):
+    generator = BookingIdGenerator(allocator=SequenceBlockAllocator("unused"), secret=DEFAULT_SECRET_KEY)
+    other_process = BookingIdGenerator(allocator=SequenceBlockAllocator("unused"), secret=DEFAULT_SECRET_KEY)
+    # The placeholder itself must never be the key, or anyone could enumerate PNRs from permute(0) on
+    public_pnr = encode_base36(FeistelPermutation(f"pnr:{DEFAULT_SECRET_KEY}".encode(), 36 ** PNR_LENGTH).permute(0), PNR_LENGTH)
+    
+    assert generator.identifiers(0) == other_process.identifiers(0)
+    assert generator.identifiers(0)[0] != public_pnr
+    assert db.query(InstanceSecret).count() == 1
+
+def test_legacy_pnr_collision_draws_the_next_value(db, monkeypatch):
+    monkeypatch.setattr(booking_id_generator, "allocator", SequenceBlockAllocator("booking", block_size=10))
+    legacy_pnr, _ = booking_id_generator.identifiers(0)
+    db.add(Booking(pnr=legacy_pnr, flight_id=3, passenger_name="Legacy", passenger_email="l@example.com",
+                   passenger_phone="1", seat_class=SeatClass.ECONOMY, price_paid=100.0,
+                   status=BookingStatus.CONFIRMED, booking_reference="LEGACY0001"))
+    db.commit()
+    
+    confirmation = BookingService().create_booking(BookingCreate(
+        flight_id=2, passenger_name="A", passenger_email="a@example.com", passenger_phone="1", seat_class="economy"
+    ), db)
+    assert confirmation.pnr == booking_id_generator.identifiers(1)[0]
+    assert db.query(Booking).count() == 2
@@ -0,0 +1,135 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
+
+from config_sqlite import Booking, SeatClass, SeatInventory, SeatMap, SessionLocal
+from models import BookingCreate
+from services.booking_service import BookingService
+from services.seat_maps import SeatMapState, seat_map_store
+from services.transactions import TransactionConflict, is_retryable, run_in_transaction
+
+def booking(flight_id=2, seat_class="first", **fields) -> BookingCreate:
+    return BookingCreate(flight_id=flight_id, passenger_name="A", passenger_email="a@example.com",
+                         passenger_phone="1", seat_class=seat_class, **fields)
+
+def available(db, flight_id, seat_class):
+    db.expire_all()
+    return db.query(SeatInventory).filter_by(flight_id=flight_id, seat_class=seat_class).one().available_seats
+
+def book(data: BookingCreate) -> str:
+    db = SessionLocal()
+    try:
+        return BookingService().create_booking(data, db).pnr
+    except ValueError as e:
+        return f"error: {e}"
+    finally:
+        db.close()
+
+def test_concurrent_bookings_never_oversell(db):
+    # Flight 2 has 10 first class seats; every booking races on the conditional seat UPDATE
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(book, [booking() for _ in range(16)]))
+    
+    pnrs = [result for result in results if not result.startswith("error")]
+    assert len(pnrs) == len(set(pnrs)) == 10
+    assert available(db, 2, SeatClass.FIRST) == 0
+    
+    seats = [row.seat_number for row in db.query(Booking).filter_by(flight_id=2)]
+    assert len(seats) == len(set(seats)) == 10
+
+def test_sold_out_booking_is_rejected(client):
+    # Flight 1 starts with a single first class seat
+    first = client.post("/api/bookings/", json=booking(flight_id=1).model_dump(mode="json"))
+    second = client.post("/api/bookings/", json=booking(flight_id=1).model_dump(mode="json"))
+    assert first.status_code == 200
+    assert second.status_code == 400
+
+def test_cancel_releases_the_seat_once(db):
+    service = BookingService()
+    pnr = service.create_booking(booking(), db).pnr
+    assert available(db, 2, SeatClass.FIRST) == 9
+    
+    assert service.cancel_booking(pnr, db)
+    assert not service.cancel_booking(pnr, db)
+    assert available(db, 2, SeatClass.FIRST) == 10
+
+def test_requested_seat_is_never_double_assigned(db):
+    service = BookingService()
+    assert service.create_booking(booking(seat_number="1A"), db).seat_number == "1A"
+    with pytest.raises(ValueError, match="Seat 1A is not available"):
+        service.create_booking(booking(seat_number="1A"), db)
+    assert available(db, 2, SeatClass.FIRST) == 9
+
+def test_seat_map_rereads_after_a_lost_compare_and_set(db):
+    service = BookingService()
+    service.create_booking(booking(), db)
+    
+    # Another process takes seat 1B behind the cached map's back
+    state = seat_map_store.load(2, SeatClass.FIRST, db)
+    layout = seat_map_store.layout(SeatClass.FIRST, state.total_seats)
+    occupied = state.occupied()
+    occupied[layout.seat_index("1B")] = True
+    db.execute(
+        update(SeatMap)
+        .where(SeatMap.flight_id == 2, SeatMap.seat_class == SeatClass.FIRST)
+        .values(occupied=bytes(SeatMapState.from_occupied(occupied, state.version + 1).bitmap), version=state.version + 1)
+    )
+    db.commit()
+    seat_map_store._states[(2, SeatClass.FIRST)] = state
+    
+    # The stale version loses its compare-and-set, so the map is re-read and 1B stays taken
+    seats = seat_map_store.allocate(2, SeatClass.FIRST, 1, db)
+    db.commit()
+    assert seats != ["1B"]
+    assert layout.seat_index(seats[0]) not in (layout.seat_index("1A"), layout.seat_index("1B"))
+
+class FakeDriverError(Exception):
+    pass
+
+def operational_error(*args, **attributes) -> OperationalError:
+    orig = FakeDriverError(*args)
+    for name, value in attributes.items():
+        setattr(orig, name, value)
+    return OperationalError("UPDATE seat_inventory", {}, orig)
+
+@pytest.mark.parametrize("error", [
+    operational_error("database is locked"),
+    operational_error(1205, "Lock wait timeout exceeded; try restarting transaction"),
+    operational_error(1213, "Deadlock found when trying to get lock; try restarting transaction"),
+    operational_error("could not serialize access", pgcode="40001"),
+    operational_error("deadlock detected", pgcode="40P01"),
+])
+def test_lock_and_deadlock_errors_are_retryable(error):
+    assert is_retryable(error)
+
+@pytest.mark.parametrize("error", [
+    operational_error("no such table: bookings"),
+    operational_error(2013, "Lost connection to MySQL server during query"),
+    operational_error("server closed the connection unexpectedly", pgcode="08006"),
+])
+def test_other_operational_errors_are_not_retried(error):
+    assert not is_retryable(error)
+
+def test_run_in_transaction_retries_only_conflicts(db, monkeypatch):
+    monkeypatch.setattr("services.transactions.time.sleep", lambda seconds: None)
+    
+    attempts = []
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise operational_error("database is locked")
+        if len(attempts) == 2:
+            raise TransactionConflict("lost compare-and-set")
+        return "done"
+    assert run_in_transaction(db, flaky) == "done"
+    assert len(attempts) == 3
+    
+    attempts.clear()
+    def broken():
+        attempts.append(1)
+        raise operational_error("no such table: bookings")
+    with pytest.raises(OperationalError):
+        run_in_transaction(db, broken)
+    assert len(attempts) == 1
@@ -0,0 +1,46 @@
+import itertools
+from datetime import timedelta
+
+import pytest
+
+from config import PRICING_DEMAND_CURVE_PRIOR as PRIOR
+from config_sqlite import Booking, BookingStatus, Flight, FlightStatus, SeatClass
+from services.demand_curve_fit import refit_demand_curves
+from services.demand_curves import DemandCurveStore
+
+pnrs = itertools.count()
+
+def add_bookings(db, flight, count, days_before, status=BookingStatus.CONFIRMED):
+    for _ in range(count):
+        db.add(Booking(pnr=f"T{next(pnrs):05d}", flight_id=flight.id,
+                       passenger_name="A", passenger_email="a@example.com", passenger_phone="1",
+                       seat_class=SeatClass.ECONOMY, price_paid=100.0, status=status,
+                       created_at=flight.departure_time - timedelta(days=days_before, hours=1)))
+
+def test_unbooked_buckets_are_shrunk_and_cancellations_ignored(db):
+    # A second route with a single flight next to the twelve seeded flights on 1 -> 2
+    outbound = db.get(Flight, 2)
+    departure = outbound.departure_time
+    inbound = Flight(flight_number="AI900", airline_id=1, departure_airport_id=2, arrival_airport_id=1,
+                     departure_time=departure, arrival_time=departure + timedelta(hours=2), duration_minutes=120,
+                     status=FlightStatus.SCHEDULED, base_price=5000, total_seats=200, available_seats=200)
+    db.add(inbound)
+    db.flush()
+    
+    add_bookings(db, outbound, 10, 5)
+    add_bookings(db, outbound, 6, 20)
+    add_bookings(db, inbound, 2, 5)
+    add_bookings(db, inbound, 3, 0, status=BookingStatus.CANCELLED)
+    db.commit()
+    
+    store = DemandCurveStore()
+    assert refit_demand_curves(db, store)["bookings"] == 18
+    curve = store.curve(inbound)
+    
+    # 3-7 days out: 12 bookings across 13 flights, two of them on the inbound flight
+    assert curve[5] == pytest.approx((2 + PRIOR) / (12 / 13 + PRIOR), abs=1e-4)
+    # 14-30 days out nobody booked inbound, so the bucket is shrunk below the network pace
+    assert curve[20] == pytest.approx(PRIOR / (6 / 13 + PRIOR), abs=1e-4)
+    assert curve[20] < 1
+    # Cancelled bookings do not count, and a bucket nobody booked anywhere stays neutral
+    assert curve[0] == pytest.approx(1.0)
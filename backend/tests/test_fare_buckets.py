@@ -0,0 +1,43 @@
+import pytest
+
+import config_sqlite
+import database
+from config_sqlite import SeatClass
+from services.fare_buckets import FareLadder, fare_bucket_store
+
+@pytest.fixture
+def admin_client(client):
+    """The admin router is wired to the MySQL session; point it at the test database instead"""
+    client.app.dependency_overrides[database.get_db] = config_sqlite.get_db
+    yield client
+    client.app.dependency_overrides.pop(database.get_db, None)
+
+def test_ladder_is_indexed_by_seats_sold():
+    # 10 seats: 2 in Q, 3 in M and the rest in Y, whose cap of 2 runs out before the cabin does
+    ladder = FareLadder(["Q", "M", "Y"], [2, 3, 2], [1.0, 1.2, 1.5], 10)
+    assert [ladder.open_bucket(available) for available in (10, 8, 5, 1, 0)] == [0, 1, 2, 2, None]
+    assert ladder.factor(9) == 1.0
+    assert ladder.factor(8) == 1.2
+    assert ladder.factor(0) == 1.5
+    assert ladder.factors(9, 3).tolist() == [1.0, 1.2, 1.2]
+    assert ladder.basis(9, 3) == "Q+M"
+
+@pytest.mark.parametrize("bucket", [
+    {"code": "Q", "seats": -1, "fare_multiplier": 1.0},
+    {"code": "Q", "seats": 10, "fare_multiplier": 0},
+    {"code": "Q", "seats": 10, "fare_multiplier": -1.5},
+    {"code": "Q-", "seats": 10, "fare_multiplier": 1.0},
+])
+def test_admin_rejects_invalid_buckets(admin_client, bucket):
+    response = admin_client.put("/api/admin/flights/2/fare-buckets/economy", json={"buckets": [bucket]})
+    assert response.status_code == 422
+
+def test_admin_replaces_buckets(admin_client, db):
+    buckets = [{"code": "Q", "seats": 0, "fare_multiplier": 0.9}, {"code": "Y", "seats": 120, "fare_multiplier": 1.4}]
+    response = admin_client.put("/api/admin/flights/2/fare-buckets/economy", json={"buckets": buckets})
+    assert response.status_code == 200, response.json()
+    
+    # An empty bucket is allowed and simply never opens
+    ladder = fare_bucket_store.ladder(2, SeatClass.ECONOMY, 120, [], db)
+    assert ladder.codes == ["Q", "Y"]
+    assert ladder.open_bucket(120) == 1
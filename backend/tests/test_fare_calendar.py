@@ -0,0 +1,44 @@
+from datetime import date, datetime, timedelta
+
+from config_sqlite import Flight, FlightStatus, SeatClass, SeatInventory
+from services.fare_calendar import FareCalendar
+
+def calendar_of(calendar: FareCalendar, db):
+    return calendar.get_calendar(1, 2, SeatClass.ECONOMY, date.today(), 7, db)
+
+def test_newly_stocked_flight_joins_a_cached_calendar(db):
+    calendar = FareCalendar()
+    before = calendar_of(calendar, db)
+    assert calendar_of(calendar, db)["cached"]
+    
+    departure = (datetime.utcnow() + timedelta(days=2)).replace(hour=23, minute=0, second=0, microsecond=0)
+    flight = Flight(flight_number="AI999", airline_id=1, departure_airport_id=1, arrival_airport_id=2,
+                    departure_time=departure, arrival_time=departure + timedelta(hours=2), duration_minutes=120,
+                    status=FlightStatus.SCHEDULED, base_price=100, total_seats=120, available_seats=120)
+    db.add(flight)
+    db.flush()
+    db.add(SeatInventory(flight_id=flight.id, seat_class=SeatClass.ECONOMY, total_seats=120, available_seats=120, booked_seats=0))
+    db.commit()
+    # What the admin inventory endpoint reports once the cabin is stocked
+    calendar.invalidate_flight(flight.id, SeatClass.ECONOMY)
+    
+    after = calendar_of(calendar, db)
+    assert not after["cached"]
+    day = next(entry for entry in after["days"] if entry["date"] == departure.date().isoformat())
+    assert day["flight_id"] == flight.id
+    assert sum(entry["flights"] for entry in after["days"]) == sum(entry["flights"] for entry in before["days"]) + 1
+
+def test_inventory_change_during_the_first_compute_is_not_cached(db):
+    calendar = FareCalendar()
+    compute_prices = calendar.pricing_engine.compute_prices
+    
+    def compute_while_booking(pairs, session):
+        # A booking lands on a window flight while the route is priced for the first time
+        calendar.invalidate_flight(pairs[0][0].id, SeatClass.ECONOMY)
+        return compute_prices(pairs, session)
+    
+    calendar.pricing_engine.compute_prices = compute_while_booking
+    assert not calendar_of(calendar, db)["cached"]
+    calendar.pricing_engine.compute_prices = compute_prices
+    assert not calendar_of(calendar, db)["cached"]
+    assert calendar_of(calendar, db)["cached"]
@@ -0,0 +1,70 @@
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from fastapi.testclient import TestClient
+
+from config_sqlite import Booking, SeatClass, SeatInventory
+from services.idempotency import IdempotencyMiddleware, IdempotencyStore, idempotency_store
+
+BOOKING = dict(flight_id=2, passenger_name="A", passenger_email="a@example.com", passenger_phone="1", seat_class="economy")
+
+def available(db):
+    db.expire_all()
+    return db.query(SeatInventory).filter_by(flight_id=2, seat_class=SeatClass.ECONOMY).one().available_seats
+
+def test_retry_replays_the_booking_without_booking_again(client, db):
+    replays = idempotency_store.stats()["replays"]
+    headers = {"Idempotency-Key": "replay", "Origin": "http://localhost:3000"}
+    first = client.post("/api/bookings/", json=BOOKING, headers=headers)
+    retry = client.post("/api/bookings/", json=BOOKING, headers=headers)
+    
+    assert first.status_code == retry.status_code == 200
+    assert first.json()["pnr"] == retry.json()["pnr"]
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert db.query(Booking).count() == 1
+    assert available(db) == 119
+    assert idempotency_store.stats()["replays"] == replays + 1
+
+def test_key_reused_for_another_request_is_rejected(client, db):
+    headers = {"Idempotency-Key": "reused", "Origin": "http://localhost:3000"}
+    client.post("/api/bookings/", json=BOOKING, headers=headers)
+    other = client.post("/api/bookings/", json=dict(BOOKING, passenger_name="B"), headers=headers)
+    assert other.status_code == 422
+    # CORS wraps the idempotency middleware, so a browser can read its own error responses
+    assert other.headers["access-control-allow-origin"]
+    assert db.query(Booking).count() == 1
+
+def test_keys_are_scoped_to_the_client(client, db):
+    first = client.post("/api/bookings/", json=BOOKING, headers={"Idempotency-Key": "shared", "Authorization": "Bearer one"})
+    second = client.post("/api/bookings/", json=BOOKING, headers={"Idempotency-Key": "shared", "Authorization": "Bearer two"})
+    assert first.status_code == second.status_code == 200
+    assert first.json()["pnr"] != second.json()["pnr"]
+    assert "idempotent-replayed" not in second.headers
+    assert db.query(Booking).count() == 2
+
+def test_request_in_progress_is_a_conflict():
+    store = IdempotencyStore(ttl=60, max_entries=10)
+    key, fingerprint = store.digest(b"key"), store.digest(b"body")
+    assert store.begin(key, fingerprint) is None
+    assert store.begin(key, fingerprint).in_progress
+    assert store.stats()["conflicts"] == 1
+    
+    store.complete(key, 200, [], b"{}")
+    assert store.begin(key, fingerprint).status == 200
+    assert store.begin(key, store.digest(b"other")).status == 200
+    assert store.stats() == {"size": 1, "replays": 1, "conflicts": 1}
+
+def test_server_errors_are_not_stored():
+    calls = []
+    
+    async def book(request):
+        calls.append(await request.body())
+        return JSONResponse({"call": len(calls)}, status_code=500 if len(calls) == 1 else 200)
+    
+    app = IdempotencyMiddleware(Starlette(routes=[Route("/api/bookings/", book, methods=["POST"])]), store=IdempotencyStore())
+    client = TestClient(app)
+    headers = {"Idempotency-Key": "flaky"}
+    assert client.post("/api/bookings/", content=b"{}", headers=headers).status_code == 500
+    assert client.post("/api/bookings/", content=b"{}", headers=headers).json() == {"call": 2}
+    assert client.post("/api/bookings/", content=b"{}", headers=headers).json() == {"call": 2}
+    assert calls == [b"{}", b"{}"]
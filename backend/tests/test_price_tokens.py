@@ -0,0 +1,131 @@
+import base64
+import hashlib
+import hmac
+import time
+
+import pytest
+
+from config import DEFAULT_SECRET_KEY
+from config_sqlite import Booking, PriceTokenClaim, SeatClass, SeatInventory
+from services.price_tokens import PriceTokenError, PriceTokenSigner, price_token_signer
+
+def quote(client, flight_id=2, seat_class="economy", passengers=1):
+    response = client.post("/api/pricing/calculate", json={"flight_id": flight_id, "seat_class": seat_class, "passengers": passengers})
+    assert response.status_code == 200
+    return response.json()
+
+def book(client, price_token, flight_id=2, seat_class="economy", **fields):
+    return client.post("/api/bookings/", json=dict(
+        flight_id=flight_id, seat_class=seat_class, passenger_name="A", passenger_email="a@example.com",
+        passenger_phone="1", price_token=price_token, **fields
+    ))
+
+def book_group(client, price_token, passengers, flight_id=2, seat_class="economy"):
+    return client.post("/api/bookings/group", json=dict(
+        flight_id=flight_id, seat_class=seat_class, price_token=price_token,
+        passengers=[dict(passenger_name=f"P{i}", passenger_email="g@example.com", passenger_phone="1") for i in range(passengers)]
+    ))
+
+def set_available(db, flight_id, seat_class, available_seats):
+    db.query(SeatInventory).filter_by(flight_id=flight_id, seat_class=seat_class).update({"available_seats": available_seats})
+    db.commit()
+
+def test_token_rejects_tampering_expiry_and_other_fares(client):
+    signer = PriceTokenSigner(secret="test", ttl=60)
+    token = quote(client)["price_token"]
+    
+    with pytest.raises(PriceTokenError, match="Invalid"):
+        signer.verify(token, 2, "economy")
+    
+    signer = price_token_signer
+    payload, signature = token.split(".")
+    with pytest.raises(PriceTokenError, match="Invalid"):
+        signer.verify(f"{payload[:-2]}AA.{signature}", 2, "economy")
+    with pytest.raises(PriceTokenError, match="Malformed"):
+        signer.verify("not-a-token", 2, "economy")
+    with pytest.raises(PriceTokenError, match="does not match"):
+        signer.verify(token, 3, "economy")
+    with pytest.raises(PriceTokenError, match="does not match"):
+        signer.verify(token, 2, "economy", passengers=2)
+    with pytest.raises(PriceTokenError, match="expired"):
+        signer.verify(token, 2, "economy", now=10 ** 12)
+
+def forge(secret: str, payload: str) -> str:
+    """A token signed the way the signer would with secret"""
+    key = hashlib.sha256(f"price-token:{secret}".encode()).digest()
+    encode = lambda data: base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+    return f"{encode(payload.encode())}.{encode(hmac.new(key, payload.encode(), hashlib.sha256).digest())}"
+
+def test_tokens_signed_with_the_default_key_are_rejected(client, db):
+    held = quote(client)
+    forged = forge(DEFAULT_SECRET_KEY, f"2|economy|1|1.00|1.00|1.00|{held['fare_basis']}|{int(time.time()) + 600}|0")
+    
+    with pytest.raises(PriceTokenError, match="Invalid"):
+        PriceTokenSigner(secret=DEFAULT_SECRET_KEY).verify(forged, 2, "economy")
+    assert book(client, forged).status_code == 400
+    assert db.query(Booking).count() == 0
+
+def test_booking_is_charged_the_held_price_once(client):
+    held = quote(client)
+    first = book(client, held["price_token"])
+    assert first.status_code == 200
+    assert first.json()["price_paid"] == held["current_price"]
+    
+    reused = book(client, held["price_token"])
+    assert reused.status_code == 400
+    assert "already been used" in reused.json()["detail"]
+
+def test_claims_are_stored_with_the_booking(client, db):
+    # The claim lives in the database, so another worker or a restart cannot book the hold again
+    held = quote(client)
+    assert book(client, held["price_token"]).status_code == 200
+    assert db.query(PriceTokenClaim).count() == 1
+    
+    # Expired claims are purged by the next claim
+    db.query(PriceTokenClaim).update({"expires_at": 0})
+    db.commit()
+    assert book(client, quote(client)["price_token"]).status_code == 200
+    db.expire_all()
+    assert db.query(PriceTokenClaim).count() == 1
+
+def test_failed_booking_gives_the_hold_back(client, db):
+    assert book(client, None, seat_number="10A").status_code == 200
+    held = quote(client)
+    
+    taken = book(client, held["price_token"], seat_number="10A")
+    assert taken.status_code == 400
+    assert db.query(PriceTokenClaim).count() == 0
+    retry = book(client, held["price_token"], seat_number="10B")
+    assert retry.status_code == 200, retry.json()
+
+def test_hold_is_rejected_once_its_fare_bucket_sells_out(client, db):
+    held = quote(client)
+    assert held["fare_basis"]
+    
+    # Half the economy cabin sells, which closes the cheapest bucket
+    set_available(db, 2, SeatClass.ECONOMY, 60)
+    response = book(client, held["price_token"])
+    assert response.status_code == 400
+    assert "no longer available" in response.json()["detail"]
+
+def test_group_pays_the_quoted_price_of_each_seat(client, db):
+    # With 59 of 120 seats sold the party of three spans the first two fare buckets
+    set_available(db, 2, SeatClass.ECONOMY, 61)
+    held = quote(client, passengers=3)
+    assert held["fare_basis"].count("+") == 1
+    assert held["seat_prices"][0] < held["seat_prices"][1] == held["seat_prices"][2]
+    
+    response = book_group(client, held["price_token"], 3)
+    assert response.status_code == 200
+    group = response.json()
+    assert [booking["price_paid"] for booking in group["bookings"]] == held["seat_prices"]
+    assert group["total_price"] == held["total_price"]
+    
+    assert book_group(client, held["price_token"], 3).status_code == 400
+
+def test_identical_quotes_get_distinct_holds(client):
+    first, second = quote(client), quote(client)
+    assert first["current_price"] == second["current_price"]
+    assert first["price_token"] != second["price_token"]
+    assert book(client, first["price_token"]).status_code == 200
+    assert book(client, second["price_token"]).status_code == 200
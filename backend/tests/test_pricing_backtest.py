@@ -0,0 +1,44 @@
+import csv
+from datetime import timedelta
+
+import pytest
+
+from config_sqlite import Booking, BookingStatus, DemandCurve, Flight, PricingHistory, SeatClass
+from services.demand_curves import demand_curve_store
+from services.pricing_backtest import _replay_partition
+from services.pricing_engine import PricingEngine
+
+def add_booking(db, flight, pnr, booked_at, price_paid, status=BookingStatus.CONFIRMED):
+    db.add(Booking(pnr=pnr, flight_id=flight.id, passenger_name="A", passenger_email="a@example.com",
+                   passenger_phone="1", seat_class=SeatClass.ECONOMY, price_paid=price_paid, status=status,
+                   created_at=booked_at))
+
+def test_fitted_curve_is_not_rescaled_as_noise_and_cancellations_are_skipped(db, tmp_path):
+    # A fitted route curve well away from 1 for every bucket
+    for days in demand_curve_store.bucket_starts:
+        db.add(DemandCurve(departure_airport_id=1, arrival_airport_id=2, days_until_departure=int(days),
+                           demand_factor=1.5, bookings=10))
+    db.commit()
+    demand_curve_store.load()
+    
+    flight = db.get(Flight, 2)
+    booked_at = flight.departure_time - timedelta(days=1, hours=3)
+    baseline = PricingEngine()
+    recorded = baseline.calculate_demand_factor(flight, SeatClass.ECONOMY, now=booked_at)
+    db.add(PricingHistory(flight_id=flight.id, seat_class=SeatClass.ECONOMY, price=1000.0, demand_factor=recorded,
+                          time_factor=1.0, seat_availability_factor=1.0, calculated_at=booked_at - timedelta(minutes=1)))
+    add_booking(db, flight, "BT0001", booked_at, 1000.0)
+    add_booking(db, flight, "BT0002", booked_at + timedelta(minutes=5), 1000.0, status=BookingStatus.CANCELLED)
+    db.commit()
+    
+    wider = 2 * baseline.demand_fluctuation_range
+    summary = _replay_partition(0, [flight.id], {"demand_fluctuation_range": wider}, str(tmp_path))
+    assert summary["bookings"] == 1
+    
+    # Only the drawn deviation is widened; the curve's 1.5 stays out of it
+    departure = flight.departure_time
+    noise = recorded / (baseline.demand_table[departure.weekday(), departure.hour] * 1.5)
+    with open(summary["path"]) as part:
+        rows = list(csv.DictReader(part))
+    assert len(rows) == 1
+    assert float(rows[0]["alternative_price"]) == pytest.approx(1000.0 * (1 + 2 * (noise - 1)) / noise, abs=0.01)
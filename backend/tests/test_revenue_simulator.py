@@ -0,0 +1,30 @@
+import numpy as np
+
+from services.revenue_simulator import RevenueSimulator, _simulate_chunk
+
+def params(**overrides):
+    """Minimal simulation inputs for a 10-seat cabin over a 5-day horizon"""
+    return {
+        "horizon_days": 5, "total_seats": 10, "available_seats": 10, "reference_price": 1000.0,
+        "base_demand": 1.0, "demand_curve": np.ones(1), "demand_fluctuation_range": 0.3,
+        "time_factor_ladder": [(3, 1.2)], "early_booking_factor": 1.0, "seat_factors": np.ones(11),
+        "daily_rates": np.full(6, 4.0), "conversion_rate": 0.5, "price_elasticity": 1.2, **overrides
+    }
+
+def test_zero_prices_are_clipped_instead_of_dividing_by_zero():
+    with np.errstate(divide="raise", invalid="raise"):
+        revenue, seats_sold = _simulate_chunk(params(base_demand=0.0), 50, seed=1)
+    assert np.isfinite(revenue).all()
+    assert (seats_sold <= 10).all()
+
+def test_shared_pool_does_not_fork_the_server():
+    simulator = RevenueSimulator(max_workers=2, runs_per_worker=10)
+    simulator.start()
+    try:
+        assert simulator._pool._mp_context.get_start_method() in ("forkserver", "spawn")
+        revenue, seats_sold = simulator.run(params(), 40, seed=7)
+        again, _ = simulator.run(params(), 40, seed=7)
+    finally:
+        simulator.stop()
+    assert len(revenue) == len(seats_sold) == 40
+    assert np.array_equal(revenue, again)
@@ -0,0 +1,84 @@
+import numpy as np
+
+from config_sqlite import SeatClass
+from models import BookingCreate, GroupBookingCreate, GroupPassenger
+from services.booking_service import BookingService
+from services.seat_maps import CABIN_LAYOUTS, CabinLayout, seat_map_store
+
+def booking(seat_class="business", **fields) -> BookingCreate:
+    return BookingCreate(flight_id=2, passenger_name="A", passenger_email="a@example.com",
+                         passenger_phone="1", seat_class=seat_class, **fields)
+
+def taken(layout: CabinLayout, *seat_numbers: str) -> np.ndarray:
+    occupied = np.zeros(layout.total_seats, dtype=bool)
+    occupied[[layout.seat_index(seat_number) for seat_number in seat_numbers]] = True
+    return occupied
+
+def seat_numbers(layout: CabinLayout, indices) -> list:
+    return [layout.seat_number(index) for index in indices]
+
+def test_groups_sit_together_without_crossing_the_aisle():
+    layout = CabinLayout(CABIN_LAYOUTS[SeatClass.ECONOMY], 120)
+    occupied = taken(layout, "1A", "1E")
+    
+    # 1B-1C is the first free pair in one block; three together only fit from row 2
+    assert seat_numbers(layout, layout.find_seats(occupied, 2)) == ["1B", "1C"]
+    assert seat_numbers(layout, layout.find_seats(occupied, 3)) == ["2A", "2B", "2C"]
+    # Wider than a block, a party keeps to one row across the aisle
+    assert seat_numbers(layout, layout.find_seats(occupied, 4)) == ["2A", "2B", "2C", "2D"]
+
+def test_scattered_cabin_still_seats_the_whole_group():
+    layout = CabinLayout(CABIN_LAYOUTS[SeatClass.FIRST], 4)
+    occupied = taken(layout, "1B", "2A")
+    assert seat_numbers(layout, layout.find_seats(occupied, 2)) == ["1A", "2B"]
+
+def test_group_booking_gets_adjacent_seats(db):
+    passengers = [GroupPassenger(passenger_name=f"P{i}", passenger_email="g@example.com", passenger_phone="1")
+                  for i in range(3)]
+    BookingService().create_booking(booking(seat_class="economy", seat_number="1B"), db)
+    group = BookingService().create_group_booking(
+        GroupBookingCreate(flight_id=2, seat_class="economy", passengers=passengers), db
+    )
+    assert [seat.seat_number for seat in group.bookings] == ["1D", "1E", "1F"]
+
+def test_window_and_aisle_preferences(db):
+    # Business seats are AB CD: A and D by the windows, B and C on the aisle
+    service = BookingService()
+    assert service.create_booking(booking(seat_preference="aisle"), db).seat_number == "1B"
+    assert service.create_booking(booking(seat_preference="window"), db).seat_number == "1A"
+    assert service.create_booking(booking(seat_preference="aisle"), db).seat_number == "1C"
+    assert service.create_booking(booking(seat_preference="window"), db).seat_number == "1D"
+    # Without a preference the first free seat is taken
+    assert service.create_booking(booking(), db).seat_number == "2A"
+
+def test_lost_compare_and_set_is_retried_by_the_transaction(db, monkeypatch):
+    # The first two writes lose to another booking, so allocate gives up and the booking transaction retries
+    write = seat_map_store._write
+    losses = []
+    def contended(*args):
+        if len(losses) < 2:
+            losses.append(1)
+            return False
+        return write(*args)
+    monkeypatch.setattr(seat_map_store, "_write", contended)
+    monkeypatch.setattr("services.transactions.time.sleep", lambda seconds: None)
+    
+    confirmation = BookingService().create_booking(booking(), db)
+    assert confirmation.seat_number == "1A"
+    assert len(losses) == 2
+    seat_map = seat_map_store.describe(2, SeatClass.BUSINESS, db)
+    assert seat_map["free_seats"] == 29
+
+def test_cancelled_seat_is_freed(db, client):
+    service = BookingService()
+    pnr = service.create_booking(booking(seat_number="3C"), db).pnr
+    
+    seat_map = client.get("/api/flights/2/seat-map/business").json()
+    assert seat_map["free_seats"] == 29
+    assert next(seat for seat in seat_map["seats"] if seat["seat_number"] == "3C")["occupied"]
+    
+    assert service.cancel_booking(pnr, db)
+    seat_map = client.get("/api/flights/2/seat-map/business").json()
+    assert seat_map["free_seats"] == 30
+    assert not next(seat for seat in seat_map["seats"] if seat["seat_number"] == "3C")["occupied"]
+    assert service.create_booking(booking(seat_number="3C"), db).seat_number == "3C"
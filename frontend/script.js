@@ -1,6 +1,10 @@
 // API Configuration
 const API_BASE_URL = 'http://localhost:8000/api';
 
+// Booking retries after a network error, 409 or server error, with the same Idempotency-Key
+const BOOKING_RETRIES = 2;
+const BOOKING_RETRY_DELAY_MS = 500;
+
 // Global variables
 let currentFlights = [];
 let selectedFlight = null;
@@ -11,6 +15,7 @@ let paymentMethods = [];
 let banks = [];
 let currentBooking = null;
 let currentPayment = null;
+let pendingBooking = null; // { body, key } of the booking attempt not yet confirmed or rejected
 
 // Initialize the application
 document.addEventListener('DOMContentLoaded', function() {
@@ -158,7 +163,8 @@ async function handleSearch(event) {
         departure_date: document.getElementById('departureDate').value,
         return_date: document.getElementById('returnDate').value || null,
         passengers: parseInt(document.getElementById('passengers').value),
-        seat_class: document.getElementById('seatClass').value || null
+        seat_class: document.getElementById('seatClass').value || null,
+        include_prices: true
     };
     
     if (searchParams.departure_airport === searchParams.arrival_airport) {
@@ -200,26 +206,50 @@ async function displayFlights(flights) {
     const resultsContainer = document.getElementById('flightResults');
     resultsContainer.innerHTML = '';
     
+    // Search results normally embed prices; otherwise get economy prices in one request
+    const unpriced = flights.filter(flight => !flight.pricing);
+    const pricingByFlight = await fetchBatchPricing(unpriced, 'economy');
+    
     for (const flight of flights) {
-        const flightCard = await createFlightCard(flight);
+        const flightCard = createFlightCard(flight, flight.pricing || pricingByFlight[flight.id]);
         resultsContainer.appendChild(flightCard);
     }
 }
 
-// Create flight card
-async function createFlightCard(flight) {
-    const card = document.createElement('div');
-    card.className = 'flight-card fade-in';
+// Fetch prices for a list of flights, keyed by flight id
+async function fetchBatchPricing(flights, seatClass) {
+    const pricingByFlight = {};
+    if (flights.length === 0) return pricingByFlight;
     
-    // Get pricing for economy class (default)
-    let pricing = null;
     try {
-        const pricingResponse = await fetch(`${API_BASE_URL}/pricing/flight/${flight.id}/class/economy`);
-        pricing = await pricingResponse.json();
+        const response = await fetch(`${API_BASE_URL}/pricing/batch`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                items: flights.map(flight => ({ flight_id: flight.id, seat_class: seatClass }))
+            })
+        });
+        
+        if (response.ok) {
+            const data = await response.json();
+            data.prices.forEach(pricing => {
+                pricingByFlight[pricing.flight_id] = pricing;
+            });
+        }
     } catch (error) {
         console.error('Error fetching pricing:', error);
     }
     
+    return pricingByFlight;
+}
+
+// Create flight card
+function createFlightCard(flight, pricing = null) {
+    const card = document.createElement('div');
+    card.className = 'flight-card fade-in';
+    
     const departureTime = new Date(flight.departure_time).toLocaleTimeString('en-US', { 
         hour: '2-digit', 
         minute: '2-digit',
@@ -326,6 +356,31 @@ function updatePriceDetails() {
     `;
 }
 
+// POST a booking, retrying with the same key while the outcome is unknown or the first request is still running
+async function postBooking(body, idempotencyKey) {
+    for (let attempt = 0; ; attempt++) {
+        try {
+            const response = await fetch(`${API_BASE_URL}/bookings/`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Idempotency-Key': idempotencyKey,
+                },
+                body
+            });
+            if ((response.status !== 409 && response.status < 500) || attempt >= BOOKING_RETRIES) {
+                return response;
+            }
+        } catch (error) {
+            // The request may have reached the server, so it is only ever retried under the same key
+            if (attempt >= BOOKING_RETRIES) {
+                throw error;
+            }
+        }
+        await new Promise(resolve => setTimeout(resolve, BOOKING_RETRY_DELAY_MS * 2 ** attempt));
+    }
+}
+
 // Handle booking submission
 async function handleBooking(event) {
     event.preventDefault();
@@ -344,16 +399,26 @@ async function handleBooking(event) {
         seat_class: document.getElementById('selectedSeatClass').value
     };
     
+    // Book at the quoted price while the hold is valid for the selected class
+    if (currentPricing.price_token && currentPricing.seat_class === bookingData.seat_class) {
+        bookingData.price_token = currentPricing.price_token;
+    }
+    
+    // One key per booking attempt: resubmitting the same booking reuses it, so a retry cannot book twice
+    const body = JSON.stringify(bookingData);
+    if (!pendingBooking || pendingBooking.body !== body) {
+        pendingBooking = { body, key: crypto.randomUUID() };
+    }
+    
     showLoading(true);
     
     try {
-        const response = await fetch(`${API_BASE_URL}/bookings/`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify(bookingData)
-        });
+        const response = await postBooking(body, pendingBooking.key);
+        
+        // A confirmation or a final rejection settles the attempt; after a 409 or server error the key is kept
+        if (response.ok || (response.status !== 409 && response.status < 500)) {
+            pendingBooking = null;
+        }
         
         if (response.ok) {
             const confirmation = await response.json();
@@ -785,6 +850,7 @@ async function handlePayment(event) {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                'Idempotency-Key': `process-${paymentInit.payment_id}`,
             },
             body: JSON.stringify(processData)
         });